@@ -0,0 +1,201 @@
+"""写请求准入控制
+
+SQLite 同一时间只有一个写入者。几个卡住的客户端连续点击完成状态，每次点击都是一次提交，
+就足以让写锁一直被占用，其他人的页面随之卡住。这里在请求进入业务代码之前做三件事：
+
+- TokenBuckets：按用户和按 IP 的令牌桶限流，超出时返回 429，由 Retry-After 告诉客户端何时重试；
+- Coalescer：同一成员的状态在短时间内被反复切换时，第一次立即执行，之后的请求等到窗口结束，
+  只执行其中最后一个，其余直接返回；
+- WriterSlots：限制同时执行的写请求数，名额用完时最多等待一小段时间，仍然没有名额就返回 503，
+  不会让请求无限排队占满工作线程。
+
+三者的状态都放在 instance 目录下的文件中，所有工作进程共享，不需要 Redis 之类的外部服务。
+令牌桶和合并窗口是 mmap 映射的定长哈希表，读写时加文件锁；写入名额是同一个文件上的
+字节范围锁，持有名额的进程退出时由操作系统自动释放，不会因为进程崩溃而泄漏。
+"""
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows 下没有 fcntl，状态只在进程内共享
+    fcntl = None
+
+# 每个键最多检查这么多个相邻的槽位，找不到时复用其中最久未使用的
+_PROBES = 8
+
+
+def _hash(key):
+    # 0 表示空槽位
+    return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'little') or 1
+
+
+class _SlotTable:
+    """定长记录组成的共享哈希表，每条记录以 (键哈希, ..., 最后使用时间) 开头和结尾
+
+    槽位不够时淘汰最久未使用的记录：限流和合并的状态过一段时间本来就会失效，被淘汰只是
+    让这个键从头开始计算。
+    """
+
+    def __init__(self, path, record_format, slots):
+        self.path = path
+        self.slots = slots
+        self._record = struct.Struct(record_format)
+        size = self._record.size * slots
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        self._thread_lock = threading.Lock()
+        with self._locked():
+            if os.fstat(self._fd).st_size != size:
+                os.ftruncate(self._fd, 0)
+                os.ftruncate(self._fd, size)
+        self._map = mmap.mmap(self._fd, size)
+
+    @contextmanager
+    def _locked(self):
+        # lockf 只在进程之间互斥，同一进程的线程之间还需要线程锁
+        with self._thread_lock:
+            if fcntl is not None:
+                fcntl.lockf(self._fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.lockf(self._fd, fcntl.LOCK_UN)
+
+    def _find(self, key):
+        """返回 (槽位号, 记录)，键不在表中时返回可以使用的槽位和 None（调用时持有锁）"""
+        key_hash = _hash(key)
+        start = key_hash % self.slots
+        victim = None
+        for i in range(_PROBES):
+            index = (start + i) % self.slots
+            record = self._record.unpack_from(self._map, index * self._record.size)
+            if record[0] == key_hash:
+                return index, record
+            if record[0] == 0:
+                return index, None
+            if victim is None or record[-1] < victim[1]:
+                victim = (index, record[-1])
+        return victim[0], None
+
+    def _store(self, index, *values):
+        self._record.pack_into(self._map, index * self._record.size, *values)
+
+    def close(self):
+        self._map.close()
+        os.close(self._fd)
+
+
+class TokenBuckets(_SlotTable):
+    """令牌桶：每个键每秒补充 rate 个令牌，最多存 burst 个，每个请求消耗一个"""
+
+    def __init__(self, path, slots=4096):
+        super().__init__(path, '<Qdd', slots)  # 键哈希, 剩余令牌, 上次更新时间
+
+    def take(self, key, rate, burst):
+        """消耗一个令牌；成功时返回 0，否则返回需要等待的秒数"""
+        now = time.time()
+        with self._locked():
+            index, record = self._find(key)
+            if record is None:
+                tokens = burst
+            else:
+                tokens = min(burst, record[1] + max(0.0, now - record[2]) * rate)
+            if tokens < 1:
+                self._store(index, _hash(key), tokens, now)
+                return (1 - tokens) / rate
+            self._store(index, _hash(key), tokens - 1, now)
+            return 0
+
+
+class Coalescer(_SlotTable):
+    """合并同一个键在 window 秒内的重复请求
+
+    请求到达时序号加一：距离这个键上一次执行已超过 window 秒时立即执行；否则等到窗口结束，
+    如果期间有更新的请求到达（序号变了），说明本次请求已被覆盖，不再执行。连续点击时
+    每个窗口最多执行两次：第一次点击和窗口内的最后一次点击。
+    """
+
+    def __init__(self, path, window, slots=4096):
+        super().__init__(path, '<QQdd', slots)  # 键哈希, 序号, 上次执行时间, 最后使用时间
+        self.window = window
+
+    def admit(self, key):
+        """返回本次请求是否应该执行；需要等待时在这里阻塞"""
+        key_hash = _hash(key)
+        now = time.time()
+        with self._locked():
+            index, record = self._find(key)
+            seq, last_run = (record[1], record[2]) if record is not None else (0, 0.0)
+            seq += 1
+            delay = last_run + self.window - now
+            if delay <= 0:
+                self._store(index, key_hash, seq, now, now)
+                return True
+            self._store(index, key_hash, seq, last_run, now)
+
+        time.sleep(delay)
+        now = time.time()
+        with self._locked():
+            index, record = self._find(key)
+            # 记录被淘汰时无法判断，按未被覆盖处理
+            if record is not None and record[1] != seq:
+                return False
+            self._store(index, key_hash, seq, now, now)
+            return True
+
+
+class WriterSlots:
+    """所有进程共享的写入名额：文件中的第 i 个字节代表第 i 个名额，持有名额即锁住该字节"""
+
+    def __init__(self, path, count):
+        self.path = path
+        self.count = count
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        self._held = set()  # 本进程中已被线程占用的名额，POSIX 记录锁不区分同一进程的线程
+        self._lock = threading.Lock()
+
+    def _try_acquire(self):
+        with self._lock:
+            for slot in range(self.count):
+                if slot in self._held:
+                    continue
+                if fcntl is not None:
+                    try:
+                        fcntl.lockf(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB, 1, slot)
+                    except OSError:
+                        continue
+                self._held.add(slot)
+                return slot
+        return None
+
+    def acquire(self, timeout):
+        """取得一个名额并返回名额号，timeout 秒内没有空闲名额时返回 None"""
+        deadline = time.monotonic() + timeout
+        delay = 0.002
+        while True:
+            slot = self._try_acquire()
+            if slot is not None or time.monotonic() >= deadline:
+                return slot
+            time.sleep(delay)
+            delay = min(delay * 2, 0.05)
+
+    def release(self, slot):
+        with self._lock:
+            if fcntl is not None:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, slot)
+            self._held.discard(slot)
+
+    @property
+    def in_use(self):
+        """本进程当前占用的名额数"""
+        with self._lock:
+            return len(self._held)
+
+    def close(self):
+        os.close(self._fd)
@@ -1,31 +1,194 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, flash
+from flask import Flask, Blueprint, Response, current_app, session, render_template, request, jsonify, redirect, url_for, flash
+from flask import g, has_app_context, has_request_context, before_render_template, template_rendered, stream_with_context
+from flask.sessions import SecureCookieSessionInterface
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session as SQLAlchemySession
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
-from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime
+from werkzeug.security import generate_password_hash, check_password_hash, safe_join
+from datetime import datetime, timedelta
 import os
 from flask_wtf.csrf import CSRFProtect
 import random
-from functools import wraps
-from flask import abort
-from werkzeug.utils import secure_filename
-
-app = Flask(__name__)
-app.config['SECRET_KEY'] = 'your-secret-key'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///homework.db'
-app.config['WTF_CSRF_CHECK_DEFAULT'] = False
-csrf = CSRFProtect(app)
-db = SQLAlchemy(app)
-login_manager = LoginManager(app)
-login_manager.login_view = 'login'
+import secrets
+import sqlite3
+import heapq
+import csv
+import io
+import time
+import hmac
+import json
+import queue
+import gzip
+import hashlib
+import itertools
+import tempfile
+import threading
+import click
+import math
+import mimetypes
+from functools import partial, wraps
+from types import SimpleNamespace
+from contextlib import contextmanager
+from flask import abort, send_from_directory
+from sqlalchemy import create_engine, event, func, case, insert, update, or_, tuple_, select, true
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import selectinload, joinedload
+from jinja2 import FileSystemBytecodeCache
+from events import EventBroadcaster, TooManyClients, format_sse
+from board_version import BoardVersion
+from cache import BoardCache
+from fragments import FragmentCacheExtension
+import assets
+import migrations
+from uploads import ImageStore
+from metrics import Metrics
+import task_content
+import exports
+from archive import ArchiveStore
+from backup import BackupStore, BackupError
+from jobs import JobRunner, JobCancelled, JobLost
+from admission import TokenBuckets, Coalescer, WriterSlots
+from shards import ShardRouter, ShardMiddleware, Shard, ShardClosed, ENVIRON_KEY, valid_slug
+
+try:
+    import fcntl
+except ImportError:  # Windows 下没有 fcntl，init_db 不加进程锁
+    fcntl = None
+
+class ShardSession(SQLAlchemySession):
+    """数据库会话：班级路径下的请求、任务和命令使用该班级的数据库（见 shards.py）"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_app_context() and 'shards' in current_app.extensions:
+            shard = current_shard()
+            if shard.slug is not None:
+                return shard.engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+csrf = CSRFProtect()
+db = SQLAlchemy(session_options={'class_': ShardSession})
+login_manager = LoginManager()
+login_manager.login_view = 'main.login'
+bp = Blueprint('main', __name__, cli_group=None)
 
 # 配置上传文件的存储路径
 UPLOAD_FOLDER = 'static/uploads'
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'webp', 'tiff'}
 
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 限制上传文件大小为16MB
-app.config['BABEL_DEFAULT_LOCALE'] = 'zh_CN'  # 设置默认语言为简体中文
+# 默认配置，可通过环境变量或 create_app(config) 覆盖
+DEFAULT_CONFIG = {
+    'SECRET_KEY': os.environ.get('SECRET_KEY', 'your-secret-key'),
+    'SQLALCHEMY_DATABASE_URI': os.environ.get('DATABASE_URL', 'sqlite:///homework.db'),
+    'SQLALCHEMY_ENGINE_OPTIONS': {
+        # 每个工作进程的连接池大小，线程数较多时适当调大
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 10)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+        'pool_timeout': 30,
+        'pool_pre_ping': True,
+        'connect_args': {'timeout': 30, 'check_same_thread': False},
+    },
+    # SQLite 遇到写锁时的等待时间（毫秒）
+    'SQLITE_BUSY_TIMEOUT': int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000)),
+    'WTF_CSRF_CHECK_DEFAULT': False,
+    'UPLOAD_FOLDER': UPLOAD_FOLDER,
+    'MAX_CONTENT_LENGTH': 16 * 1024 * 1024,  # 限制上传文件大小为16MB
+    'BABEL_DEFAULT_LOCALE': 'zh_CN',  # 设置默认语言为简体中文
+    # 看板实时推送：轮询事件表的间隔、每个连接的队列长度、每个进程的最大连接数
+    'EVENTS_POLL_INTERVAL': 0.5,
+    'EVENTS_QUEUE_SIZE': 100,
+    'EVENTS_MAX_CLIENTS': int(os.environ.get('EVENTS_MAX_CLIENTS', 100)),
+    'EVENTS_HEARTBEAT': 15,
+    'EVENTS_RETENTION': 3600,  # 事件表只保留最近一小时
+    'BOARD_GZIP_MIN_SIZE': 1024,  # /api/board 响应超过该字节数时启用 gzip
+    # 进程内看板缓存：条目过期时间（秒）和最大条目数
+    'BOARD_CACHE_TTL': int(os.environ.get('BOARD_CACHE_TTL', 60)),
+    'BOARD_CACHE_MAX_ENTRIES': int(os.environ.get('BOARD_CACHE_MAX_ENTRIES', 128)),
+    # 渲染好的小组卡片（见 fragments.py）：条目按小组版本号失效，过期时间只用于回收不再访问的条目
+    'FRAGMENT_CACHE_TTL': int(os.environ.get('FRAGMENT_CACHE_TTL', 3600)),
+    'FRAGMENT_CACHE_MAX_ENTRIES': int(os.environ.get('FRAGMENT_CACHE_MAX_ENTRIES', 4096)),
+    # 编译后的模板保存在 instance/jinja-cache，新启动的工作进程不必重新编译模板
+    'TEMPLATE_BYTECODE_CACHE': os.environ.get('TEMPLATE_BYTECODE_CACHE', '1') == '1',
+    # 上传图片的缩略图宽度和生成缩略图的线程数
+    'UPLOAD_VARIANT_WIDTHS': (480, 960, 1600),
+    'UPLOAD_WORKERS': int(os.environ.get('UPLOAD_WORKERS', 2)),
+    # 使用 python assets.py 构建的带哈希静态文件（本地调试时直接使用原文件，修改后立即生效）
+    'ASSETS_FINGERPRINT': os.environ.get('FLASK_DEBUG') != '1',
+    'ASSETS_MAX_AGE': 365 * 24 * 3600,
+    # 登录用户身份缓存：过期时间（秒）和最大用户数
+    'USER_CACHE_TTL': int(os.environ.get('USER_CACHE_TTL', 300)),
+    'USER_CACHE_MAX_ENTRIES': int(os.environ.get('USER_CACHE_MAX_ENTRIES', 2048)),
+    # 每个进程同时计算密码哈希的线程数，以及排队等待的最长时间（秒）
+    'PASSWORD_HASH_CONCURRENCY': int(os.environ.get('PASSWORD_HASH_CONCURRENCY', 2)),
+    'PASSWORD_HASH_WAIT': 5,
+    # 请求指标：/metrics 和 Server-Timing 响应头；多进程共享的快照目录默认为 instance/metrics
+    'METRICS_ENABLED': os.environ.get('METRICS_ENABLED', '1') == '1',
+    'METRICS_DIR': os.environ.get('METRICS_DIR'),
+    # 设置后 Prometheus 可以用 Authorization: Bearer <令牌> 抓取 /metrics，不必登录管理员账号
+    'METRICS_TOKEN': os.environ.get('METRICS_TOKEN'),
+    'SERVER_TIMING': True,
+    # 后台任务（见 jobs.py）：每个进程执行任务的线程数（0 表示本进程不执行任务）、空闲时领取任务的间隔、
+    # 心跳间隔；心跳超过 JOB_STALE_AFTER 秒未更新的任务视为执行它的进程已退出。已结束的任务保留 JOB_RETENTION 秒
+    'JOB_WORKERS': int(os.environ.get('JOB_WORKERS', 1)),
+    'JOB_POLL_INTERVAL': 1.0,
+    'JOB_HEARTBEAT_INTERVAL': 10,
+    'JOB_STALE_AFTER': 60,
+    'JOB_MAX_ATTEMPTS': 3,
+    'JOB_RETENTION': 7 * 24 * 3600,
+    # 班级分片（见 shards.py）：班级数据库所在目录（默认为 instance/classes）、每个进程同时打开的班级数据库数上限，
+    # 以及空闲多少秒后关闭
+    'SHARD_DIR': os.environ.get('SHARD_DIR'),
+    'SHARD_MAX_OPEN': int(os.environ.get('SHARD_MAX_OPEN', 64)),
+    'SHARD_IDLE_TIMEOUT': int(os.environ.get('SHARD_IDLE_TIMEOUT', 600)),
+    # 写请求准入控制（见 admission.py）：修改数据的 /api/ 请求按用户、按 IP 限流（每秒补充的请求数和最多可以
+    # 连续发出的请求数，0 表示不限），同一成员的状态切换在 STATUS_COALESCE_WINDOW 秒内合并；每个班级所有进程
+    # 合计最多同时执行 WRITE_CONCURRENCY 个写请求，排队超过 WRITE_QUEUE_WAIT 秒返回 503
+    'RATE_LIMIT_USER_RATE': float(os.environ.get('RATE_LIMIT_USER_RATE', 5)),
+    'RATE_LIMIT_USER_BURST': int(os.environ.get('RATE_LIMIT_USER_BURST', 20)),
+    'RATE_LIMIT_IP_RATE': float(os.environ.get('RATE_LIMIT_IP_RATE', 50)),
+    'RATE_LIMIT_IP_BURST': int(os.environ.get('RATE_LIMIT_IP_BURST', 200)),
+    'STATUS_COALESCE_WINDOW': float(os.environ.get('STATUS_COALESCE_WINDOW', 0.3)),
+    'WRITE_CONCURRENCY': int(os.environ.get('WRITE_CONCURRENCY', 8)),
+    'WRITE_QUEUE_WAIT': 5,
+    # 在线备份（见 backup.py）：备份目录（默认为 instance/backups）、保留份数、自动备份的间隔（秒，0 表示只手动备份），
+    # 以及每一步复制的页数和两步之间暂停的秒数
+    'BACKUP_DIR': os.environ.get('BACKUP_DIR'),
+    'BACKUP_KEEP': int(os.environ.get('BACKUP_KEEP', 7)),
+    'BACKUP_INTERVAL': int(os.environ.get('BACKUP_INTERVAL', 24 * 3600)),
+    'BACKUP_PAGES': 256,
+    'BACKUP_PAUSE': 0.01,
+}
+
+# 新建普通小组的默认人数上限，每个小组的上限保存在 Group.capacity（未分组为空，不受限制）
+MAX_GROUP_MEMBERS = 5
+
+# /api/members/batch 单次请求的最大操作条数
+MAX_BATCH_OPERATIONS = 500
+
+# 管理面板首屏渲染的作业数和小组数，其余在滚动时通过 /api/tasks、/api/groups 分页加载
+ADMIN_TASK_PAGE_SIZE = 20
+ADMIN_GROUP_PAGE_SIZE = 24
+MAX_PAGE_SIZE = 100
+
+# 需要经过准入控制（限流、写入名额）的请求方法
+WRITE_METHODS = {'POST', 'PUT', 'PATCH', 'DELETE'}
+
+# publish_event 记录的修改涉及所有小组（导入、自动分组等批量操作）
+ALL_GROUPS = object()
+
+# 导出时每次从数据库游标读取的行数
+EXPORT_BATCH_SIZE = 1000
+
+# 归档、恢复学期时每批处理的作业数，每批单独提交，不会长时间占用写锁
+ARCHIVE_BATCH_SIZE = 50
+
+# 批量导入时每批处理的姓名数，控制 IN (...) 查询的参数个数
+IMPORT_BATCH_SIZE = 500
+# 导入任务结果中最多保留的错误信息条数（错误总数另外记录）
+IMPORT_MAX_ERRORS = 200
+IMPORT_HEADER_NAMES = {'name', 'username', '姓名', '用户名'}
+# 导入/添加的新用户初始密码为用户名，哈希推迟到首次登录时再计算
+PENDING_PASSWORD_HASH = '!pending'
 
 def allowed_file(filename):
     return '.' in filename and \
@@ -41,26 +204,260 @@ class User(UserMixin, db.Model):
 class Task(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
-    content = db.Column(db.Text, nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    content = db.Column(db.Text, nullable=False)  # 编辑器提交的原始 HTML，仅用于再次编辑
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     deadline = db.Column(db.DateTime)
+    # 保存时生成（见 render_task_content）：清理后的 HTML、纯文本摘要、原始内容的哈希
+    content_html = db.Column(db.Text)
+    excerpt = db.Column(db.String(200))
+    content_hash = db.Column(db.String(64))
+
+def render_task_content(mapper, connection, task):
+    """保存作业前清理内容并生成摘要，原始内容未变时跳过"""
+    if task.content_html is not None and task.content_hash == task_content.content_hash(task.content):
+        return
+    task.content_html, task.excerpt, task.content_hash = task_content.render(
+        task.content, current_app.extensions['image_store'])
+
+event.listen(Task, 'before_insert', render_task_content)
+event.listen(Task, 'before_update', render_task_content)
+
+def render_tasks(force=False, batch_size=200, image=None):
+    """为尚未处理、或处理规则（RENDER_VERSION）已变化的作业生成 content_html，返回处理的作业数
+
+    force 时全部重新生成，例如图片缩略图在作业保存之后才生成完成；指定 image（上传文件名）时
+    只重新生成引用了这张图片的作业。
+    """
+    store = current_app.extensions['image_store']
+    rows = db.session.query(Task.id, Task.content, Task.content_hash) \
+        .execution_options(yield_per=batch_size)
+    if image is not None:
+        rows = rows.filter(Task.content.contains(f'/uploads/{image.split(".", 1)[0]}'))
+        force = True
+    pending = [(task_id, raw) for task_id, raw, digest in rows
+               if force or digest != task_content.content_hash(raw)]
+    for start in range(0, len(pending), batch_size):
+        updates = []
+        for task_id, raw in pending[start:start + batch_size]:
+            content_html, excerpt, digest = task_content.render(raw, store)
+            updates.append({'id': task_id, 'content_html': content_html, 'excerpt': excerpt,
+                            'content_hash': digest})
+        db.session.execute(update(Task), updates)
+        db.session.commit()
+    if pending:
+        publish_event('board_changed', reason='render_tasks')
+        db.session.commit()
+    return len(pending)
+
+def default_capacity(context):
+    """新建小组的人数上限：普通小组为 MAX_GROUP_MEMBERS，未分组不限"""
+    return None if context.get_current_parameters().get('is_ungrouped') else MAX_GROUP_MEMBERS
 
 class Group(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
-    is_ungrouped = db.Column(db.Boolean, default=False)  # 标记是否为未分组
+    is_ungrouped = db.Column(db.Boolean, default=False, index=True)  # 标记是否为未分组
+    capacity = db.Column(db.Integer, default=default_capacity)  # 人数上限，为空表示不限
+    # 当前人数，随成员增删移动在同一事务中维护（见 change_member_counts）
+    member_count = db.Column(db.Integer, default=0, nullable=False, server_default='0')
+    # 小组卡片的版本号：组名、成员或完成状态变化时在同一事务中加一（见 bump_group_versions），
+    # 模板按它缓存渲染好的卡片
+    version = db.Column(db.Integer, default=0, nullable=False, server_default='0')
     members = db.relationship('GroupMember', backref='group', lazy=True)
 
+    __table_args__ = (
+        # 部分唯一索引：最多只能有一个未分组
+        db.Index('uq_group_single_ungrouped', 'is_ungrouped', unique=True,
+                 sqlite_where=db.text('is_ungrouped = 1')),
+    )
+
 class GroupMember(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    group_id = db.Column(db.Integer, db.ForeignKey('group.id'), nullable=False)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    status = db.Column(db.Boolean, default=False)  # False: 未完成, True: 已完成
+    group_id = db.Column(db.Integer, db.ForeignKey('group.id'), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True, unique=True)  # 每个用户只能属于一个小组
+    status = db.Column(db.Boolean, default=False)  # 已弃用：完成状态改为按作业记录在 Submission 中
     user = db.relationship('User', backref='group_memberships')
 
+class Submission(db.Model):
+    """成员对某个作业的完成情况，每个 (作业, 成员) 最多一条记录"""
+    id = db.Column(db.Integer, primary_key=True)
+    task_id = db.Column(db.Integer, db.ForeignKey('task.id'), nullable=False)
+    member_id = db.Column(db.Integer, db.ForeignKey('group_member.id'), nullable=False)
+    status = db.Column(db.Boolean, default=False, nullable=False)  # False: 未完成, True: 已完成
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        # 唯一索引同时用于状态更新时的 upsert 冲突判断
+        db.UniqueConstraint('task_id', 'member_id', name='uq_submission_task_member'),
+        # 按作业统计完成人数时只需扫描索引
+        db.Index('ix_submission_task_status', 'task_id', 'status'),
+        db.Index('ix_submission_member', 'member_id'),
+    )
+
+class BoardEvent(db.Model):
+    """看板变更事件，供 /api/events 推送给其他浏览器"""
+    id = db.Column(db.Integer, primary_key=True)
+    type = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+class Job(db.Model):
+    """后台任务，status 依次为 queued → running → succeeded / failed / cancelled，失败可重试时回到 queued"""
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(40), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued')
+    params = db.Column(db.Text, nullable=False, default='{}')
+    # 进度：已处理条数 / 总条数；result 在执行中保存阶段性结果，用于重试时从断点继续
+    done = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Integer)
+    message = db.Column(db.String(200))
+    result = db.Column(db.Text)
+    error = db.Column(db.Text)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    cancel_requested = db.Column(db.Boolean, nullable=False, default=False)
+    worker = db.Column(db.String(100))  # 正在执行的进程（主机名:pid）
+    created_by = db.Column(db.Integer, db.ForeignKey('user.id'))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    run_after = db.Column(db.DateTime, default=datetime.utcnow)  # 重试时推迟执行
+    started_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        # 领取任务：WHERE status = 'queued' AND run_after <= ? ORDER BY id
+        db.Index('ix_job_status_run_after', 'status', 'run_after'),
+    )
+
+def current_shard():
+    """当前请求所属班级的分片；不在班级路径下时为默认分片
+
+    后台线程和命令行通过 shard_context() 或直接设置 g.shard 指定班级。
+    """
+    shard = g.get('shard')
+    if shard is None:
+        slug = request.environ.get(ENVIRON_KEY) if has_request_context() else None
+        shard = g.shard = current_app.extensions['shards'].acquire(slug)
+    return shard
+
+def release_shard(exception=None):
+    current_app.extensions['shards'].release(g.pop('shard', None))
+
+@contextmanager
+def shard_context(app, shard):
+    """在独立的应用上下文中访问班级数据库，供后台线程和命令行使用
+
+    shard 为班级标识（None 为默认分片）时按需打开；为分片对象时不会重新打开，已被关闭则抛出 ShardClosed。
+    """
+    router = app.extensions['shards']
+    shard = router.hold(shard) if isinstance(shard, Shard) else router.acquire(shard, touch=False)
+    with app.app_context():
+        g.shard = shard
+        try:
+            yield shard
+        finally:
+            release_shard()
+
+class ShardSessionInterface(SecureCookieSessionInterface):
+    """每个班级使用单独的会话 Cookie，同一个浏览器可以同时登录多个班级，互不影响"""
+
+    def get_cookie_name(self, app):
+        name = super().get_cookie_name(app)
+        slug = request.environ.get(ENVIRON_KEY) if has_request_context() else None
+        return f'{name}_{slug}' if slug else name
+
+    def get_cookie_path(self, app):
+        if has_request_context() and request.script_root:
+            return request.script_root
+        return super().get_cookie_path(app)
+
+class SessionUser(UserMixin):
+    """缓存在进程内的登录用户身份，只包含权限判断需要的字段，不含密码哈希"""
+
+    def __init__(self, id, username, is_admin, auth_token):
+        self.id = id
+        self.username = username
+        self.is_admin = is_admin
+        self.auth_token = auth_token
+
+def auth_token(password_hash):
+    """由密码哈希派生的会话令牌，修改密码后旧会话随之失效"""
+    return hashlib.sha256(password_hash.encode('utf-8')).hexdigest()[:16]
+
+def load_session_user(user_id):
+    user = db.session.get(User, user_id)
+    if user is None:
+        return None
+    return SessionUser(user.id, user.username, bool(user.is_admin), auth_token(user.password_hash))
+
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    """按认证版本号缓存用户身份，已登录的请求不再每次查询 user 表"""
+    user_id = int(user_id)
+    shard = current_shard()
+    user = current_app.extensions['user_cache'].get_or_create(
+        (shard.slug, user_id), shard.auth_version.get(), lambda: load_session_user(user_id))
+    if user is None or not hmac.compare_digest(session.get('auth_token', ''), user.auth_token):
+        return None
+    return user
+
+def log_in(user):
+    login_user(user)
+    session['auth_token'] = auth_token(user.password_hash)
+
+def forget_users():
+    """标记本次事务修改了用户身份，提交后所有进程的用户缓存失效"""
+    db.session.info['auth_changed'] = True
+
+def bump_auth_version(session):
+    if session.info.pop('auth_changed', False):
+        current_shard().auth_version.bump()
+
+def discard_auth_change(session):
+    session.info.pop('auth_changed', None)
+
+event.listen(db.session, 'after_commit', bump_auth_version)
+event.listen(db.session, 'after_rollback', discard_auth_change)
+event.listen(User, 'after_delete', lambda mapper, connection, target: forget_users())
+
+@contextmanager
+def password_hash_slot():
+    """限制同时计算密码哈希的线程数
+
+    密码哈希是 CPU 密集操作，上课集中登录时如果不加限制，所有请求线程都会卡在哈希计算上，
+    其他请求（包括看板轮询）也无法处理。等待超时返回 False，由调用方提示稍后重试。
+    """
+    slots = current_app.extensions['password_hash_slots']
+    started = time.perf_counter()
+    acquired = slots.acquire(timeout=current_app.config['PASSWORD_HASH_WAIT'])
+    timings = g.get('timings')
+    if timings is not None:
+        timings['hash_wait'] += time.perf_counter() - started
+    started = time.perf_counter()
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            slots.release()
+        if timings is not None:
+            timings['hash'] += time.perf_counter() - started
+
+def busy_response(message, status=503, retry_after=1):
+    response = jsonify({'error': message})
+    response.status_code = status
+    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+def coalesced(key_func):
+    """同一用户、同一键的请求在 STATUS_COALESCE_WINDOW 秒内重复到达时只执行最后一个（见 admit_write）
+
+    key_func(data) 根据请求的 JSON 返回合并用的键（元组），admit_write 会在前面加上班级和用户 ID。
+    写在 @login_required 之下，functools.wraps 会把标记带到注册的视图函数上。
+    """
+    def decorator(f):
+        f.coalesce_key = key_func
+        return f
+    return decorator
 
 def admin_required(f):
     @wraps(f)
@@ -68,70 +465,528 @@ def admin_required(f):
         if not current_user.is_authenticated or not current_user.is_admin:
             abort(403)
         return f(*args, **kwargs)
+    # admit_write 据此提前判断权限：没有权限的请求不参与合并，也不占用写入名额
+    decorated_function.admin_only = True
     return decorated_function
 
 # 添加自定义过滤器
-@app.template_filter('count_members')
+# 小组对象上的 member_count/completed_count 由SQL聚合得到（见 load_index_groups），不遍历成员
+@bp.app_template_filter('count_members')
 def count_members(groups):
-    return sum(len(group.members) for group in groups if not group.is_ungrouped)
+    return sum(group.member_count for group in groups if not group.is_ungrouped)
 
-@app.template_filter('count_completed')
+@bp.app_template_filter('count_completed')
 def count_completed(groups):
-    return sum(sum(1 for member in group.members if member.status) 
-              for group in groups if not group.is_ungrouped)
+    return sum(group.completed_count for group in groups if not group.is_ungrouped)
+
+# 当前班级标识，导航栏中显示
+@bp.app_context_processor
+def inject_class():
+    return {'class_slug': request.environ.get(ENVIRON_KEY)}
+
+def latest_task():
+    return Task.query.order_by(Task.created_at.desc()).first()
+
+def completed_member_ids(task):
+    """返回在指定作业中已完成的成员ID集合（单条索引查询）"""
+    if task is None:
+        return set()
+    return {member_id for (member_id,) in db.session.query(Submission.member_id).filter(
+        Submission.task_id == task.id, Submission.status == True)}
+
+def load_index_groups(task=None):
+    """首页读取模型：固定查询次数加载所有小组、成员及用户名
+
+    第一条查询用 GROUP BY 子查询一次算出每组当前作业的完成人数（总人数直接取 Group.member_count），
+    第二条由 selectinload 批量加载成员并 JOIN 用户表，第三条取出当前作业已完成的成员，
+    模板中不会再触发懒加载。成员的完成状态挂在 member.completed 上。
+    """
+    task_id = task.id if task is not None else None
+    stats = db.session.query(
+        GroupMember.group_id.label('group_id'),
+        func.count(Submission.id).label('completed_count')
+    ).join(Submission, (Submission.member_id == GroupMember.id) &
+           (Submission.task_id == task_id) &
+           (Submission.status == True)) \
+     .group_by(GroupMember.group_id).subquery()
+
+    rows = db.session.query(
+        Group,
+        func.coalesce(stats.c.completed_count, 0)
+    ).outerjoin(stats, stats.c.group_id == Group.id) \
+     .filter(Group.is_ungrouped == False) \
+     .options(selectinload(Group.members).joinedload(GroupMember.user)) \
+     .order_by(Group.id).all()
+
+    done = completed_member_ids(task)
+    groups = []
+    for group, completed_count in rows:
+        group.completed_count = completed_count
+        for member in group.members:
+            member.completed = member.id in done
+        groups.append(group)
+    return groups
+
+def publish_event(event_type, **payload):
+    """在当前事务中记录一条看板事件，和业务修改一起提交
+
+    同时标记本次事务修改了看板，提交成功后看板版本号加一（见 bump_board_version）；事件涉及的小组
+    在提交前版本号加一，board_changed 这类批量修改涉及所有小组（见 bump_group_versions）。
+    """
+    db.session.add(BoardEvent(type=event_type, payload=json.dumps(payload, ensure_ascii=False)))
+    db.session.info['board_changed'] = True
+    changed = db.session.info.setdefault('changed_groups', set())
+    if event_type == 'board_changed':
+        changed.add(ALL_GROUPS)
+    else:
+        changed.update(payload[key] for key in ('group_id', 'old_group_id', 'new_group_id') if key in payload)
+
+def bump_group_versions(session):
+    changed = session.info.pop('changed_groups', None)
+    if not changed:
+        return
+    table = Group.__table__
+    stmt = table.update().values(version=table.c.version + 1)
+    if ALL_GROUPS not in changed:
+        stmt = stmt.where(table.c.id.in_(sorted(changed)))
+    session.execute(stmt)
+
+def bump_board_version(session):
+    if session.info.pop('board_changed', False):
+        current_shard().board_version.bump()
+
+def discard_board_change(session):
+    session.info.pop('board_changed', None)
+    session.info.pop('changed_groups', None)
+
+event.listen(db.session, 'before_commit', bump_group_versions)
+event.listen(db.session, 'after_commit', bump_board_version)
+event.listen(db.session, 'after_rollback', discard_board_change)
+
+class GroupFull(Exception):
+    """小组人数已达上限；并发请求中晚到的一方收到 409，刷新看板后可以重试"""
+
+    def __init__(self, group_id):
+        super().__init__(group_id)
+        self.group_id = group_id
+
+class MembersChanged(Exception):
+    """读取成员之后，成员已被其他请求移动或删除"""
+
+MEMBERS_CHANGED_MESSAGE = '成员已被其他人修改，请刷新后重试'
+
+def change_member_counts(deltas):
+    """按 {小组ID: 人数变化} 更新小组人数，在当前事务中执行
+
+    增加人数时用一条带条件的 UPDATE 同时完成检查和递增：
+    UPDATE group SET member_count = member_count + n WHERE id = ? AND member_count + n <= capacity，
+    SQLite 的写操作是串行的，两个请求不可能都看到 4 人后各自加到 6 人，也不需要额外加锁。
+    没有更新到任何行说明小组已满，抛出 GroupFull，由调用方回滚整个事务。
+    """
+    table = Group.__table__
+    for group_id, delta in sorted(deltas.items()):
+        if delta > 0:
+            result = db.session.execute(
+                update(table)
+                .where(table.c.id == group_id,
+                       or_(table.c.capacity.is_(None), table.c.member_count + delta <= table.c.capacity))
+                .values(member_count=table.c.member_count + delta))
+            if result.rowcount != 1:
+                raise GroupFull(group_id)
+        else:
+            # 人数不变（如两组交换成员）时也执行一次，保证之后的检查已在写锁内进行
+            db.session.execute(update(table).where(table.c.id == group_id)
+                               .values(member_count=table.c.member_count + delta))
+
+def check_member_groups(expected):
+    """确认成员仍在 {成员ID: 小组ID} 所记录的小组中，否则抛出 MembersChanged
+
+    在 change_member_counts 之后调用：此时事务已持有写锁，读到的是最新数据，
+    可以发现读取成员之后、加锁之前被其他请求移动或删除的成员，避免人数计数被重复增减。
+    """
+    if not expected:
+        return
+    current = dict(db.session.query(GroupMember.id, GroupMember.group_id)
+                   .filter(GroupMember.id.in_(list(expected))).all())
+    if any(current.get(member_id) != group_id for member_id, group_id in expected.items()):
+        raise MembersChanged()
+
+def recount_members():
+    """按组员表重新计算所有小组的人数"""
+    counts = db.session.query(func.count(GroupMember.id)) \
+        .filter(GroupMember.group_id == Group.id).scalar_subquery()
+    db.session.execute(update(Group.__table__).values(member_count=counts))
+
+def conflict_message(e):
+    if isinstance(e, MembersChanged):
+        return MEMBERS_CHANGED_MESSAGE
+    group = db.session.get(Group, e.group_id)
+    return f'{group.name}已满(最多{group.capacity}人)' if group else '目标组不存在'
+
+def conflict_response(e, success_key=False):
+    """GroupFull / MembersChanged 的响应：回滚事务，返回可以重试的 409"""
+    db.session.rollback()
+    body = {'error': conflict_message(e), 'retryable': True}
+    if success_key:
+        body['success'] = False
+    return jsonify(body), 409
+
+# 后台任务：任务类型 -> (执行函数, 遇到哪些异常时重试)
+JOB_HANDLERS = {}
+
+def job_handler(kind, retry_on=()):
+    """注册任务类型。执行函数接收 (JobControl, 参数字典)，返回的结果保存在 job.result
+
+    执行函数在应用上下文中运行，不要自己提交最后的修改：返回后由执行器把修改和任务状态在同一个事务中提交，
+    中途需要提交时调用 JobControl.checkpoint。
+    """
+    def decorator(f):
+        JOB_HANDLERS[kind] = (f, tuple(retry_on))
+        return f
+    return decorator
+
+def enqueue_job(kind, params):
+    """创建任务并提交，唤醒本进程的任务线程，返回任务"""
+    job = Job(kind=kind, params=json.dumps(params, ensure_ascii=False),
+              max_attempts=current_app.config['JOB_MAX_ATTEMPTS'],
+              created_by=current_user.id if has_request_context() and current_user.is_authenticated else None)
+    db.session.add(job)
+    db.session.commit()
+    runner = current_app.extensions['jobs']
+    runner.start()
+    runner.wakeup()
+    return job
+
+def job_accepted(job, message):
+    """任务已入队的响应：202 和查询进度的地址"""
+    return jsonify({
+        'success': True,
+        'message': message,
+        'job_id': job.id,
+        'status_url': url_for('main.job_status', job_id=job.id),
+    }), 202
+
+class JobControl:
+    """任务执行函数的第一个参数：读取上次中断时的断点、报告进度、检查是否被取消"""
+
+    def __init__(self, job, worker_id):
+        self.job_id = job.id
+        self.worker_id = worker_id
+        # 上次尝试已提交的进度，重试时从这里继续
+        self.done = job.done
+        self.state = json.loads(job.result) if job.result else None
+
+    def _update(self, **values):
+        values['heartbeat_at'] = datetime.utcnow()
+        result = db.session.execute(update(Job).where(
+            Job.id == self.job_id, Job.worker == self.worker_id, Job.status == 'running').values(**values))
+        if result.rowcount != 1:
+            raise JobLost()
+
+    def progress(self, done, total=None, message=None, state=None):
+        """在当前事务中记录进度，和任务自己的修改一起提交"""
+        values = {'done': done}
+        if total is not None:
+            values['total'] = total
+        if message is not None:
+            values['message'] = message
+        if state is not None:
+            values['result'] = json.dumps(state, ensure_ascii=False)
+        self._update(**values)
+        self.done = done
+        self.state = state if state is not None else self.state
+
+    def checkpoint(self, done, total=None, message=None, state=None):
+        """记录进度并提交当前事务，然后检查管理员是否要求取消"""
+        self.progress(done, total, message, state)
+        db.session.commit()
+        if db.session.query(Job.cancel_requested).filter(Job.id == self.job_id).scalar():
+            raise JobCancelled()
+
+    def requeue(self, delay, error):
+        """放回队列，delay 秒后重试；已提交的进度保留"""
+        self._update(status='queued', worker=None, error=error,
+                     run_after=datetime.utcnow() + timedelta(seconds=delay))
+        db.session.commit()
+
+    def finish(self, status, result=None, error=None):
+        """在当前事务中写入最终状态并提交"""
+        values = {'status': status, 'finished_at': datetime.utcnow(), 'error': error}
+        if result is not None:
+            values['result'] = json.dumps(result, ensure_ascii=False)
+        self._update(**values)
+        db.session.commit()
+
+def job_error_message(e):
+    if isinstance(e, (GroupFull, MembersChanged)):
+        return conflict_message(e)
+    if isinstance(e, OperationalError):
+        return '数据库繁忙'
+    return str(e) or e.__class__.__name__
+
+def run_job(job_id, worker_id):
+    """执行一个已领取的任务：成功、取消、失败（可重试时放回队列）都在这里更新状态"""
+    job = db.session.get(Job, job_id)
+    control = JobControl(job, worker_id)
+    kind = job.kind
+    handler, retry_on = JOB_HANDLERS.get(kind, (None, ()))
+    try:
+        if handler is None:
+            raise ValueError(f'未知的任务类型: {kind}')
+        result = handler(control, json.loads(job.params))
+        control.finish('succeeded', result=result)
+    except JobLost:
+        db.session.rollback()
+        current_app.logger.error(f'任务 {job_id}（{kind}）心跳超时，已由其他进程重新执行')
+    except JobCancelled:
+        db.session.rollback()
+        control.finish('cancelled', error='已取消')
+    except Exception as e:
+        db.session.rollback()
+        message = job_error_message(e)
+        current_app.logger.error(f'任务 {job_id}（{kind}）失败: {message}')
+        job = db.session.get(Job, job_id)
+        if isinstance(e, retry_on) and job.attempts < job.max_attempts:
+            control.requeue(2 ** job.attempts, message)  # 指数退避
+        else:
+            control.finish('failed', error=message)
+
+def serialize_job(job):
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'done': job.done,
+        'total': job.total,
+        'message': job.message,
+        'result': json.loads(job.result) if job.result and job.status == 'succeeded' else None,
+        'error': job.error,
+        'attempts': job.attempts,
+        'cancel_requested': bool(job.cancel_requested),
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+def cached_board(key, factory, version=None):
+    """按看板版本号缓存读取结果，任何写操作提交后自动失效"""
+    shard = current_shard()
+    if version is None:
+        version = shard.board_version.get()
+    return current_app.extensions['board_cache'].get_or_create((shard.slug, key), version, factory)
+
+def snapshot_task(task, **extra):
+    """作业的只读快照，可以安全地跨请求缓存"""
+    if task is None:
+        return None
+    return SimpleNamespace(id=task.id, title=task.title, content=task.content,
+                           content_html=task.content_html, excerpt=task.excerpt,
+                           created_at=task.created_at, deadline=task.deadline, **extra)
+
+def snapshot_group(group):
+    return SimpleNamespace(
+        id=group.id,
+        name=group.name,
+        is_ungrouped=bool(group.is_ungrouped),
+        capacity=group.capacity,
+        member_count=group.member_count,
+        completed_count=group.completed_count,
+        version=group.version,
+        members=[SimpleNamespace(id=member.id, username=member.user.username, completed=member.completed)
+                 for member in group.members]
+    )
+
+def current_task():
+    """最新发布的作业（缓存的快照）"""
+    return cached_board('latest_task', lambda: snapshot_task(latest_task()))
+
+def build_index_board():
+    """首页模板所需的全部数据"""
+    task = current_task()
+    # 只获取非未分组的组，成员和统计数据已预先加载
+    groups = [snapshot_group(group) for group in load_index_groups(task)]
+    return {
+        'tasks': task,
+        'groups': groups,
+        'total_members': sum(g.member_count for g in groups),
+        'total_completed': sum(g.completed_count for g in groups),
+        'active_groups': sum(1 for g in groups if g.member_count > 0),
+    }
+
+def encode_task_cursor(task):
+    return f'{task.created_at.isoformat()}~{task.id}'
+
+def decode_task_cursor(value):
+    """解析作业分页游标，格式错误时抛出 ValueError"""
+    created_at, _, task_id = value.rpartition('~')
+    return datetime.fromisoformat(created_at), int(task_id)
+
+def load_task_page(before=None, limit=ADMIN_TASK_PAGE_SIZE):
+    """按发布时间倒序读取一页作业，返回 (作业快照列表, 下一页游标)
+
+    键集分页：按 (created_at, id) 比较定位上一页的最后一条，由 created_at 索引直接定位，
+    翻到第几页都只读取 limit + 1 行，不像 OFFSET 那样越往后越慢。完成人数只统计本页的作业。
+    """
+    query = Task.query.order_by(Task.created_at.desc(), Task.id.desc())
+    if before is not None:
+        query = query.filter(tuple_(Task.created_at, Task.id) < before)
+    tasks = query.limit(limit + 1).all()
+    next_cursor = encode_task_cursor(tasks[limit - 1]) if len(tasks) > limit else None
+    tasks = tasks[:limit]
+    return snapshot_task_rows(tasks), next_cursor
+
+def snapshot_task_rows(tasks):
+    """作业列表中各行的快照，附带全班人数和每个作业的完成人数"""
+    total_members = db.session.query(func.coalesce(func.sum(Group.member_count), 0)).scalar()
+    completed_by_task = dict(db.session.query(Submission.task_id, func.count(Submission.id))
+                             .filter(Submission.task_id.in_([task.id for task in tasks]),
+                                     Submission.status == True)
+                             .group_by(Submission.task_id).all()) if tasks else {}
+    return [snapshot_task(task, total_count=total_members,
+                          completed_count=completed_by_task.get(task.id, 0))
+            for task in tasks]
+
+def serialize_task_row(task):
+    return {
+        'id': task.id,
+        'title': task.title,
+        'excerpt': task.excerpt,
+        'content': task.content,
+        'created_at': task.created_at.strftime('%Y-%m-%d %H:%M'),
+        'deadline': task.deadline.strftime('%Y-%m-%dT%H:%M') if task.deadline else None,
+        'completed_count': task.completed_count,
+        'total_count': task.total_count,
+    }
+
+def load_group_page(after=None, limit=ADMIN_GROUP_PAGE_SIZE, ids=None):
+    """按 id 顺序读取一页普通小组的摘要（不含成员），返回 (摘要列表, 下一页游标)
+
+    指定 ids 时改为读取这些小组（可以包含未分组），用于刷新页面上已有的小组卡片。
+    完成人数对应最新发布的作业，只统计本页的小组。
+    """
+    if ids is not None:
+        groups = Group.query.filter(Group.id.in_(ids)).order_by(Group.id).all()
+        next_cursor = None
+    else:
+        query = Group.query.filter(Group.is_ungrouped == False).order_by(Group.id)
+        if after is not None:
+            query = query.filter(Group.id > after)
+        groups = query.limit(limit + 1).all()
+        next_cursor = groups[limit - 1].id if len(groups) > limit else None
+        groups = groups[:limit]
+
+    task = current_task()
+    completed = {}
+    if task is not None and groups:
+        completed = dict(db.session.query(GroupMember.group_id, func.count(Submission.id))
+                         .join(Submission, (Submission.member_id == GroupMember.id) &
+                               (Submission.task_id == task.id) & (Submission.status == True))
+                         .filter(GroupMember.group_id.in_([group.id for group in groups]))
+                         .group_by(GroupMember.group_id).all())
+    return [{
+        'id': group.id,
+        'name': group.name,
+        'is_ungrouped': bool(group.is_ungrouped),
+        'capacity': group.capacity,
+        'member_count': group.member_count,
+        'completed_count': completed.get(group.id, 0),
+        'version': group.version,
+    } for group in groups], next_cursor
+
+def build_admin_board():
+    """管理面板首屏所需的数据：第一页作业、第一页小组摘要和未分组摘要，成员在展开小组时加载"""
+    # 确保有一个未分组的组
+    ungrouped_id = db.session.query(Group.id).filter_by(is_ungrouped=True).scalar()
+    if ungrouped_id is None:
+        try:
+            ungrouped = Group(name="未分组", is_ungrouped=True)
+            db.session.add(ungrouped)
+            db.session.flush()
+            publish_event('group_created', group_id=ungrouped.id, name=ungrouped.name)
+            db.session.commit()
+        except IntegrityError:
+            # 其他请求已经同时创建了未分组
+            db.session.rollback()
+        ungrouped_id = db.session.query(Group.id).filter_by(is_ungrouped=True).scalar()
+
+    tasks, tasks_next = load_task_page()
+    groups, groups_next = load_group_page()
+    return {
+        'tasks': tasks,
+        'tasks_next': tasks_next,
+        'groups': groups,
+        'groups_next': groups_next,
+        'ungrouped': load_group_page(ids=[ungrouped_id])[0][0],
+        'current_task': current_task(),
+    }
+
+def serialize_board(task):
+    """看板快照：所有小组（含未分组）、成员及其在当前作业中的完成状态"""
+    groups = Group.query.options(selectinload(Group.members).joinedload(GroupMember.user)) \
+        .order_by(Group.id).all()
+    done = completed_member_ids(task)
+    return {
+        'task': {
+            'id': task.id,
+            'title': task.title,
+            'created_at': task.created_at.strftime('%Y-%m-%d %H:%M'),
+            'deadline': task.deadline.strftime('%Y-%m-%d %H:%M') if task.deadline else None
+        } if task else None,
+        'groups': [{
+            'id': group.id,
+            'name': group.name,
+            'ungrouped': bool(group.is_ungrouped),
+            'capacity': group.capacity,
+            'members': [[member.id, member.user.username, member.id in done]
+                        for member in group.members]
+        } for group in groups]
+    }
 
 # Routes
-@app.route('/')
+@bp.route('/')
 def index():
-    tasks = Task.query.order_by(Task.created_at.desc()).first()
-    # 只获取非未分组的组
-    groups = Group.query.filter_by(is_ungrouped=False).all()
-    return render_template('index.html', tasks=tasks, groups=groups)
+    return render_template('index.html', **cached_board('index', build_index_board))
 
-@app.route('/login', methods=['GET', 'POST'])
+@bp.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
         username = request.form.get('username')
         password = request.form.get('password')
         user = User.query.filter_by(username=username).first()
-        if user and check_password_hash(user.password_hash, password):
-            login_user(user)
-            return redirect(url_for('admin_dashboard' if user.is_admin else 'index'))
+        if user and password:
+            with password_hash_slot() as acquired:
+                if not acquired:
+                    flash('当前登录人数较多，请稍后重试')
+                    return render_template('login.html'), 503, {'Retry-After': '1'}
+                if user.password_hash == PENDING_PASSWORD_HASH:
+                    # 首次登录：此时才为初始密码生成哈希
+                    valid = hmac.compare_digest(password.encode('utf-8'), user.username.encode('utf-8'))
+                    if valid:
+                        user.password_hash = generate_password_hash(password)
+                        db.session.commit()
+                else:
+                    valid = check_password_hash(user.password_hash, password)
+            if valid:
+                log_in(user)
+                return redirect(url_for('main.admin_dashboard' if user.is_admin else 'main.index'))
         flash('用户名或密码错误')
     return render_template('login.html')
 
-@app.route('/logout')
+@bp.route('/logout')
 @login_required
 def logout():
     logout_user()
-    return redirect(url_for('index'))
+    return redirect(url_for('main.index'))
 
-@app.route('/admin')
+@bp.route('/admin')
 @login_required
 def admin_dashboard():
     if not current_user.is_admin:
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
     
-    # 获取所有作业并计算完成情况
-    tasks = Task.query.order_by(Task.created_at.desc()).all()
-    for task in tasks:
-        # 计算作业完成情况
-        total_members = GroupMember.query.count()
-        completed_members = GroupMember.query.filter_by(status=True).count()
-        task.total_count = total_members
-        task.completed_count = completed_members
-
-    groups = Group.query.all()
-    # 确保有一个未分组的组
-    ungrouped = Group.query.filter_by(is_ungrouped=True).first()
-    if not ungrouped:
-        ungrouped = Group(name="未分组", is_ungrouped=True)
-        db.session.add(ungrouped)
-        db.session.commit()
-        groups = Group.query.all()  # 重新查询以包含新创建的组
-    return render_template('admin.html', groups=groups, ungrouped=ungrouped, tasks=tasks)
+    return render_template('admin.html', **cached_board('admin', build_admin_board))
 
-@app.route('/api/tasks', methods=['POST'])
+@bp.route('/api/tasks', methods=['POST'])
 @login_required
 @admin_required
 def create_task():
@@ -154,23 +1009,21 @@ def create_task():
         )
         
         db.session.add(task)
+        db.session.flush()
+        publish_event('task_published', task_id=task.id, title=task.title)
         db.session.commit()
         
+        # 返回与 /api/tasks 相同的行数据，页面直接插入新行
         return jsonify({
             'message': '作业发布成功',
-            'task': {
-                'id': task.id,
-                'title': task.title,
-                'content': task.content,
-                'deadline': task.deadline.strftime('%Y-%m-%d %H:%M') if task.deadline else None
-            }
+            'task': serialize_task_row(snapshot_task_rows([task])[0])
         })
     except Exception as e:
         db.session.rollback()
-        app.logger.error(f'创建作业失败: {str(e)}')
+        current_app.logger.error(f'创建作业失败: {str(e)}')
         return jsonify({'error': '创建作业失败，请重试'}), 500
 
-@app.route('/api/tasks/<int:task_id>', methods=['PUT'])
+@bp.route('/api/tasks/<int:task_id>', methods=['PUT'])
 @login_required
 @admin_required
 def update_task(task_id):
@@ -184,24 +1037,28 @@ def update_task(task_id):
         task.title = data.get('title', task.title)
         task.content = data.get('content', task.content)
         task.deadline = datetime.strptime(data['deadline'], '%Y-%m-%dT%H:%M') if data.get('deadline') else None
+        publish_event('task_updated', task_id=task.id, title=task.title)
         
         db.session.commit()
         return jsonify({
             'success': True,
-            'message': '作业更新成功'
+            'message': '作业更新成功',
+            'task': serialize_task_row(snapshot_task_rows([task])[0])
         })
     except Exception as e:
         db.session.rollback()
-        app.logger.error(f'更新作业失败: {str(e)}')
+        current_app.logger.error(f'更新作业失败: {str(e)}')
         return jsonify({'error': '更新作业失败，请重试'}), 500
 
-@app.route('/api/tasks/<int:task_id>', methods=['DELETE'])
+@bp.route('/api/tasks/<int:task_id>', methods=['DELETE'])
 @login_required
 @admin_required
 def delete_task(task_id):
     try:
         task = Task.query.get_or_404(task_id)
+        Submission.query.filter_by(task_id=task_id).delete()
         db.session.delete(task)
+        publish_event('task_deleted', task_id=task_id)
         db.session.commit()
         return jsonify({
             'success': True,
@@ -209,23 +1066,33 @@ def delete_task(task_id):
         })
     except Exception as e:
         db.session.rollback()
-        app.logger.error(f'删除作业失败: {str(e)}')
+        current_app.logger.error(f'删除作业失败: {str(e)}')
         return jsonify({'error': '删除作业失败，请重试'}), 500
 
-@app.route('/api/groups', methods=['POST', 'PUT'])
+@bp.route('/api/groups', methods=['POST', 'PUT'])
 @login_required
+@admin_required
 def manage_group():
-    if not current_user.is_admin:
-        return jsonify({'error': 'Unauthorized'}), 403
 
     try:
         data = request.get_json()
         if not data or not data.get('name'):
             return jsonify({'error': 'Missing group name'}), 400
 
+        capacity = data.get('capacity')
+        if capacity is not None:
+            try:
+                capacity = int(capacity)
+            except (TypeError, ValueError):
+                return jsonify({'error': 'Invalid capacity'}), 400
+            if capacity < 1:
+                return jsonify({'error': 'Invalid capacity'}), 400
+
         if request.method == 'POST':
-            group = Group(name=data['name'])
+            group = Group(name=data['name'], capacity=capacity or MAX_GROUP_MEMBERS)
             db.session.add(group)
+            db.session.flush()
+            publish_event('group_created', group_id=group.id, name=group.name, capacity=group.capacity)
             db.session.commit()
             return jsonify({'id': group.id, 'message': 'Group created successfully'})
         else:  # PUT
@@ -234,47 +1101,69 @@ def manage_group():
             
             group = Group.query.get_or_404(data['id'])
             group.name = data['name']
+            if capacity is not None and not group.is_ungrouped:
+                if capacity < group.member_count:
+                    return jsonify({'error': f'人数上限不能少于当前人数({group.member_count}人)'}), 400
+                group.capacity = capacity
+            publish_event('group_updated', group_id=group.id, name=group.name, capacity=group.capacity)
             db.session.commit()
             return jsonify({'message': 'Group updated successfully'})
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/groups/<int:group_id>', methods=['DELETE'])
+@bp.route('/api/groups/<int:group_id>', methods=['DELETE'])
 @login_required
+@admin_required
 def delete_group(group_id):
-    if not current_user.is_admin:
-        return jsonify({'error': 'Unauthorized'}), 403
 
     try:
         group = Group.query.get_or_404(group_id)
-        # 删除组内所有成员
+        # 删除组内所有成员及其完成记录
+        member_ids = db.session.query(GroupMember.id).filter_by(group_id=group_id)
+        Submission.query.filter(Submission.member_id.in_(member_ids.scalar_subquery())).delete(synchronize_session=False)
         GroupMember.query.filter_by(group_id=group_id).delete()
         db.session.delete(group)
+        publish_event('group_deleted', group_id=group_id)
         db.session.commit()
         return jsonify({'message': 'Group deleted successfully'})
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/groups/reset', methods=['POST'])
+def reset_all_groups():
+    # 删除所有成员和小组，在当前事务中完成
+    Submission.query.delete()
+    GroupMember.query.delete()
+    Group.query.delete()
+    publish_event('board_changed', reason='reset')
+
+@job_handler('reset_groups', retry_on=(OperationalError, sqlite3.OperationalError))
+def run_reset_groups(job, params):
+    # 重置前把分组名单和各作业的完成情况保存到归档中，之后仍可查看，也可以恢复完成情况
+    if job.state is None and db.session.query(GroupMember.id).first() is not None:
+        store = archive_store()
+        term_id = store.create_term(f'重置前的分组名单（{datetime.now():%Y-%m-%d %H:%M}）')
+        store.save_roster(term_id, current_roster())
+        save_completion(store, term_id)
+        store.refresh_term(term_id)
+        job.checkpoint(0, state={'term_id': term_id})
+    reset_all_groups()
+    return {'message': 'All groups have been reset'}
+
+@bp.route('/api/groups/reset', methods=['POST'])
 @login_required
+@admin_required
 def reset_groups():
-    if not current_user.is_admin:
-        return jsonify({'error': 'Unauthorized'}), 403
     
     try:
-        # 删除所有成员和小组
-        GroupMember.query.delete()
-        Group.query.delete()
-        db.session.commit()
-        return jsonify({'message': 'All groups have been reset'})
+        return job_accepted(enqueue_job('reset_groups', {}), '正在重置分组')
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 @csrf.exempt
-@app.route('/api/members', methods=['POST'])
+@bp.route('/api/members', methods=['POST'])
 @login_required
 @admin_required
 def add_member():
@@ -294,11 +1183,6 @@ def add_member():
         if not group:
             return jsonify({'success': False, 'error': '小组不存在'}), 404
             
-        # 检查是否已达到组员上限
-        current_members = GroupMember.query.filter_by(group_id=group_id).count()
-        if not group.is_ungrouped and current_members >= 5:
-            return jsonify({'success': False, 'error': '小组已满(最多5人)'}), 400
-            
         # 检查组内是否已存在同名用户
         existing_members = GroupMember.query.join(User).filter(
             GroupMember.group_id == group_id,
@@ -317,15 +1201,21 @@ def add_member():
             # 创建新用户
             user = User(
                 username=username,
-                password_hash=generate_password_hash(username),
+                password_hash=PENDING_PASSWORD_HASH,
                 is_admin=False
             )
             db.session.add(user)
+            db.session.flush()  # 获取新用户的ID
             
         try:
             # 创建组员关系
-            member = GroupMember(user_id=user.id, group_id=group_id)
+            member = GroupMember(user_id=user.id, group_id=group.id)
             db.session.add(member)
+            db.session.flush()
+            # 人数检查和递增在同一条 UPDATE 中完成
+            change_member_counts({group.id: 1})
+            publish_event('member_added', member_id=member.id, group_id=member.group_id,
+                          username=user.username)
             db.session.commit()
             
             return jsonify({
@@ -333,19 +1223,25 @@ def add_member():
                 'member': {
                     'id': member.id,
                     'username': user.username,
-                    'status': member.status
+                    'status': False  # 新成员还没有任何完成记录
                 }
             })
+        except GroupFull as e:
+            return conflict_response(e, success_key=True)
+        except IntegrityError:
+            # 并发添加同一用户时由唯一索引兜底
+            db.session.rollback()
+            return jsonify({'success': False, 'error': '该用户已在其他组中'}), 400
         except Exception as e:
             db.session.rollback()
-            app.logger.error(f'Failed to add member: {str(e)}')
+            current_app.logger.error(f'Failed to add member: {str(e)}')
             return jsonify({'success': False, 'error': '添加成员失败'}), 500
             
     except Exception as e:
-        app.logger.error(f'Request processing failed: {str(e)}')
+        current_app.logger.error(f'Request processing failed: {str(e)}')
         return jsonify({'success': False, 'error': '服务器内部错误'}), 500
 
-@app.route('/api/members/move', methods=['POST'])
+@bp.route('/api/members/move', methods=['POST'])
 @login_required
 @admin_required
 def move_member():
@@ -368,15 +1264,18 @@ def move_member():
         if not target_group:
             return jsonify({'error': '目标组不存在'}), 404
             
-        # 如果不是移动到未分组，检查目标组人数
-        if not target_group.is_ungrouped:
-            current_members = GroupMember.query.filter_by(group_id=target_group_id).count()
-            if current_members >= 5:
-                return jsonify({'error': '目标组已满(最多5人)'}), 400
-        
-        # 更新成员所属组
+        # 更新成员所属组，目标组的人数检查和递增在同一条 UPDATE 中完成
         old_group_id = member.group_id
-        member.group_id = target_group_id
+        if old_group_id != target_group.id:
+            change_member_counts({target_group.id: 1, old_group_id: -1})
+            check_member_groups({member.id: old_group_id})
+        member.group_id = target_group.id
+        task = current_task()
+        completed = bool(task and db.session.query(Submission.status).filter_by(
+            task_id=task.id, member_id=member.id).scalar())
+        publish_event('member_moved', member_id=member.id, old_group_id=old_group_id,
+                      new_group_id=target_group.id, username=member.user.username,
+                      completed=completed)
         db.session.commit()
         
         return jsonify({
@@ -385,19 +1284,22 @@ def move_member():
             'member': {
                 'id': member.id,
                 'username': member.user.username,
-                'status': member.status
+                'status': completed
             },
             'old_group_id': old_group_id,
             'new_group_id': target_group_id
         })
+    except (GroupFull, MembersChanged) as e:
+        return conflict_response(e)
     except Exception as e:
         db.session.rollback()
-        app.logger.error(f'移动成员失败: {str(e)}')
+        current_app.logger.error(f'移动成员失败: {str(e)}')
         return jsonify({'error': '移动成员失败，请重试'}), 500
 
 @csrf.exempt
-@app.route('/api/members/status', methods=['POST'])
+@bp.route('/api/members/status', methods=['POST'])
 @login_required
+@coalesced(lambda data: ('status', data.get('member_id'), data.get('task_id')))
 def toggle_member_status():
     try:
         data = request.get_json()
@@ -406,8 +1308,9 @@ def toggle_member_status():
             
         member_id = data.get('member_id')
         status = data.get('status')
+        task_id = data.get('task_id')
         
-        app.logger.info(f'Received status update request: member_id={member_id}, status={status}')
+        current_app.logger.debug(f'Received status update request: member_id={member_id}, task_id={task_id}, status={status}')
         
         # 验证member_id
         if not member_id:
@@ -418,201 +1321,629 @@ def toggle_member_status():
             if member_id <= 0:
                 return jsonify({'success': False, 'error': '无效的成员ID'}), 400
         except (TypeError, ValueError):
-            app.logger.error(f'Invalid member_id format: {member_id}')
+            current_app.logger.error(f'Invalid member_id format: {member_id}')
             return jsonify({'success': False, 'error': '无效的成员ID格式'}), 400
             
         # 验证status
         if status is None:
             return jsonify({'success': False, 'error': '缺少状态参数'}), 400
+
+        # 验证task_id，未指定时默认为最新发布的作业
+        if task_id:
+            try:
+                task_id = int(task_id)
+            except (TypeError, ValueError):
+                return jsonify({'success': False, 'error': '无效的作业ID格式'}), 400
+            if not db.session.get(Task, task_id):
+                return jsonify({'success': False, 'error': '作业不存在'}), 404
+        else:
+            task = current_task()
+            if not task:
+                return jsonify({'success': False, 'error': '暂无作业'}), 400
+            task_id = task.id
             
         # 查询成员
-        member = GroupMember.query.get(member_id)
+        member = db.session.get(GroupMember, member_id)
         if not member:
-            app.logger.error(f'Member not found: id={member_id}')
+            current_app.logger.error(f'Member not found: id={member_id}')
             return jsonify({'success': False, 'error': '成员不存在'}), 404
             
-        # 更新状态
+        # 更新状态：通过 (task_id, member_id) 唯一索引做 upsert
         try:
-            old_status = member.status
-            member.status = bool(status)
+            old_status = db.session.query(Submission.status).filter_by(
+                task_id=task_id, member_id=member_id).scalar() or False
+            new_status = bool(status)
+            if old_status == new_status:
+                # 重复提交同一个状态：不写数据库，也不产生事件
+                return jsonify({
+                    'success': True,
+                    'message': '状态未变化',
+                    'member_id': member_id,
+                    'task_id': task_id,
+                    'old_status': old_status,
+                    'new_status': new_status
+                })
+            now = datetime.utcnow()
+            stmt = sqlite_insert(Submission).values(
+                task_id=task_id, member_id=member_id, status=new_status, updated_at=now)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=['task_id', 'member_id'],
+                set_={'status': new_status, 'updated_at': now})
+            db.session.execute(stmt)
+            publish_event('status_changed', member_id=member_id, task_id=task_id, status=new_status,
+                          group_id=member.group_id)
             db.session.commit()
             
-            app.logger.info(f'Status updated: member_id={member_id}, old_status={old_status}, new_status={member.status}')
+            current_app.logger.debug(f'Status updated: member_id={member_id}, task_id={task_id}, old_status={old_status}, new_status={new_status}')
             
             return jsonify({
                 'success': True,
                 'message': '状态更新成功',
                 'member_id': member_id,
+                'task_id': task_id,
                 'old_status': old_status,
-                'new_status': member.status
+                'new_status': new_status
             })
         except Exception as e:
             db.session.rollback()
-            app.logger.error(f'Failed to update status: {str(e)}')
+            current_app.logger.error(f'Failed to update status: {str(e)}')
             return jsonify({'success': False, 'error': '更新状态失败'}), 500
             
     except Exception as e:
-        app.logger.error(f'Request processing failed: {str(e)}')
+        current_app.logger.error(f'Request processing failed: {str(e)}')
         return jsonify({'success': False, 'error': '服务器内部错误'}), 500
 
+class BatchError(Exception):
+    """批量操作中有一条无效，整批都不执行"""
+
+    def __init__(self, message, status=400, index=None):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.index = index
+
+def parse_batch_operations(operations, default_task_id, is_admin):
+    """校验并规范化操作列表，返回 [(操作类型, 成员ID, 参数), ...]"""
+    if not isinstance(operations, list) or not operations:
+        raise BatchError('缺少操作列表')
+    if len(operations) > MAX_BATCH_OPERATIONS:
+        raise BatchError(f'单次最多{MAX_BATCH_OPERATIONS}条操作')
+
+    parsed = []
+    for index, item in enumerate(operations):
+        if not isinstance(item, dict):
+            raise BatchError('无效的操作', index=index)
+        op = item.get('op')
+        if op not in ('move', 'status', 'delete'):
+            raise BatchError('不支持的操作类型', index=index)
+        if op != 'status' and not is_admin:
+            raise BatchError('需要管理员权限', 403, index)
+        try:
+            member_id = int(item.get('member_id'))
+        except (TypeError, ValueError):
+            raise BatchError('无效的成员ID', index=index)
+
+        if op == 'move':
+            try:
+                value = int(item.get('target_group_id'))
+            except (TypeError, ValueError):
+                raise BatchError('无效的目标组ID', index=index)
+        elif op == 'status':
+            if item.get('status') is None:
+                raise BatchError('缺少状态参数', index=index)
+            task_id = item.get('task_id') or default_task_id
+            if not task_id:
+                raise BatchError('暂无作业', index=index)
+            try:
+                task_id = int(task_id)
+            except (TypeError, ValueError):
+                raise BatchError('无效的作业ID格式', index=index)
+            value = (task_id, bool(item['status']))
+        else:
+            value = None
+        parsed.append((op, member_id, value))
+    return parsed
+
+def apply_member_batch(operations):
+    """在当前事务中执行一批成员操作，返回每条操作的结果
+
+    先按顺序推演出所有成员的最终所属组，再按最终状态原子地更新各组人数（超过上限时整批失败），
+    然后用按目标组分组的批量 UPDATE、一条 upsert 和批量 DELETE 写入。
+    """
+    member_ids = {member_id for _, member_id, _ in operations}
+    members = {row.id: row for row in db.session.query(
+        GroupMember.id, GroupMember.group_id, User.username
+    ).join(User).filter(GroupMember.id.in_(member_ids))}
+    target_ids = {value for op, _, value in operations if op == 'move'}
+    groups = {group.id: group for group in Group.query.filter(Group.id.in_(target_ids))}
+    task_ids = {value[0] for op, _, value in operations if op == 'status'}
+    existing_tasks = {task_id for (task_id,) in db.session.query(Task.id).filter(Task.id.in_(task_ids))}
+
+    # 按顺序推演
+    current = {member_id: row.group_id for member_id, row in members.items()}
+    deleted = set()
+    statuses = {}
+    results = []
+    for index, (op, member_id, value) in enumerate(operations):
+        if member_id not in members or member_id in deleted:
+            raise BatchError('成员不存在', 404, index)
+        result = {'op': op, 'member_id': member_id}
+        if op == 'move':
+            if value not in groups:
+                raise BatchError('目标组不存在', 404, index)
+            result.update(old_group_id=current[member_id], new_group_id=value,
+                          username=members[member_id].username)
+            current[member_id] = value
+        elif op == 'status':
+            task_id, status = value
+            if task_id not in existing_tasks:
+                raise BatchError('作业不存在', 404, index)
+            statuses[(task_id, member_id)] = status
+            result.update(task_id=task_id, status=status)
+        else:
+            result.update(group_id=current[member_id])
+            deleted.add(member_id)
+        results.append(result)
+
+    # 按最终状态更新各组人数：每组只有一条带上限条件的 UPDATE，中间经过满员状态的交换不会失败
+    moved = {member_id: group_id for member_id, group_id in current.items()
+             if member_id not in deleted and group_id != members[member_id].group_id}
+    deltas = {}
+    for member_id, row in members.items():
+        if member_id in deleted or member_id in moved:
+            deltas[row.group_id] = deltas.get(row.group_id, 0) - 1
+    for group_id in moved.values():
+        deltas[group_id] = deltas.get(group_id, 0) + 1
+    try:
+        change_member_counts(deltas)
+        check_member_groups({member_id: members[member_id].group_id for member_id in deleted | set(moved)})
+    except GroupFull as e:
+        group = groups[e.group_id]
+        raise BatchError(f'{group.name}已满(最多{group.capacity}人)', 409)
+    except MembersChanged:
+        raise BatchError(MEMBERS_CHANGED_MESSAGE, 409)
+
+    # 写入
+    by_target = {}
+    for member_id, group_id in moved.items():
+        by_target.setdefault(group_id, []).append(member_id)
+    for group_id, ids in by_target.items():
+        db.session.execute(update(GroupMember).where(GroupMember.id.in_(ids)).values(group_id=group_id))
+
+    rows = [{'task_id': task_id, 'member_id': member_id, 'status': status, 'updated_at': datetime.utcnow()}
+            for (task_id, member_id), status in statuses.items() if member_id not in deleted]
+    if rows:
+        stmt = sqlite_insert(Submission).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['task_id', 'member_id'],
+            set_={'status': stmt.excluded.status, 'updated_at': stmt.excluded.updated_at})
+        db.session.execute(stmt)
+
+    if deleted:
+        Submission.query.filter(Submission.member_id.in_(deleted)).delete(synchronize_session=False)
+        GroupMember.query.filter(GroupMember.id.in_(deleted)).delete(synchronize_session=False)
+
+    # 看板事件：移动事件带上成员在当前作业中的完成状态（已包含本批次的修改）
+    task = current_task()
+    done = set()
+    if task and moved:
+        done = {member_id for (member_id,) in db.session.query(Submission.member_id).filter(
+            Submission.task_id == task.id, Submission.status == True,
+            Submission.member_id.in_(list(moved)))}
+    for result in results:
+        if result['op'] == 'move':
+            publish_event('member_moved', member_id=result['member_id'],
+                          old_group_id=result['old_group_id'], new_group_id=result['new_group_id'],
+                          username=result['username'], completed=result['member_id'] in done)
+        elif result['op'] == 'status':
+            publish_event('status_changed', member_id=result['member_id'],
+                          task_id=result['task_id'], status=result['status'],
+                          group_id=current[result['member_id']])
+        else:
+            publish_event('member_deleted', member_id=result['member_id'], group_id=result['group_id'])
+    return results
+
 @csrf.exempt
-@app.route('/api/members/import', methods=['POST'])
+@bp.route('/api/members/batch', methods=['POST'])
 @login_required
-@admin_required
-def import_members():
+def batch_members():
+    """批量执行成员的移动、完成状态修改和删除，全部成功或全部不执行
+
+    请求体：{"operations": [{"op": "move", "member_id": 1, "target_group_id": 2},
+                            {"op": "status", "member_id": 3, "status": true, "task_id": 4},
+                            {"op": "delete", "member_id": 5}],
+             "task_id": 4}
+    status 操作未指定 task_id 时使用请求中的 task_id，仍未指定则为最新发布的作业。
+    移动和删除需要管理员权限。返回每条操作的结果和提交后的看板版本号。
+    """
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({'success': False, 'error': '无效的请求数据'}), 400
     try:
+        default_task_id = data.get('task_id')
+        if not default_task_id and any(isinstance(item, dict) and item.get('op') == 'status'
+                                       for item in data.get('operations') or []):
+            task = current_task()
+            default_task_id = task.id if task else None
+        operations = parse_batch_operations(data.get('operations'), default_task_id,
+                                            current_user.is_admin)
+        results = apply_member_batch(operations)
+        db.session.commit()
+    except BatchError as e:
+        db.session.rollback()
+        body = {'success': False, 'error': e.message}
+        if e.index is not None:
+            body['index'] = e.index
+        if e.status == 409:
+            body['retryable'] = True
+        return jsonify(body), e.status
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f'批量操作成员失败: {str(e)}')
+        return jsonify({'success': False, 'error': '批量操作失败，请重试'}), 500
+
+    return jsonify({
+        'success': True,
+        'results': results,
+        'version': current_shard().board_version.etag
+    })
+
+def iter_import_rows():
+    """逐行产出 (行号, 姓名)
+
+    支持三种请求格式：JSON 的 {"members": [...]}、multipart 上传的 CSV/文本文件（字段名 file），
+    以及直接以 text/plain 或 text/csv 作为请求体。文件和请求体按行流式读取，CSV 取第一列。
+    """
+    if request.is_json:
         data = request.get_json()
         if not data or 'members' not in data:
-            return jsonify({'error': '无效的请求数据'}), 400
-            
-        members = data.get('members', [])
-        if not members:
-            return jsonify({'error': '成员列表为空'}), 400
-            
-        errors = []
-        success_count = 0
-        
-        # 获取或创建未分组组
-        ungrouped = Group.query.filter_by(is_ungrouped=True).first()
-        if not ungrouped:
-            ungrouped = Group(name='未分组', is_ungrouped=True)
-            db.session.add(ungrouped)
+            raise ValueError('无效的请求数据')
+        for row_no, name in enumerate(data.get('members') or [], 1):
+            yield row_no, name if isinstance(name, str) else ''
+        return
+
+    if 'file' in request.files:
+        stream = request.files['file'].stream
+    else:
+        stream = request.stream
+    reader = csv.reader(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+    for row_no, row in enumerate(reader, 1):
+        name = row[0] if row else ''
+        if row_no == 1 and name.strip().lower() in IMPORT_HEADER_NAMES:
+            continue  # 跳过表头
+        yield row_no, name
+
+def import_member_batch(batch, ungrouped_id, seen, errors):
+    """把一批姓名导入未分组，返回成功导入的人数
+
+    已有用户和已有组员关系各用一条 IN 查询解析，新用户和组员关系用批量 INSERT 写入。
+    新用户的密码哈希推迟到首次登录时生成（见 PENDING_PASSWORD_HASH）。
+    """
+    names = [name for _, name in batch]
+    user_ids = dict(db.session.query(User.username, User.id).filter(User.username.in_(names)))
+    grouped = {user_id for (user_id,) in db.session.query(GroupMember.user_id)
+               .filter(GroupMember.user_id.in_(list(user_ids.values())))}
+
+    new_users = []
+    to_add = []
+    for row_no, name in batch:
+        if len(name) > 80:
+            errors.append(f'第{row_no}行: 用户名过长')
+            continue
+        if name in seen:
+            errors.append(f'第{row_no}行: 用户 {name} 重复')
+            continue
+        seen.add(name)
+        user_id = user_ids.get(name)
+        if user_id is not None and user_id in grouped:
+            errors.append(f'第{row_no}行: 用户 {name} 已在其他组中')
+            continue
+        if user_id is None:
+            new_users.append({'username': name, 'password_hash': PENDING_PASSWORD_HASH, 'is_admin': False})
+        to_add.append(name)
+
+    if new_users:
+        db.session.execute(insert(User), new_users)
+        user_ids.update(db.session.query(User.username, User.id).filter(
+            User.username.in_([u['username'] for u in new_users])))
+    if to_add:
+        db.session.execute(insert(GroupMember), [
+            {'user_id': user_ids[name], 'group_id': ungrouped_id, 'status': False}
+            for name in to_add
+        ])
+        change_member_counts({ungrouped_id: len(to_add)})
+    return len(to_add)
+
+def ensure_ungrouped():
+    """返回未分组的 ID，没有时在当前事务中创建"""
+    ungrouped_id = db.session.query(Group.id).filter_by(is_ungrouped=True).scalar()
+    if ungrouped_id is None:
+        ungrouped = Group(name='未分组', is_ungrouped=True)
+        db.session.add(ungrouped)
+        db.session.flush()
+        ungrouped_id = ungrouped.id
+    return ungrouped_id
+
+def import_spool_dir(app):
+    """导入名单的暂存目录：请求把名单逐行写入这里的文件，导入任务再逐行读取"""
+    return os.path.join(app.instance_path, 'imports')
+
+def spool_import_rows():
+    """把请求中的名单逐行写入暂存文件（CSV：行号, 姓名），返回 (文件路径, 总行数, 姓名数)
+
+    名单不会整体留在内存中，任务参数里也只保存文件路径。
+    """
+    directory = import_spool_dir(current_app)
+    os.makedirs(directory, exist_ok=True)
+    fd, path = tempfile.mkstemp(dir=directory, prefix='import-', suffix='.csv')
+    row_count = member_count = 0
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            for row_no, member_name in iter_import_rows():
+                row_count += 1
+                member_name = member_name.strip()
+                if member_name:
+                    writer.writerow((row_no, member_name))
+                    member_count += 1
+    except BaseException:
+        os.unlink(path)
+        raise
+    return path, row_count, member_count
+
+def remove_import_spool(path):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+@job_handler('import_members', retry_on=(OperationalError,))
+def run_import_members(job, params):
+    """按批导入，每批单独提交并记录断点，导入大名单时不会长时间占用写锁；重试时从断点继续
+
+    名单从暂存文件中逐行读取，断点为已处理的姓名数。错误信息保存在任务结果中，最多 IMPORT_MAX_ERRORS 条。
+    耗时（elapsed_ms）只计算执行导入的时间，不含排队和重试前的等待，随断点一起保存，重试时累加。
+    """
+    state = job.state or {'success_count': 0, 'error_count': 0, 'errors': []}
+    total = params['member_count']
+    done = job.done
+    previous_ms = state.get('elapsed_ms', 0)
+    started = time.perf_counter()
+
+    def elapsed_ms():
+        return round(previous_ms + (time.perf_counter() - started) * 1000, 1)
+
+    ungrouped_id = ensure_ungrouped()
+    try:
+        with open(params['path'], encoding='utf-8', newline='') as f:
+            rows = ((int(row_no), member_name) for row_no, member_name in csv.reader(f))
+            # 断点之前的姓名都已处理过，记下后重复的姓名仍能被识别
+            seen = {member_name for _, member_name in itertools.islice(rows, done)}
+            while True:
+                batch = list(itertools.islice(rows, IMPORT_BATCH_SIZE))
+                if not batch:
+                    break
+                done += len(batch)
+                errors = []
+                state['success_count'] += import_member_batch(batch, ungrouped_id, seen, errors)
+                state['error_count'] += len(errors)
+                state['errors'].extend(errors[:IMPORT_MAX_ERRORS - len(state['errors'])])
+                state['elapsed_ms'] = elapsed_ms()
+                job.checkpoint(done, total, f'已处理 {done}/{total} 人', state)
+    except JobCancelled:
+        remove_import_spool(params['path'])
+        # 已提交的批次保留，通知看板刷新
+        if state['success_count']:
+            publish_event('board_changed', reason='import')
             db.session.commit()
-        
-        for member_name in members:
-            member_name = member_name.strip()
-            if not member_name:
-                continue
-                
-            try:
-                # 检查用户是否已存在
-                user = User.query.filter_by(username=member_name).first()
-                if user:
-                    # 检查用户是否已在某个组
-                    existing_member = GroupMember.query.filter_by(user_id=user.id).first()
-                    if existing_member:
-                        errors.append(f'用户 {member_name} 已在其他组中')
-                        continue
-                else:
-                    # 创建新用户，使用用户名作为密码
-                    user = User(
-                        username=member_name,
-                        password_hash=generate_password_hash(member_name)
-                    )
-                    db.session.add(user)
-                    db.session.flush()  # 获取新用户的ID
-                
-                # 添加到未分组
-                member = GroupMember(user_id=user.id, group_id=ungrouped.id)
-                db.session.add(member)
-                success_count += 1
-                
-            except Exception as e:
-                errors.append(f'导入用户 {member_name} 失败: {str(e)}')
-                continue
-        
-        db.session.commit()
-        
-        message = f'成功导入 {success_count} 名成员'
-        if errors:
-            message += f'，但有 {len(errors)} 个错误'
-            
-        return jsonify({
-            'success': True,
-            'message': message,
-            'errors': errors,
-            'success_count': success_count
-        })
-        
+        raise
+
+    remove_import_spool(params['path'])
+    if state['success_count']:
+        publish_event('board_changed', reason='import')
+    message = f'成功导入 {state["success_count"]} 名成员'
+    if state['error_count']:
+        message += f'，但有 {state["error_count"]} 个错误'
+    return {
+        'message': message,
+        'errors': state['errors'],
+        'error_count': state['error_count'],
+        'success_count': state['success_count'],
+        'row_count': params['row_count'],
+        'elapsed_ms': elapsed_ms(),
+    }
+
+@csrf.exempt
+@bp.route('/api/members/import', methods=['POST'])
+@login_required
+@admin_required
+def import_members():
+    """名单写入暂存文件后交给后台任务导入，立即返回任务 ID"""
+    path = None
+    try:
+        path, row_count, member_count = spool_import_rows()
+        if not row_count:
+            remove_import_spool(path)
+            return jsonify({'error': '成员列表为空'}), 400
+
+        job = enqueue_job('import_members', {'path': path, 'row_count': row_count,
+                                             'member_count': member_count})
+        return job_accepted(job, f'正在导入 {member_count} 名成员')
+
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         db.session.rollback()
-        app.logger.error(f'批量导入失败: {str(e)}')
+        if path is not None:
+            remove_import_spool(path)
+        current_app.logger.error(f'批量导入失败: {str(e)}')
         return jsonify({
             'error': '批量导入失败，请重试',
             'details': str(e)
         }), 500
 
-@app.route('/api/members/auto-group', methods=['POST'])
+def plan_auto_grouping(ungrouped_id, members_per_group, rng, fill_existing=False):
+    """生成自动分组方案，不写数据库
+
+    返回 [{'group_id': 已有组ID或None, 'name': 组名, 'new': 是否新建, 'members': [(成员ID, 用户名), ...]}]。
+    fill_existing 为真时先把未分组成员补到人数最少的现有小组，直到达到每组人数，
+    剩余成员再平均分到新建的小组中。补充现有小组时不会超过该组的人数上限。
+    """
+    members = db.session.query(GroupMember.id, User.username).join(User) \
+        .filter(GroupMember.group_id == ungrouped_id).order_by(GroupMember.id).all()
+    # 先按ID排序再打乱，保证同一个种子得到同样的结果
+    rng.shuffle(members)
+
+    plan = []
+    if fill_existing:
+        counts = db.session.query(Group.id, Group.name, Group.member_count, Group.capacity) \
+            .filter(Group.is_ungrouped == False).all()
+        limits = {group_id: min(members_per_group, capacity or members_per_group)
+                  for group_id, _, _, capacity in counts}
+        heap = [(count, group_id, name) for group_id, name, count, _ in counts if count < limits[group_id]]
+        heapq.heapify(heap)
+        entries = {}
+        while members and heap:
+            count, group_id, name = heapq.heappop(heap)
+            entry = entries.setdefault(group_id, {'group_id': group_id, 'name': name, 'new': False, 'members': []})
+            entry['members'].append(members.pop())
+            if count + 1 < limits[group_id]:
+                heapq.heappush(heap, (count + 1, group_id, name))
+        plan.extend(entries.values())
+
+    total_members = len(members)
+    if not total_members:
+        return plan
+
+    # 计算需要创建的组数
+    num_groups = (total_members + members_per_group - 1) // members_per_group
+
+    # 确保每组至少有2人(如果可能的话)
+    if num_groups > 1 and total_members / num_groups < 2:
+        num_groups = total_members // 2
+
+    # 计算基本每组人数和余数
+    base_members = total_members // num_groups
+    extra_members = total_members % num_groups
+
+    # 生成不重复的组名，只需要检查 "Group N" 形式的名称
+    existing_names = {name for (name,) in db.session.query(Group.name).filter(Group.name.like('Group %'))}
+    group_number = 0
+    member_index = 0
+    for i in range(num_groups):
+        group_number += 1
+        while f'Group {group_number}' in existing_names:
+            group_number += 1
+        current_group_size = base_members + (1 if i < extra_members else 0)
+        plan.append({
+            'group_id': None,
+            'name': f'Group {group_number}',
+            'new': True,
+            'members': members[member_index:member_index + current_group_size]
+        })
+        member_index += current_group_size
+    return plan
+
+def apply_auto_grouping(plan, ungrouped_id):
+    """在当前事务中执行分组方案：批量创建新组并批量更新成员所属组，由调用方统一提交
+
+    方案生成后如果有人同时加入了要补充的小组或移走了未分组的成员，抛出 GroupFull / MembersChanged，
+    整个方案回滚。
+    """
+    new_entries = [entry for entry in plan if entry['new']]
+    if new_entries:
+        # 新组的 ID 直接取自本次插入（一次 flush 批量写入），不按组名回查：同名小组可能被其他请求同时创建
+        groups = [Group(name=entry['name'], is_ungrouped=False) for entry in new_entries]
+        db.session.add_all(groups)
+        db.session.flush()
+        for entry, group in zip(new_entries, groups):
+            entry['group_id'] = group.id
+
+    assignments = [{'id': member_id, 'group_id': entry['group_id']}
+                   for entry in plan for member_id, _ in entry['members']]
+    if assignments:
+        deltas = {entry['group_id']: len(entry['members']) for entry in plan if entry['members']}
+        deltas[ungrouped_id] = -len(assignments)
+        change_member_counts(deltas)
+        check_member_groups({item['id']: ungrouped_id for item in assignments})
+        db.session.execute(update(GroupMember), assignments)
+
+@job_handler('auto_group', retry_on=(GroupFull, MembersChanged, OperationalError))
+def run_auto_group(job, params):
+    """生成方案并执行；方案生成后有人同时修改了相关小组时重试，按最新数据重新生成方案"""
+    ungrouped_id = db.session.query(Group.id).filter_by(is_ungrouped=True).scalar()
+    plan = plan_auto_grouping(ungrouped_id, params['members_per_group'], random.Random(params['seed']),
+                              params['fill_existing']) if ungrouped_id else []
+    if not plan:
+        raise ValueError('没有未分组的成员')
+
+    # 创建小组和分配成员在同一个事务中完成，失败时整体回滚
+    apply_auto_grouping(plan, ungrouped_id)
+    publish_event('board_changed', reason='auto_group')
+    num_created = sum(1 for entry in plan if entry['new'])
+    return {
+        'message': f'成功创建{num_created}个小组',
+        'groups': [{
+            'id': entry['group_id'],
+            'name': entry['name'],
+            'member_count': len(entry['members'])
+        } for entry in plan]
+    }
+
+@bp.route('/api/members/auto-group', methods=['POST'])
 @login_required
+@admin_required
 def auto_group_members():
-    if not current_user.is_admin:
-        return jsonify({'error': 'Unauthorized'}), 403
         
-    data = request.get_json()
-    members_per_group = data.get('members_per_group', 5)
+    data = request.get_json() or {}
+    try:
+        members_per_group = int(data.get('members_per_group', MAX_GROUP_MEMBERS))
+    except (TypeError, ValueError):
+        return jsonify({'error': '每组人数无效'}), 400
+    if not 1 <= members_per_group <= MAX_GROUP_MEMBERS:
+        return jsonify({'error': f'每组人数必须在1到{MAX_GROUP_MEMBERS}之间'}), 400
+    fill_existing = bool(data.get('fill_existing', False))
+    dry_run = bool(data.get('dry_run', False))
+    # 指定 seed 时分组结果可复现
+    seed = data.get('seed')
+    if seed is not None and not isinstance(seed, (int, str)):
+        return jsonify({'error': '随机种子必须是整数或字符串'}), 400
     
     try:
         # 获取未分组的成员
         ungrouped = Group.query.filter_by(is_ungrouped=True).first()
-        if not ungrouped:
+        if not ungrouped or not db.session.query(GroupMember.id).filter_by(group_id=ungrouped.id).first():
             return jsonify({'error': '没有未分组的成员'}), 400
-            
-        members = GroupMember.query.filter_by(group_id=ungrouped.id).all()
-        if not members:
+
+        if not dry_run:
+            # 实际分组交给后台任务，生成方案时读取的是执行时的最新数据
+            job = enqueue_job('auto_group', {'members_per_group': members_per_group,
+                                             'fill_existing': fill_existing, 'seed': seed})
+            return job_accepted(job, '正在自动分组')
+
+        plan = plan_auto_grouping(ungrouped.id, members_per_group, random.Random(seed), fill_existing)
+        if not plan:
             return jsonify({'error': '没有未分组的成员'}), 400
-        
-        # 随机打乱成员顺序
-        import random
-        random.shuffle(members)
-        
-        # 计算需要创建的组数
-        total_members = len(members)
-        num_groups = (total_members + members_per_group - 1) // members_per_group
-        
-        # 确保每组至少有2人(如果可能的话)
-        if num_groups > 1 and total_members / num_groups < 2:
-            num_groups = total_members // 2
-        
-        # 计算基本每组人数和余数
-        base_members = total_members // num_groups
-        extra_members = total_members % num_groups
-        
-        # 创建新组
-        new_groups = []
-        existing_names = set(g.name for g in Group.query.filter_by(is_ungrouped=False).all())
-        
-        for i in range(num_groups):
-            # 生成不重复的组名
-            group_number = i + 1
-            group_name = f'Group {group_number}'
-            while group_name in existing_names:
-                group_number += 1
-                group_name = f'Group {group_number}'
-            
-            group = Group(name=group_name)
-            db.session.add(group)
-            db.session.commit()
-            new_groups.append(group)
-            existing_names.add(group_name)
-        
-        # 分配成员到组
-        member_index = 0
-        for i, group in enumerate(new_groups):
-            # 计算当前组应该分配的成员数
-            current_group_size = base_members + (1 if i < extra_members else 0)
-            
-            # 分配成员
-            for _ in range(current_group_size):
-                if member_index < len(members):
-                    members[member_index].group_id = group.id
-                    member_index += 1
-        
-        db.session.commit()
+
         return jsonify({
             'success': True,
-            'message': f'成功创建{num_groups}个小组',
+            'dry_run': True,
+            'message': f'预计分配到{len(plan)}个小组',
             'groups': [{
-                'id': g.id,
-                'name': g.name,
-                'member_count': len([m for m in members if m.group_id == g.id])
-            } for g in new_groups]
+                'id': entry['group_id'],
+                'name': entry['name'],
+                'new': entry['new'],
+                'members': [username for _, username in entry['members']],
+                'member_count': len(entry['members'])
+            } for entry in plan]
         })
     except Exception as e:
         db.session.rollback()
-        app.logger.error(f'自动分组失败: {str(e)}')
+        current_app.logger.error(f'自动分组失败: {str(e)}')
         return jsonify({'error': f'自动分组失败: {str(e)}'}), 500
 
-@app.route('/admin/change-password', methods=['GET', 'POST'])
+@bp.route('/admin/change-password', methods=['GET', 'POST'])
 @login_required
 @admin_required
 def change_password():
@@ -632,14 +1963,20 @@ def change_password():
             if new_password != confirm_password:
                 return jsonify({'error': '两次输入的新密码不一致'}), 400
                 
-            if not check_password_hash(current_user.password_hash, current_password):
-                return jsonify({'error': '当前密码错误'}), 400
-                
             if len(new_password) < 6:
                 return jsonify({'error': '新密码长度不能少于6个字符'}), 400
-                
-            current_user.password_hash = generate_password_hash(new_password)
+
+            user = db.session.get(User, current_user.id)
+            with password_hash_slot() as acquired:
+                if not acquired:
+                    return busy_response('服务器繁忙，请稍后重试')
+                if not check_password_hash(user.password_hash, current_password):
+                    return jsonify({'error': '当前密码错误'}), 400
+                user.password_hash = generate_password_hash(new_password)
+            forget_users()
             db.session.commit()
+            # 其他设备上的旧会话失效，当前会话换成新令牌
+            session['auth_token'] = auth_token(user.password_hash)
             
             return jsonify({
                 'success': True,
@@ -647,69 +1984,201 @@ def change_password():
             })
         except Exception as e:
             db.session.rollback()
-            app.logger.error(f'修改密码失败: {str(e)}')
+            current_app.logger.error(f'修改密码失败: {str(e)}')
             return jsonify({'error': '修改密码失败，请重试'}), 500
     
     return render_template('change_password.html')
 
-@app.route('/upload/image', methods=['POST'])
+@bp.route('/upload/image', methods=['POST'])
 @login_required
 @admin_required
 @csrf.exempt
 def upload_image():
+    """编辑器图片上传
+
+    兼容 CKEditor（upload 字段，带 CKEditorFuncNum 参数）和 TinyMCE（file 字段，返回 JSON）。
+    文件以内容哈希命名，立即返回原图地址；缩略图在后台线程池中生成，完成后重新渲染引用了这张图片的
+    作业，页面显示时统一替换为缩略图并加上 srcset。
+    """
+    func_num = request.args.get('CKEditorFuncNum')
     try:
-        if 'upload' not in request.files:
-            return """
-                <script>
-                    window.parent.CKEDITOR.tools.callFunction({}, '', '没有文件被上传');
-                </script>
-            """.format(request.args.get('CKEditorFuncNum'))
-            
-        file = request.files['upload']
+        file = request.files.get('upload') or request.files.get('file')
+        if file is None:
+            return upload_response(func_num, message='没有文件被上传')
         if file.filename == '':
-            return """
-                <script>
-                    window.parent.CKEDITOR.tools.callFunction({}, '', '没有选择文件');
-                </script>
-            """.format(request.args.get('CKEditorFuncNum'))
-            
-        if file and allowed_file(file.filename):
-            # 确保文件名安全
-            filename = secure_filename(file.filename)
-            # 添加时间戳避免文件名冲突
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_')
-            filename = timestamp + filename
-            
-            # 确保上传目录存在
-            upload_path = os.path.join(app.root_path, app.config['UPLOAD_FOLDER'])
-            os.makedirs(upload_path, exist_ok=True)
-            
-            # 保存文件
-            file_path = os.path.join(upload_path, filename)
-            file.save(file_path)
-            
-            # 返回CKEditor所需的响应格式
-            url = url_for('static', filename=f'uploads/{filename}', _external=True)
-            return """
-                <script>
-                    window.parent.CKEDITOR.tools.callFunction({}, '{}');
-                </script>
-            """.format(request.args.get('CKEditorFuncNum'), url)
-        else:
-            return """
-                <script>
-                    window.parent.CKEDITOR.tools.callFunction({}, '', '不支持的文件类型');
-                </script>
-            """.format(request.args.get('CKEditorFuncNum'))
+            return upload_response(func_num, message='没有选择文件')
+        if not allowed_file(file.filename):
+            return upload_response(func_num, message='不支持的文件类型')
+
+        ext = file.filename.rsplit('.', 1)[1].lower()
+        ext = 'jpg' if ext == 'jpeg' else ext
+        store = current_app.extensions['image_store']
+        name, existed = store.save(file.stream, ext)
+        if existed:
+            current_app.logger.info(f'重复上传的图片，复用已有文件 {name}')
+
+        try:
+            store.verify(name)
+        except ValueError:
+            if not existed:
+                os.unlink(store.path(name))
+            return upload_response(func_num, message='不是有效的图片文件')
+        # 不等待缩略图，请求线程立即返回
+        store.generate_variants(name).add_done_callback(
+            partial(variants_ready, current_app._get_current_object(), current_shard().slug, name))
+
+        url = url_for('static', filename=f'uploads/{name}', _external=True)
+        return upload_response(func_num, url=url)
     except Exception as e:
-        app.logger.error(f'上传图片失败: {str(e)}')
-        return """
-            <script>
-                window.parent.CKEDITOR.tools.callFunction({}, '', '上传失败，请重试');
-            </script>
-        """.format(request.args.get('CKEditorFuncNum'))
-
-@app.route('/api/members/delete', methods=['POST'])
+        current_app.logger.error(f'上传图片失败: {str(e)}')
+        return upload_response(func_num, message='上传失败，请重试')
+
+def variants_ready(app, slug, name, future):
+    """缩略图生成完成（在生成缩略图的线程中调用）：保存作业时缩略图可能还没有生成，重新渲染引用了这张图片的作业"""
+    error = future.exception()
+    if error is not None:
+        app.logger.warning(f'生成缩略图失败 {name}: {error}')
+        return
+    if not future.result():
+        return
+    try:
+        with shard_context(app, slug):
+            render_tasks(image=name)
+    except Exception as e:
+        app.logger.error(f'缩略图生成后更新作业内容失败: {str(e)}')
+
+def upload_response(func_num, url='', message=''):
+    """按编辑器要求的格式返回上传结果"""
+    if func_num is None:
+        if message:
+            return jsonify({'error': message}), 400
+        return jsonify({'location': url})
+    return """
+        <script>
+            window.parent.CKEDITOR.tools.callFunction({}, '{}', '{}');
+        </script>
+    """.format(func_num, url, message)
+
+@bp.app_url_defaults
+def fingerprint_static(endpoint, values):
+    """url_for('static', filename=...) 指向构建好的带哈希文件"""
+    if endpoint == 'static' and 'filename' in values:
+        hashed = current_app.extensions['asset_manifest'].get(values['filename'])
+        if hashed:
+            values['filename'] = f'{assets.DIST_DIR}/{hashed}'
+
+def serve_static(filename):
+    """替换 Flask 默认的静态文件视图
+
+    带哈希的文件内容不会变化，允许浏览器缓存一年且不必重新验证；
+    浏览器支持时直接返回构建时预先压缩好的 .br / .gz 文件。
+    """
+    prefix = assets.DIST_DIR + '/'
+    if not filename.startswith(prefix):
+        return current_app.send_static_file(filename)
+
+    dist = os.path.join(current_app.static_folder, assets.DIST_DIR)
+    name = filename[len(prefix):]
+    mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+    encoding, suffix = None, ''
+    for candidate, candidate_suffix in (('br', '.br'), ('gzip', '.gz')):
+        path = safe_join(dist, name + candidate_suffix)
+        if candidate in request.accept_encodings and path and os.path.isfile(path):
+            encoding, suffix = candidate, candidate_suffix
+            break
+
+    response = send_from_directory(dist, name + suffix, mimetype=mimetype,
+                                   max_age=current_app.config['ASSETS_MAX_AGE'])
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+def class_option(f):
+    """命令行命令的 --class 选项：在指定班级的数据库上执行，不指定时使用默认数据库"""
+    @click.option('--class', 'slug', metavar='SLUG', help='班级标识（默认使用默认数据库）')
+    @wraps(f)
+    def decorated_function(slug, *args, **kwargs):
+        if slug is not None:
+            if not current_app.extensions['shards'].exists(slug):
+                raise click.BadParameter(f'班级 {slug} 不存在', param_hint='--class')
+            g.shard = current_app.extensions['shards'].acquire(slug)
+        return f(*args, **kwargs)
+    return decorated_function
+
+@bp.cli.command('create-class')
+@click.argument('slug')
+@click.option('--admin-password', help='班级管理员 admin 的密码（默认随机生成）')
+def create_class(slug, admin_password):
+    """新建班级：创建班级数据库、管理员账号和默认分组，访问路径为 /c/<SLUG>/"""
+    router = current_app.extensions['shards']
+    if not valid_slug(slug):
+        raise click.BadParameter('只能包含小写字母、数字和连字符，且不能以连字符开头', param_hint='SLUG')
+    if router.exists(slug):
+        raise click.ClickException(f'班级 {slug} 已存在')
+    open(router.path(slug), 'x').close()
+    try:
+        g.shard = router.acquire(slug)
+    except Exception:
+        os.unlink(router.path(slug))
+        raise
+    password = admin_password or secrets.token_urlsafe(9)
+    admin = User.query.filter_by(username='admin').one()
+    admin.password_hash = generate_password_hash(password)
+    forget_users()
+    db.session.commit()
+    click.echo(f'已创建班级 {slug}，访问路径 /c/{slug}/')
+    click.echo(f'管理员账号：admin，密码：{password}')
+
+@bp.cli.command('list-classes')
+def list_classes():
+    """列出所有班级及其数据库文件大小"""
+    router = current_app.extensions['shards']
+    slugs = router.slugs()
+    for slug in slugs:
+        size = os.path.getsize(router.path(slug))
+        click.echo(f'{slug}\t{size / 1024 / 1024:.1f} MB\t/c/{slug}/')
+    click.echo(f'共 {len(slugs)} 个班级')
+
+@bp.cli.command('gc-uploads')
+@click.option('--min-age', default=86400, show_default=True, help='只清理上传超过该秒数的文件')
+@click.option('--dry-run', is_flag=True, help='只列出将要删除的文件')
+def gc_uploads(min_age, dry_run):
+    """删除没有被任何作业引用的上传文件（上传目录由所有班级共用，检查所有班级的作业和已归档的作业）"""
+    app = current_app._get_current_object()
+
+    def contents():
+        for slug in [None] + app.extensions['shards'].slugs():
+            with shard_context(app, slug):
+                for (content,) in db.session.query(Task.content).execution_options(yield_per=500):
+                    yield content
+                yield from archive_store().contents()
+
+    removed = current_app.extensions['image_store'].collect_orphans(contents(), min_age, dry_run)
+    for name in removed:
+        click.echo(name)
+    click.echo(f"{'将删除' if dry_run else '已删除'} {len(removed)} 个文件")
+
+@bp.cli.command('render-tasks')
+@click.option('--force', is_flag=True, help='全部重新生成（例如缩略图在作业保存后才生成完成）')
+@class_option
+def render_tasks_command(force):
+    """清理作业内容并生成摘要（新版本首次启动时会自动处理尚未处理的作业）"""
+    count = render_tasks(force=force)
+    click.echo(f'已处理 {count} 个作业')
+
+@bp.cli.command('recount-groups')
+@class_option
+def recount_groups():
+    """按组员表重新计算各小组的人数（手工修改过数据库后使用）"""
+    recount_members()
+    publish_event('board_changed', reason='recount')
+    db.session.commit()
+    click.echo('已重新计算小组人数')
+
+@bp.route('/api/members/delete', methods=['POST'])
 @login_required
 @admin_required
 def delete_member():
@@ -726,6 +2195,10 @@ def delete_member():
         if not member:
             return jsonify({'error': '成员不存在'}), 404
             
+        Submission.query.filter_by(member_id=member.id).delete()
+        change_member_counts({member.group_id: -1})
+        check_member_groups({member.id: member.group_id})
+        publish_event('member_deleted', member_id=member.id, group_id=member.group_id)
         db.session.delete(member)
         db.session.commit()
         
@@ -733,56 +2206,1047 @@ def delete_member():
             'success': True,
             'message': '成员删除成功'
         })
+    except MembersChanged as e:
+        return conflict_response(e)
     except Exception as e:
         db.session.rollback()
-        app.logger.error(f'删除成员失败: {str(e)}')
+        current_app.logger.error(f'删除成员失败: {str(e)}')
         return jsonify({'error': '删除成员失败，请重试'}), 500
 
-def init_db():
-    with app.app_context():
-        # 创建所有表（如果不存在）
-        db.create_all()
-        
-        # 检查是否需要创建管理员用户
-        admin = User.query.filter_by(username='admin').first()
-        if not admin:
-            admin = User(
-                username='admin',
-                password_hash=generate_password_hash('admin'),
-                is_admin=True
-            )
-            db.session.add(admin)
-            print('创建管理员用户成功')
-        
-        # 检查是否需要创建分组
-        if not Group.query.first():
-            # 创建未分组
-            ungrouped = Group(name='未分组', is_ungrouped=True)
-            db.session.add(ungrouped)
-            
-            # 创建12个默认分组
-            for i in range(1, 13):
-                group = Group(name=f'第{i}组', is_ungrouped=False)
-                db.session.add(group)
-            
+def build_board_json():
+    """返回 (JSON 字节串, gzip 压缩后的字节串或 None)"""
+    body = json.dumps(serialize_board(current_task()), ensure_ascii=False,
+                      separators=(',', ':')).encode('utf-8')
+    compressed = None
+    if len(body) >= current_app.config['BOARD_GZIP_MIN_SIZE']:
+        compressed = gzip.compress(body, compresslevel=6)
+    return body, compressed
+
+@bp.route('/api/board')
+def board_snapshot():
+    """看板 JSON 快照，供教室大屏轮询
+
+    ETag 由看板版本号生成，版本号保存在共享内存文件中，内容未变化时直接返回 304，不查询数据库。
+    成员以 [id, 用户名, 是否完成] 的数组形式输出以减小体积，较大的响应按 gzip 压缩。
+    """
+    use_gzip = 'gzip' in request.accept_encodings
+    # 先读版本号再查询，保证返回的数据不会比 ETag 旧
+    board_version = current_shard().board_version
+    version = board_version.get()
+    base_etag = board_version.format_etag(version)
+    etag = base_etag + '-gzip' if use_gzip else base_etag
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        body, compressed = cached_board('board_json', build_board_json, version)
+        if use_gzip and compressed is not None:
+            response = Response(compressed, mimetype='application/json')
+            response.headers['Content-Encoding'] = 'gzip'
+        else:
+            response = Response(body, mimetype='application/json')
+            etag = base_etag
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.vary.add('Accept-Encoding')
+    return response
+
+@bp.route('/api/cache/stats')
+@login_required
+@admin_required
+def cache_stats():
+    """看板缓存命中情况，用于监控；fragments 为小组卡片片段缓存"""
+    stats = current_app.extensions['board_cache'].stats()
+    stats['fragments'] = current_app.extensions['fragment_cache'].stats()
+    return jsonify(stats)
+
+EXPORT_HEADER = ['作业', '发布时间', '截止时间', '小组', '成员', '状态', '完成时间']
+
+def parse_export_range(args):
+    """解析导出的日期范围 ?start=YYYY-MM-DD&end=YYYY-MM-DD（按作业发布日期，两端都包含），格式错误时抛出 ValueError"""
+    start = datetime.strptime(args['start'], '%Y-%m-%d') if args.get('start') else None
+    end = datetime.strptime(args['end'], '%Y-%m-%d') + timedelta(days=1) if args.get('end') else None
+    return start, end
+
+def completion_select(*columns):
+    """作业的完成情况：columns 之后依次为小组、成员、状态、完成时间，按作业 → 小组 → 成员排序
+
+    每个作业与当前所有成员组合，没有提交记录的算作未完成（状态为空）。
+    """
+    return select(*columns, Group.name, User.username, Submission.status, Submission.updated_at) \
+        .select_from(Task) \
+        .join(GroupMember, true()) \
+        .join(Group, Group.id == GroupMember.group_id) \
+        .join(User, User.id == GroupMember.user_id) \
+        .outerjoin(Submission, (Submission.task_id == Task.id) & (Submission.member_id == GroupMember.id)) \
+        .order_by(Task.created_at, Task.id, Group.is_ungrouped, Group.id, GroupMember.id)
+
+def export_rows(start, end):
+    """按作业 → 小组 → 成员的顺序逐行产生完成情况
+
+    通过 yield_per 分批从游标读取，不会一次把结果全部载入内存。
+    """
+    stmt = completion_select(Task.title, Task.created_at, Task.deadline)
+    if start:
+        stmt = stmt.where(Task.created_at >= start)
+    if end:
+        stmt = stmt.where(Task.created_at < end)
+    for title, created_at, deadline, group_name, username, status, updated_at in \
+            db.session.execute(stmt.execution_options(yield_per=EXPORT_BATCH_SIZE)):
+        yield (title, created_at, deadline, group_name, username,
+               '已完成' if status else '未完成', updated_at if status else None)
+
+@bp.route('/api/export')
+@login_required
+@admin_required
+def export_completion():
+    """导出完成情况：?format=csv|xlsx&start=&end=
+
+    边查询边输出，导出的行数不影响工作进程的内存占用；CSV 在客户端支持时按 gzip 压缩传输
+    （XLSX 本身已经是压缩格式）。
+    """
+    file_format = request.args.get('format', 'csv')
+    if file_format not in ('csv', 'xlsx'):
+        return jsonify({'error': '不支持的导出格式'}), 400
+    try:
+        start, end = parse_export_range(request.args)
+    except ValueError:
+        return jsonify({'error': '无效的日期格式'}), 400
+    if start and end and start >= end:
+        return jsonify({'error': '开始日期不能晚于结束日期'}), 400
+
+    rows = export_rows(start, end)
+    headers = {'X-Accel-Buffering': 'no'}
+    if file_format == 'xlsx':
+        body = exports.xlsx_stream(EXPORT_HEADER, rows, sheet_name='完成情况')
+        mimetype = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    else:
+        body = exports.csv_stream(EXPORT_HEADER, rows)
+        mimetype = 'text/csv'
+        if 'gzip' in request.accept_encodings:
+            body = exports.gzip_stream(body)
+            headers['Content-Encoding'] = 'gzip'
+    span = '-'.join(value for value in (request.args.get('start'), request.args.get('end')) if value)
+    filename = f'completion{"-" + span if span else ""}.{file_format}'
+    response = Response(stream_with_context(body), mimetype=mimetype, headers=headers)
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.vary.add('Accept-Encoding')
+    return response
+
+def archive_path(database):
+    """业务数据库对应的归档数据库，和业务数据库放在同一目录（见 archive.py）"""
+    base, _ = os.path.splitext(database)
+    return f'{base}.archive.db'
+
+def archive_store():
+    """当前分片的归档数据库"""
+    return ArchiveStore(archive_path(current_shard().engine.url.database),
+                        busy_timeout=current_app.config['SQLITE_BUSY_TIMEOUT'])
+
+def current_roster():
+    """当前的分组名单：[{'name', 'capacity', 'is_ungrouped', 'members': [用户名, ...]}, ...]"""
+    groups = {}
+    rows = db.session.query(Group.id, Group.name, Group.capacity, Group.is_ungrouped, User.username) \
+        .outerjoin(GroupMember, GroupMember.group_id == Group.id) \
+        .outerjoin(User, User.id == GroupMember.user_id) \
+        .order_by(Group.is_ungrouped, Group.id, GroupMember.id)
+    for group_id, name, capacity, is_ungrouped, username in rows:
+        group = groups.setdefault(group_id, {'name': name, 'capacity': capacity,
+                                             'is_ungrouped': bool(is_ungrouped), 'members': []})
+        if username is not None:
+            group['members'].append(username)
+    return list(groups.values())
+
+def archive_task_query():
+    return db.session.query(Task.id, Task.title, Task.content, Task.content_html, Task.excerpt,
+                            Task.created_at, Task.deadline).order_by(Task.id)
+
+def add_archive_tasks(store, term_id, tasks):
+    """把一批作业连同完成情况写入归档，返回作业 ID 列表"""
+    ids = [task.id for task in tasks]
+    completion = {task_id: [] for task_id in ids}
+    for task_id, group_name, username, status, updated_at in \
+            db.session.execute(completion_select(Task.id).where(Task.id.in_(ids))):
+        completion[task_id].append((group_name, username, status, updated_at if status else None))
+    store.add_tasks(term_id, [dict(task._asdict(), completion=completion[task.id]) for task in tasks])
+    return ids
+
+def archive_task_batch(store, term_id, before):
+    """把 before 之前发布的下一批作业连同完成情况写入归档，并在当前事务中从业务数据库删除，返回作业数"""
+    tasks = archive_task_query().filter(Task.created_at < before).limit(ARCHIVE_BATCH_SIZE).all()
+    if not tasks:
+        return 0
+    # 先写入归档再删除：删除没有提交时重试会覆盖写入同样的内容
+    ids = add_archive_tasks(store, term_id, tasks)
+    Submission.query.filter(Submission.task_id.in_(ids)).delete(synchronize_session=False)
+    Task.query.filter(Task.id.in_(ids)).delete(synchronize_session=False)
+    return len(ids)
+
+def save_completion(store, term_id):
+    """重置分组前，把仍留在业务数据库中的作业的完成情况复制到归档，返回作业数
+
+    重置删除所有成员，完成记录随之删除，作业本身保留。恢复该学期时这些作业不会重复创建，
+    完成情况按用户名重新对应到当时的成员（见 restore_task）。
+    """
+    count = 0
+    after_id = 0
+    while True:
+        tasks = archive_task_query().filter(
+            Task.id > after_id,
+            Task.id.in_(select(Submission.task_id).where(Submission.status == True))
+        ).limit(ARCHIVE_BATCH_SIZE).all()
+        if not tasks:
+            return count
+        add_archive_tasks(store, term_id, tasks)
+        after_id = tasks[-1].id
+        count += len(tasks)
+
+@job_handler('archive_term', retry_on=(OperationalError, sqlite3.OperationalError))
+def run_archive_term(job, params):
+    """归档学期：把截止日期前发布的作业分批移到归档数据库，然后保存分组名单（可选），最后可选重置分组
+
+    每批单独提交并记录断点，归档大量作业时不会长时间占用写锁；中断后重试时接着归档剩下的作业。
+    """
+    store = archive_store()
+    before = datetime.strptime(params['before'], '%Y-%m-%d')
+    state = job.state
+    if state is None:
+        state = {'term_id': store.create_term(params['name']), 'tasks': 0}
+        job.checkpoint(0, state=state)
+    total = state['tasks'] + Task.query.filter(Task.created_at < before).count()
+    try:
+        while True:
+            count = archive_task_batch(store, state['term_id'], before)
+            if not count:
+                break
+            state['tasks'] += count
+            publish_event('board_changed', reason='archive')
+            job.checkpoint(state['tasks'], total, f'已归档 {state["tasks"]}/{total} 个作业', state)
+    except JobCancelled:
+        store.refresh_term(state['term_id'])
+        raise
+
+    if params['roster'] or params['reset_groups']:
+        store.save_roster(state['term_id'], current_roster())
+    if params['reset_groups']:
+        save_completion(store, state['term_id'])
+        reset_all_groups()
+    store.refresh_term(state['term_id'])
+    return {'message': f'已归档 {state["tasks"]} 个作业', 'term_id': state['term_id']}
+
+def restore_task(item, members):
+    """在当前事务中恢复一个归档的作业，返回因成员已不存在而无法恢复的完成记录数
+
+    重置分组时保存的作业仍在业务数据库中（见 save_completion），只恢复完成情况，已有的完成记录不覆盖。
+    """
+    task = db.session.get(Task, item['id'])
+    # 归档中的发布时间精确到秒；ID 相同而发布时间不同的，是后来新发布、复用了这个 ID 的作业
+    if task is None or task.created_at is None or task.created_at.replace(microsecond=0) != item['created_at']:
+        task = Task(title=item['title'], content=item['content'], content_html=item['content_html'],
+                    excerpt=item['excerpt'], content_hash=task_content.content_hash(item['content']),
+                    created_at=item['created_at'], deadline=item['deadline'])
+        db.session.add(task)
+        db.session.flush()
+    rows = []
+    skipped = 0
+    for group_name, username, status, updated_at in item['completion']:
+        if not status:
+            continue
+        member_id = members.get(username)
+        if member_id is None:
+            skipped += 1
+            continue
+        rows.append({'task_id': task.id, 'member_id': member_id, 'status': True, 'updated_at': updated_at})
+    if rows:
+        db.session.execute(sqlite_insert(Submission).on_conflict_do_nothing(
+            index_elements=['task_id', 'member_id']), rows)
+    return skipped
+
+@job_handler('restore_term', retry_on=(OperationalError, sqlite3.OperationalError))
+def run_restore_term(job, params):
+    """把归档学期的作业和完成情况恢复到业务数据库，恢复后从归档中删除
+
+    完成情况按用户名对应到当前的成员。每批恢复的作业和断点在同一个事务中提交，之后才从归档中删除，
+    中断后重试时先删除上次已恢复的部分，不会重复恢复。
+    """
+    store = archive_store()
+    term_id = params['term_id']
+    state = job.state or {'after_id': 0, 'tasks': 0, 'skipped': 0}
+    store.delete_tasks(term_id, state['after_id'])
+    total = state['tasks'] + store.count_tasks(term_id, state['after_id'])
+    members = dict(db.session.query(User.username, GroupMember.id).join(GroupMember, GroupMember.user_id == User.id))
+    try:
+        while True:
+            batch = store.load_tasks(term_id, state['after_id'], ARCHIVE_BATCH_SIZE)
+            if not batch:
+                break
+            for item in batch:
+                state['skipped'] += restore_task(item, members)
+            state['after_id'] = batch[-1]['id']
+            state['tasks'] += len(batch)
+            publish_event('board_changed', reason='restore')
+            job.checkpoint(state['tasks'], total, f'已恢复 {state["tasks"]}/{total} 个作业', state)
+            store.delete_tasks(term_id, state['after_id'])
+    except JobCancelled:
+        store.delete_tasks(term_id, state['after_id'])
+        store.refresh_term(term_id)
+        raise
+
+    store.refresh_term(term_id)
+    message = f'已恢复 {state["tasks"]} 个作业'
+    if state['skipped']:
+        message += f'，{state["skipped"]} 条完成记录的成员已不存在，未恢复'
+    return {'message': message, 'skipped': state['skipped']}
+
+@bp.route('/admin/archive')
+@login_required
+@admin_required
+def archive_index():
+    """已归档的学期列表，以及归档新学期的表单"""
+    return render_template('archive.html', terms=archive_store().terms())
+
+@bp.route('/admin/archive/<int:term_id>')
+@login_required
+@admin_required
+def archive_term(term_id):
+    """归档学期的作业列表和分组名单（只读）"""
+    term = archive_store().term(term_id)
+    if term is None:
+        abort(404)
+    return render_template('archive_term.html', term=term)
+
+@bp.route('/admin/archive/<int:term_id>/tasks/<int:task_id>')
+@login_required
+@admin_required
+def archive_task(term_id, task_id):
+    """归档作业的内容和各成员的完成情况（只读）"""
+    store = archive_store()
+    term = store.term(term_id)
+    task = store.task(term_id, task_id) if term else None
+    if task is None:
+        abort(404)
+    return render_template('archive_task.html', term=term, task=task)
+
+@bp.route('/api/archive', methods=['POST'])
+@login_required
+@admin_required
+def create_archive():
+    """归档学期：{name, before: YYYY-MM-DD, roster, reset_groups}，在后台任务中执行"""
+    data = request.get_json(silent=True) or {}
+    name = (data.get('name') or '').strip()
+    if not name or len(name) > 100:
+        return jsonify({'error': '请输入学期名称（不超过100个字符）'}), 400
+    try:
+        before = datetime.strptime(data.get('before') or '', '%Y-%m-%d')
+    except ValueError:
+        return jsonify({'error': '无效的日期格式'}), 400
+    params = {'name': name, 'before': data['before'],
+              'roster': bool(data.get('roster')), 'reset_groups': bool(data.get('reset_groups'))}
+    if not (params['roster'] or params['reset_groups']) and \
+            db.session.query(Task.id).filter(Task.created_at < before).first() is None:
+        return jsonify({'error': '该日期之前没有需要归档的作业'}), 400
+
+    try:
+        return job_accepted(enqueue_job('archive_term', params), '正在归档')
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f'创建归档任务失败: {str(e)}')
+        return jsonify({'error': '创建归档任务失败，请重试'}), 500
+
+@bp.route('/api/archive/<int:term_id>/restore', methods=['POST'])
+@login_required
+@admin_required
+def restore_archive(term_id):
+    """把归档学期的作业恢复到当前学期，在后台任务中执行"""
+    term = archive_store().term(term_id)
+    if term is None:
+        return jsonify({'error': '归档学期不存在'}), 404
+    if not term['task_count']:
+        return jsonify({'error': '该学期没有可以恢复的作业'}), 400
+    try:
+        return job_accepted(enqueue_job('restore_term', {'term_id': term_id}), '正在恢复')
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f'创建恢复任务失败: {str(e)}')
+        return jsonify({'error': '创建恢复任务失败，请重试'}), 500
+
+def database_files(app):
+    """需要备份的所有数据库 [(备份中的名称, 路径)]：默认数据库、各班级数据库，以及各自的归档数据库"""
+    router = app.extensions['shards']
+    default = router.default.engine.url.database
+    files = [(os.path.basename(default), default)]
+    files += [(f'classes/{slug}.db', router.path(slug)) for slug in router.slugs()]
+    return [entry for name, path in files for entry in ((name, path), (archive_path(name), archive_path(path)))]
+
+def backup_target(app, name):
+    """备份中的文件名对应的数据库路径（database_files 的反向映射）"""
+    if name.startswith('classes/'):
+        return os.path.join(app.extensions['shards'].directory, name[len('classes/'):])
+    return os.path.join(os.path.dirname(app.extensions['shards'].default.engine.url.database), name)
+
+@job_handler('backup', retry_on=(sqlite3.OperationalError,))
+def run_backup(job, params):
+    """备份所有数据库；失败时整份备份作废，重试时重新开始"""
+    sources = database_files(current_app)
+    job.checkpoint(0, len(sources), '正在备份…')
+    manifest = current_app.extensions['backups'].create(
+        sources, progress=lambda done, total, name: job.checkpoint(done, total, f'已备份 {name}'))
+    size = sum(entry['compressed_size'] for entry in manifest['files'])
+    return {'message': f'已备份 {len(manifest["files"])} 个数据库（压缩后 {size / 1024 / 1024:.1f} MB）',
+            'name': manifest['name']}
+
+@bp.route('/api/backups', methods=['GET'])
+@login_required
+@admin_required
+def list_backups():
+    """已有的备份（所有班级共用，只有默认数据库的管理员可以查看和创建）"""
+    if current_shard().slug is not None:
+        abort(404)
+    return jsonify({'backups': current_app.extensions['backups'].list()})
+
+@bp.route('/api/backups', methods=['POST'])
+@login_required
+@admin_required
+def create_backup():
+    if current_shard().slug is not None:
+        abort(404)
+    try:
+        return job_accepted(enqueue_job('backup', {}), '正在备份')
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f'创建备份任务失败: {str(e)}')
+        return jsonify({'error': '创建备份任务失败，请重试'}), 500
+
+@bp.cli.command('backup')
+def backup_command():
+    """立即备份所有数据库（可以在服务运行时执行）"""
+    app = current_app._get_current_object()
+    manifest = app.extensions['backups'].create(
+        database_files(app), progress=lambda done, total, name: click.echo(f'[{done}/{total}] {name}'))
+    click.echo(f'备份完成：{manifest["name"]}，耗时 {manifest["seconds"]:.1f}s')
+
+@bp.cli.command('list-backups')
+def list_backups_command():
+    """列出已有的备份"""
+    backups = current_app.extensions['backups'].list()
+    for manifest in backups:
+        size = sum(entry['compressed_size'] for entry in manifest['files'])
+        click.echo(f'{manifest["name"]}\t{len(manifest["files"])} 个数据库\t{size / 1024 / 1024:.1f} MB')
+    click.echo(f'共 {len(backups)} 份备份')
+
+@bp.cli.command('restore-backup')
+@click.argument('name')
+def restore_backup_command(name):
+    """校验并准备恢复备份 NAME，下次创建应用（启动服务）时换上；请先停止服务。备份之后新建的班级不受影响"""
+    app = current_app._get_current_object()
+    try:
+        targets = app.extensions['backups'].stage_restore(name, lambda file_name: backup_target(app, file_name))
+    except BackupError as e:
+        raise click.ClickException(str(e))
+    for target in targets:
+        click.echo(f'待恢复：{target}')
+    click.echo('请启动服务，启动时会换上备份，原来的文件改名为 *.pre-restore 保留')
+
+@bp.route('/api/jobs/<int:job_id>')
+@login_required
+@admin_required
+def job_status(job_id):
+    """后台任务的状态、进度和结果，页面每隔一段时间轮询一次"""
+    job = db.session.get(Job, job_id)
+    if job is None:
+        return jsonify({'error': '任务不存在'}), 404
+    return jsonify(serialize_job(job))
+
+@bp.route('/api/jobs/<int:job_id>/cancel', methods=['POST'])
+@login_required
+@admin_required
+def cancel_job(job_id):
+    """取消任务：排队中的直接取消；执行中的在下一个断点停止，已提交的部分保留"""
+    try:
+        now = datetime.utcnow()
+        result = db.session.execute(update(Job).where(Job.id == job_id, Job.status == 'queued')
+                                    .values(status='cancelled', error='已取消', finished_at=now))
+        if result.rowcount != 1:
+            result = db.session.execute(update(Job).where(Job.id == job_id, Job.status == 'running')
+                                        .values(cancel_requested=True))
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f'取消任务失败: {str(e)}')
+        return jsonify({'error': '取消任务失败，请重试'}), 500
+    job = db.session.get(Job, job_id)
+    if job is None:
+        return jsonify({'error': '任务不存在'}), 404
+    if result.rowcount != 1:
+        return jsonify({'error': '任务已结束', 'job': serialize_job(job)}), 409
+    return jsonify({'success': True, 'job': serialize_job(job)})
+
+def page_limit(default):
+    try:
+        return max(1, min(int(request.args.get('limit', default)), MAX_PAGE_SIZE))
+    except ValueError:
+        return default
+
+@bp.route('/api/tasks', methods=['GET'])
+@login_required
+@admin_required
+def list_tasks():
+    """作业列表分页：?before=<上一页返回的 next>&limit=20"""
+    before = request.args.get('before')
+    try:
+        before = decode_task_cursor(before) if before else None
+    except ValueError:
+        return jsonify({'error': '无效的分页参数'}), 400
+    tasks, next_cursor = load_task_page(before, page_limit(ADMIN_TASK_PAGE_SIZE))
+    return jsonify({'tasks': [serialize_task_row(task) for task in tasks], 'next': next_cursor})
+
+@bp.route('/api/groups', methods=['GET'])
+@login_required
+@admin_required
+def list_groups():
+    """小组摘要分页：?after=<上一页返回的 next>&limit=24，或 ?ids=1,2,3 读取指定的小组"""
+    try:
+        ids = request.args.get('ids')
+        if ids:
+            ids = [int(group_id) for group_id in ids.split(',')][:MAX_PAGE_SIZE]
+            groups, next_cursor = load_group_page(ids=ids)
+        else:
+            after = request.args.get('after')
+            groups, next_cursor = load_group_page(int(after) if after else None,
+                                                  page_limit(ADMIN_GROUP_PAGE_SIZE))
+    except ValueError:
+        return jsonify({'error': '无效的分页参数'}), 400
+    # 完成人数对应的作业，页面据此判断状态变更事件是否属于当前作业
+    task = current_task()
+    return jsonify({'groups': groups, 'next': next_cursor, 'task_id': task.id if task else None})
+
+@bp.route('/api/groups/<int:group_id>/members')
+@login_required
+@admin_required
+def list_group_members(group_id):
+    """展开小组卡片时加载成员及其在最新作业中的完成状态"""
+    if db.session.get(Group, group_id) is None:
+        return jsonify({'error': '小组不存在'}), 404
+    task = current_task()
+    rows = db.session.query(GroupMember.id, User.username, Submission.status) \
+        .join(User, User.id == GroupMember.user_id) \
+        .outerjoin(Submission, (Submission.member_id == GroupMember.id) &
+                   (Submission.task_id == (task.id if task else None))) \
+        .filter(GroupMember.group_id == group_id) \
+        .order_by(GroupMember.id).all()
+    return jsonify({'members': [{'id': member_id, 'username': username, 'completed': bool(status)}
+                                for member_id, username, status in rows]})
+
+@bp.before_app_request
+def start_job_runner():
+    # 处理第一个请求时才启动本进程的任务线程：gunicorn 在 fork 之后才有请求，命令行和脚本中创建应用时也不会启动
+    current_app.extensions['jobs'].start()
+
+@bp.before_app_request
+def start_request_timing():
+    if current_app.extensions['metrics'] is not None:
+        g.timings = {'started': time.perf_counter(), 'queries': 0, 'db': 0.0,
+                     'template': 0.0, 'hash': 0.0, 'hash_wait': 0.0}
+
+@bp.before_app_request
+def admit_write():
+    """修改数据的 /api/ 请求进入业务代码之前：按用户和 IP 限流、合并重复请求、取得写入名额（见 admission.py）
+
+    只有限流对所有请求生效；未登录或没有权限的请求随后由 login_required/admin_required 拒绝，
+    不参与合并，也不占用写入名额。
+    """
+    if request.method not in WRITE_METHODS or not request.path.startswith('/api/'):
+        return None
+    config = current_app.config
+    buckets = current_app.extensions['rate_limits']
+    shard = current_shard()
+    limits = [(f'ip:{request.remote_addr}', config['RATE_LIMIT_IP_RATE'], config['RATE_LIMIT_IP_BURST'])]
+    if current_user.is_authenticated:
+        limits.append((f'user:{shard.slug}:{current_user.id}',
+                       config['RATE_LIMIT_USER_RATE'], config['RATE_LIMIT_USER_BURST']))
+    for key, rate, burst in limits:
+        if rate > 0:
+            retry_after = buckets.take(key, rate, burst)
+            if retry_after:
+                return busy_response('操作太频繁，请稍后重试', status=429, retry_after=retry_after)
+
+    view = current_app.view_functions.get(request.endpoint)
+    if not current_user.is_authenticated or (getattr(view, 'admin_only', False) and not current_user.is_admin):
+        return None
+
+    key_func = getattr(view, 'coalesce_key', None)
+    data = request.get_json(silent=True)
+    if key_func is not None and isinstance(data, dict) and config['STATUS_COALESCE_WINDOW'] > 0:
+        # 键中包含用户：只合并同一个人的重复点击，其他人的请求不会覆盖它
+        key = json.dumps([shard.slug, current_user.id, *key_func(data)], default=str)
+        if not current_app.extensions['coalescer'].admit(key):
+            # 窗口内同一用户随后又修改了同一成员，本次修改已被覆盖
+            return jsonify({'success': True, 'coalesced': True, 'message': '已合并到随后的修改'})
+
+    slot = shard.writers.acquire(config['WRITE_QUEUE_WAIT'])
+    if slot is None:
+        return busy_response('当前修改的人较多，请稍后重试')
+    g.writer_slot = slot
+
+@bp.teardown_app_request
+def release_writer_slot(exception=None):
+    slot = g.pop('writer_slot', None)
+    if slot is not None:
+        current_shard().writers.release(slot)
+
+@bp.after_app_request
+def record_request_timing(response):
+    """记录请求指标，并在 Server-Timing 响应头中给出本次请求各部分的耗时（浏览器开发者工具可直接查看）"""
+    timings = g.pop('timings', None)
+    if timings is None:
+        return response
+    duration = time.perf_counter() - timings['started']
+    current_app.extensions['metrics'].record_request(
+        request.endpoint or 'unmatched', request.method, response.status_code, duration, timings)
+    if current_app.config['SERVER_TIMING']:
+        parts = [f'app;dur={duration * 1000:.1f}',
+                 f'db;dur={timings["db"] * 1000:.1f};desc="{timings["queries"]} queries"']
+        if timings['template']:
+            parts.append(f'tpl;dur={timings["template"] * 1000:.1f}')
+        if timings['hash'] or timings['hash_wait']:
+            parts.append(f'hash;dur={timings["hash"] * 1000:.1f}')
+            parts.append(f'hash-wait;dur={timings["hash_wait"] * 1000:.1f}')
+        response.headers['Server-Timing'] = ', '.join(parts)
+    return response
+
+def start_template_timing(app, template, context, **extra):
+    timings = g.get('timings')
+    if timings is not None:
+        timings['template_started'] = time.perf_counter()
+
+def finish_template_timing(app, template, context, **extra):
+    timings = g.get('timings')
+    if timings is not None and 'template_started' in timings:
+        timings['template'] += time.perf_counter() - timings.pop('template_started')
+
+def instrument_engine(engine):
+    """统计每个请求执行的 SQL 条数和耗时"""
+    @event.listens_for(engine, 'before_cursor_execute')
+    def start_query_timing(conn, cursor, statement, parameters, context, executemany):
+        conn.info['query_started'] = time.perf_counter()
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def finish_query_timing(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info.pop('query_started', time.perf_counter())
+        timings = g.get('timings') if has_app_context() else None
+        if timings is not None:
+            timings['queries'] += 1
+            timings['db'] += elapsed
+
+@bp.route('/metrics')
+def metrics():
+    """Prometheus 格式的请求指标（所有工作进程合计），仅管理员或持有 METRICS_TOKEN 的抓取程序可以访问"""
+    collector = current_app.extensions['metrics']
+    if collector is None:
+        abort(404)
+    token = current_app.config['METRICS_TOKEN']
+    header = request.headers.get('Authorization', '')
+    # compare_digest 不接受含非 ASCII 字符的 str，两边都按字节比较
+    authorized = bool(token) and hmac.compare_digest(header.encode('utf-8'), f'Bearer {token}'.encode('utf-8'))
+    if not authorized and not (current_user.is_authenticated and current_user.is_admin):
+        abort(401 if header else 403)
+    return Response(collector.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@bp.route('/api/events')
+def board_events():
+    """SSE 推送看板变更；断线重连时根据 Last-Event-ID 补发错过的事件"""
+    broadcaster = current_shard().board_events
+    heartbeat = current_app.config['EVENTS_HEARTBEAT']
+    queue_size = current_app.config['EVENTS_QUEUE_SIZE']
+    try:
+        last_event_id = int(request.headers.get('Last-Event-ID') or 0)
+    except ValueError:
+        last_event_id = 0
+    try:
+        subscriber = broadcaster.subscribe()
+    except TooManyClients:
+        return Response('retry: 10000\n\n', status=503, mimetype='text/event-stream')
+
+    # 先订阅再补发，补发过的事件在队列中跳过
+    missed = []
+    if last_event_id:
+        missed = broadcaster.fetch_events(last_event_id, queue_size + 1)
+
+    # 生成器在请求上下文之外运行，长连接期间不占用数据库会话
+    def stream():
+        try:
+            yield 'retry: 3000\n\n'
+            seen_id = last_event_id
+            if len(missed) > queue_size:
+                yield format_sse(missed[-1][0], 'resync', {})
+                return
+            for event_id, event_type, payload in missed:
+                seen_id = event_id
+                yield format_sse(event_id, event_type, payload)
+            while True:
+                if subscriber.overflowed:
+                    # 客户端读取太慢，让它重新加载整个页面
+                    yield format_sse(seen_id, 'resync', {})
+                    return
+                try:
+                    event_id, event_type, payload = subscriber.queue.get(timeout=heartbeat)
+                except queue.Empty:
+                    yield ': ping\n\n'
+                    continue
+                if event_id <= seen_id:
+                    continue
+                seen_id = event_id
+                yield format_sse(event_id, event_type, payload)
+        finally:
+            broadcaster.unsubscribe(subscriber)
+
+    return Response(stream(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',  # 关闭 nginx 缓冲
+    })
+
+def create_event_broadcaster(app, shard):
+    """创建本进程某个分片的事件广播器，查询都在独立的应用上下文中执行"""
+    def fetch_events(after_id, limit):
+        with shard_context(app, shard):
+            return [tuple(row) for row in db.session.query(BoardEvent.id, BoardEvent.type, BoardEvent.payload)
+                    .filter(BoardEvent.id > (after_id or 0)).order_by(BoardEvent.id).limit(limit)]
+
+    def fetch_last_id():
+        with shard_context(app, shard):
+            return db.session.query(func.max(BoardEvent.id)).scalar() or 0
+
+    def prune():
+        with shard_context(app, shard):
+            cutoff = datetime.utcnow() - timedelta(seconds=app.config['EVENTS_RETENTION'])
+            BoardEvent.query.filter(BoardEvent.created_at < cutoff).delete()
+            db.session.commit()
+
+    return EventBroadcaster(fetch_events, fetch_last_id, prune,
+                            poll_interval=app.config['EVENTS_POLL_INTERVAL'],
+                            queue_size=app.config['EVENTS_QUEUE_SIZE'],
+                            max_clients=app.config['EVENTS_MAX_CLIENTS'])
+
+def create_job_runner(app):
+    """创建本进程的任务执行器，每个回调都在独立的应用上下文中执行
+
+    任务表在各班级自己的数据库中，任务以 (班级标识, 任务 ID) 标识。执行器只检查默认数据库和本进程
+    已打开的班级数据库：新任务入队时所在班级一定已经打开；没有打开的班级中心跳超时的任务，
+    等该班级下次被访问时再处理。
+    """
+    def claim_from(shard, worker_id):
+        with shard_context(app, shard):
+            now = datetime.utcnow()
+            job_id = db.session.query(Job.id).filter(Job.status == 'queued', Job.run_after <= now) \
+                .order_by(Job.id).limit(1).scalar()
+            if job_id is None:
+                return None
+            # 其他进程可能同时看到同一个任务，只有状态仍是 queued 时才能领到
+            result = db.session.execute(update(Job).where(Job.id == job_id, Job.status == 'queued').values(
+                status='running', worker=worker_id, attempts=Job.attempts + 1, cancel_requested=False,
+                started_at=func.coalesce(Job.started_at, now), heartbeat_at=now))
+            db.session.commit()
+            return (shard.slug, job_id) if result.rowcount == 1 else None
+
+    def claim(worker_id):
+        for shard in app.extensions['shards'].shards:
             try:
+                key = claim_from(shard, worker_id)
+            except (OperationalError, ShardClosed):
+                continue  # 这个班级的数据库正忙或刚被关闭，先看其他班级
+            if key is not None:
+                return key
+        return None
+
+    def execute(key, worker_id):
+        slug, job_id = key
+        with shard_context(app, slug):
+            run_job(job_id, worker_id)
+
+    def heartbeat(keys, worker_id):
+        by_shard = {}
+        for slug, job_id in keys:
+            by_shard.setdefault(slug, []).append(job_id)
+        for slug, job_ids in by_shard.items():
+            with shard_context(app, slug):
+                db.session.execute(update(Job).where(Job.id.in_(job_ids), Job.worker == worker_id,
+                                                     Job.status == 'running')
+                                   .values(heartbeat_at=datetime.utcnow()))
                 db.session.commit()
-                print('创建默认分组成功')
-            except Exception as e:
-                db.session.rollback()
-                print(f'创建默认分组失败：{str(e)}')
-                return
+
+    def recover():
+        for shard in app.extensions['shards'].shards:
+            try:
+                recover_jobs(shard)
+            except (OperationalError, ShardClosed):
+                pass
+        remove_stale_import_spools()
+
+    def remove_stale_import_spools():
+        """导入任务结束时删除自己的暂存文件；失败后不再重试的任务留下的文件，超过 JOB_RETENTION 秒后在这里删除"""
+        directory = import_spool_dir(app)
+        expired = time.time() - app.config['JOB_RETENTION']
+        try:
+            names = os.listdir(directory)
+        except FileNotFoundError:
+            return
+        for name in names:
+            path = os.path.join(directory, name)
+            try:
+                if os.path.getmtime(path) < expired:
+                    os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+    def schedule_backup():
+        """距离上次备份超过 BACKUP_INTERVAL 时在默认数据库中创建备份任务；多个进程用文件锁保证只创建一个"""
+        interval = timedelta(seconds=app.config['BACKUP_INTERVAL'])
+        store = app.extensions['backups']
+        latest = store.latest_time()
+        if not interval or (latest is not None and datetime.utcnow() - latest < interval):
+            return
+        with open(os.path.join(store.directory, '.schedule.lock'), 'w') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            with shard_context(app, None):
+                # 排队中、执行中或最近失败过的备份任务都不再重复创建
+                pending = Job.query.filter(Job.kind == 'backup').filter(
+                    Job.status.in_(['queued', 'running']) | (Job.created_at > datetime.utcnow() - interval)).first()
+                if pending is None:
+                    enqueue_job('backup', {'scheduled': True})
+
+    def recover_jobs(shard):
+        """心跳超时的任务：已要求取消的标记为取消，还有重试次数的放回队列，否则标记为失败"""
+        with shard_context(app, shard):
+            now = datetime.utcnow()
+            stale = (Job.status == 'running') & (Job.heartbeat_at < now - timedelta(seconds=app.config['JOB_STALE_AFTER']))
+            db.session.execute(update(Job).where(stale, Job.cancel_requested == True)
+                               .values(status='cancelled', error='已取消', finished_at=now))
+            db.session.execute(update(Job).where(stale, Job.attempts < Job.max_attempts)
+                               .values(status='queued', worker=None, run_after=now, error='执行任务的进程已退出'))
+            db.session.execute(update(Job).where(stale)
+                               .values(status='failed', finished_at=now, error='执行任务的进程已退出'))
+            Job.query.filter(Job.finished_at < now - timedelta(seconds=app.config['JOB_RETENTION'])).delete()
+            db.session.commit()
+
+    return JobRunner(claim, execute, heartbeat, recover,
+                     workers=app.config['JOB_WORKERS'],
+                     poll_interval=app.config['JOB_POLL_INTERVAL'],
+                     heartbeat_interval=app.config['JOB_HEARTBEAT_INTERVAL'],
+                     periodic=schedule_backup)
+
+@contextmanager
+def init_lock(app):
+    """多个工作进程同时启动时，用 instance 目录下的文件锁串行执行 init_db"""
+    os.makedirs(app.instance_path, exist_ok=True)
+    with open(os.path.join(app.instance_path, '.init.lock'), 'w') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def init_db(echo=print):
+    """创建数据表和默认数据，需在应用上下文中调用；作用于当前分片的数据库"""
+    # 创建所有表（如果不存在），再把已有数据库升级到最新结构
+    engine = current_shard().engine
+    db.metadata.create_all(engine)
+    migrations.upgrade(engine, log=echo)
+    
+    # 检查是否需要创建管理员用户
+    admin = User.query.filter_by(username='admin').first()
+    if not admin:
+        admin = User(
+            username='admin',
+            password_hash=generate_password_hash('admin'),
+            is_admin=True
+        )
+        db.session.add(admin)
+        echo('创建管理员用户成功')
+    
+    # 检查是否需要创建分组
+    if not Group.query.first():
+        # 创建未分组
+        ungrouped = Group(name='未分组', is_ungrouped=True)
+        db.session.add(ungrouped)
+        
+        # 创建12个默认分组
+        for i in range(1, 13):
+            group = Group(name=f'第{i}组', is_ungrouped=False)
+            db.session.add(group)
         
         try:
             db.session.commit()
-            print('数据库初始化完成')
-            print('默认管理员账号：admin')
-            print('默认管理员密码：admin')
+            echo('创建默认分组成功')
         except Exception as e:
             db.session.rollback()
-            print(f'数据库初始化失败：{str(e)}')
+            echo(f'创建默认分组失败：{str(e)}')
+            return
+    
+    # 升级前保存的作业还没有 content_html
+    rendered = render_tasks()
+    if rendered:
+        echo(f'已预处理 {rendered} 个作业的内容')
+
+    try:
+        db.session.commit()
+        echo('数据库初始化完成')
+        echo('默认管理员账号：admin')
+        echo('默认管理员密码：admin')
+    except Exception as e:
+        db.session.rollback()
+        echo(f'数据库初始化失败：{str(e)}')
+
+def configure_sqlite(engine, busy_timeout):
+    """为 SQLite 连接开启 WAL 并设置写锁等待，使读写可以并发"""
+    if engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragma(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.execute(f'PRAGMA busy_timeout={int(busy_timeout)}')
+        cursor.close()
+
+def create_shard_router(app):
+    """创建班级分片路由：默认分片使用 SQLALCHEMY_DATABASE_URI，班级分片按需打开 SHARD_DIR 下的数据库文件"""
+    state_dir = os.path.join(app.instance_path, 'classes-state')
+    os.makedirs(state_dir, exist_ok=True)
+    initialized = set()
+
+    def open_shard(slug):
+        engine = create_engine(f'sqlite:///{router.path(slug)}', **app.config['SQLALCHEMY_ENGINE_OPTIONS'])
+        configure_sqlite(engine, app.config['SQLITE_BUSY_TIMEOUT'])
+        if app.config['METRICS_ENABLED']:
+            instrument_engine(engine)
+        shard = Shard(slug, engine,
+                      board_version=BoardVersion(os.path.join(state_dir, f'{slug}.board.version')),
+                      auth_version=BoardVersion(os.path.join(state_dir, f'{slug}.auth.version')),
+                      writers=WriterSlots(os.path.join(state_dir, f'{slug}.writers'),
+                                          app.config['WRITE_CONCURRENCY']))
+        shard.board_events = create_event_broadcaster(app, shard)
+        # 每个进程第一次打开时检查表结构（例如从旧版本服务器迁移过来的数据库文件）
+        if slug not in initialized:
+            try:
+                with app.app_context():
+                    g.shard = shard
+                    with init_lock(app):
+                        init_db(echo=app.logger.debug)
+                    g.pop('shard')
+            except Exception:
+                close_shard(shard)
+                raise
+            initialized.add(slug)
+        app.extensions['jobs'].wakeup()
+        return shard
+
+    def close_shard(shard):
+        shard.board_events.close()
+        shard.engine.dispose()
+        shard.board_version.close()
+        shard.auth_version.close()
+        shard.writers.close()
+
+    def is_busy(shard):
+        return shard.board_events.client_count > 0 or \
+            any(slug == shard.slug for slug, job_id in app.extensions['jobs'].active)
+
+    default = Shard(None, None,
+                    board_version=BoardVersion(os.path.join(app.instance_path, 'board.version')),
+                    auth_version=BoardVersion(os.path.join(app.instance_path, 'auth.version')),
+                    writers=WriterSlots(os.path.join(app.instance_path, 'writers'),
+                                        app.config['WRITE_CONCURRENCY']))
+    default.board_events = create_event_broadcaster(app, default)
+    router = ShardRouter(app.config['SHARD_DIR'] or os.path.join(app.instance_path, 'classes'),
+                         open_shard, close_shard, default=default,
+                         max_open=app.config['SHARD_MAX_OPEN'],
+                         idle_timeout=app.config['SHARD_IDLE_TIMEOUT'],
+                         is_busy=is_busy)
+    return router
+
+def forget_restored_state(app):
+    """数据库换成备份后，让浏览器缓存的看板 ETag 和各进程缓存的登录身份全部失效
+
+    默认分片的版本号直接加一；班级的版本号文件删除后，下次打开班级时以新的纪元值重建。
+    """
+    default = app.extensions['shards'].default
+    default.board_version.bump()
+    default.auth_version.bump()
+    state_dir = os.path.join(app.instance_path, 'classes-state')
+    for name in os.listdir(state_dir):
+        if name.endswith('.version'):
+            os.remove(os.path.join(state_dir, name))
+
+def create_app(config=None):
+    """应用工厂：创建并配置 Flask 应用，初始化扩展和数据库"""
+    # 测试等场合可以通过 INSTANCE_PATH 指定独立的 instance 目录（绝对路径）
+    app = Flask(__name__, instance_path=(config or {}).get('INSTANCE_PATH'))
+    app.config.from_mapping(DEFAULT_CONFIG)
+    if config:
+        app.config.from_mapping(config)
+
+    # 先于 Flask-SQLAlchemy 注册，请求结束时数据库会话关闭之后才释放分片
+    app.teardown_appcontext(release_shard)
+    csrf.init_app(app)
+    db.init_app(app)
+    login_manager.init_app(app)
+    app.register_blueprint(bp)
+    app.session_interface = ShardSessionInterface()
+    app.extensions['jobs'] = create_job_runner(app)
+    os.makedirs(app.instance_path, exist_ok=True)
+    app.extensions['shards'] = create_shard_router(app)
+    app.wsgi_app = ShardMiddleware(app.wsgi_app, app.extensions['shards'])
+    app.extensions['board_cache'] = BoardCache(max_entries=app.config['BOARD_CACHE_MAX_ENTRIES'],
+                                               ttl=app.config['BOARD_CACHE_TTL'])
+    app.extensions['user_cache'] = BoardCache(max_entries=app.config['USER_CACHE_MAX_ENTRIES'],
+                                              ttl=app.config['USER_CACHE_TTL'])
+    app.extensions['fragment_cache'] = BoardCache(max_entries=app.config['FRAGMENT_CACHE_MAX_ENTRIES'],
+                                                  ttl=app.config['FRAGMENT_CACHE_TTL'])
+    app.jinja_env.add_extension(FragmentCacheExtension)
+    app.jinja_env.fragment_cache = app.extensions['fragment_cache']
+    app.jinja_env.fragment_cache_scope = lambda: current_shard().slug
+    if app.config['TEMPLATE_BYTECODE_CACHE']:
+        bytecode_dir = os.path.join(app.instance_path, 'jinja-cache')
+        os.makedirs(bytecode_dir, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(bytecode_dir)
+    app.extensions['asset_manifest'] = assets.load_manifest(app.static_folder) \
+        if app.config['ASSETS_FINGERPRINT'] else {}
+    app.view_functions['static'] = serve_static
+    app.extensions['image_store'] = ImageStore(os.path.join(app.root_path, app.config['UPLOAD_FOLDER']),
+                                               widths=app.config['UPLOAD_VARIANT_WIDTHS'],
+                                               workers=app.config['UPLOAD_WORKERS'])
+    app.extensions['password_hash_slots'] = threading.BoundedSemaphore(app.config['PASSWORD_HASH_CONCURRENCY'])
+    app.extensions['backups'] = BackupStore(app.config['BACKUP_DIR'] or os.path.join(app.instance_path, 'backups'),
+                                            keep=app.config['BACKUP_KEEP'], pages=app.config['BACKUP_PAGES'],
+                                            pause=app.config['BACKUP_PAUSE'],
+                                            busy_timeout=app.config['SQLITE_BUSY_TIMEOUT'])
+    app.extensions['rate_limits'] = TokenBuckets(os.path.join(app.instance_path, 'rate-limits'))
+    app.extensions['coalescer'] = Coalescer(os.path.join(app.instance_path, 'coalesce'),
+                                            app.config['STATUS_COALESCE_WINDOW'])
+    app.extensions['metrics'] = None
+    if app.config['METRICS_ENABLED']:
+        app.extensions['metrics'] = Metrics(app.config['METRICS_DIR'] or os.path.join(app.instance_path, 'metrics'))
+        before_render_template.connect(start_template_timing, app)
+        template_rendered.connect(finish_template_timing, app)
 
-if __name__ == '__main__':
     with app.app_context():
-        init_db()
-    app.run(host='0.0.0.0', port=5678, debug=True)
+        app.extensions['shards'].default.engine = db.engine
+        configure_sqlite(db.engine, app.config['SQLITE_BUSY_TIMEOUT'])
+        if app.config['METRICS_ENABLED']:
+            instrument_engine(db.engine)
+        with init_lock(app):
+            # 打开数据库之前换上 flask restore-backup 准备好的备份
+            restored = app.extensions['backups'].apply_pending_restore()
+            if restored:
+                name, targets = restored
+                forget_restored_state(app)
+                app.logger.warning(f'已从备份 {name} 恢复 {len(targets)} 个数据库')
+            init_db()
+    return app
+
+if __name__ == '__main__':
+    # 仅用于本地开发，生产环境请使用 gunicorn 加载 wsgi:app
+    create_app().run(host='0.0.0.0', port=5678, debug=os.environ.get('FLASK_DEBUG') == '1')
@@ -0,0 +1,205 @@
+"""学期归档
+
+学期结束后，已发布的作业连同完成情况、以及当时的分组名单，从业务数据库移到单独的归档数据库
+（与业务数据库同目录、文件名带 .archive），业务数据库只保留当前学期的数据，首页和管理面板的查询
+不会随学期增多而变慢。
+
+归档数据库只由后台的归档、恢复任务写入，浏览时以只读方式打开。每个作业的正文和完成情况压缩后
+保存为一行，列表需要的标题、完成人数等单独存为普通列，浏览列表时不需要解压。归档数据库不使用 WAL，
+整个归档只有一个文件，可以直接复制备份。
+"""
+import json
+import os
+import sqlite3
+import zlib
+from contextlib import closing, contextmanager
+from datetime import datetime
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS term (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    archived_at TEXT NOT NULL,
+    task_count INTEGER NOT NULL DEFAULT 0,
+    member_count INTEGER NOT NULL DEFAULT 0,
+    first_task_at TEXT,
+    last_task_at TEXT
+);
+CREATE TABLE IF NOT EXISTS task (
+    term_id INTEGER NOT NULL REFERENCES term(id),
+    id INTEGER NOT NULL,
+    title TEXT NOT NULL,
+    created_at TEXT,
+    deadline TEXT,
+    excerpt TEXT,
+    completed INTEGER NOT NULL,
+    total INTEGER NOT NULL,
+    body BLOB NOT NULL,
+    PRIMARY KEY (term_id, id)
+);
+CREATE TABLE IF NOT EXISTS roster (
+    term_id INTEGER PRIMARY KEY REFERENCES term(id),
+    body BLOB NOT NULL
+);
+'''
+
+
+def pack(value):
+    return zlib.compress(json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8'), 9)
+
+
+def unpack(data):
+    return json.loads(zlib.decompress(data).decode('utf-8'))
+
+
+def _format_time(value):
+    return value.isoformat(sep=' ', timespec='seconds') if value else None
+
+
+def _parse_time(value):
+    return datetime.fromisoformat(value) if value else None
+
+
+class ArchiveStore:
+    """一个归档数据库文件
+
+    写入的方法各自在一个短事务中完成并提交；作业的 id 为它在业务数据库中的原 id，重复写入时覆盖，
+    任务中断后重试不会产生重复记录。
+    """
+
+    def __init__(self, path, busy_timeout=5000):
+        self.path = path
+        self.busy_timeout = busy_timeout
+
+    @property
+    def exists(self):
+        return os.path.isfile(self.path)
+
+    @contextmanager
+    def _write(self):
+        with closing(sqlite3.connect(self.path, timeout=self.busy_timeout / 1000)) as conn:
+            conn.executescript(_SCHEMA)
+            with conn:
+                yield conn
+
+    @contextmanager
+    def _read(self):
+        with closing(sqlite3.connect(f'file:{self.path}?mode=ro', uri=True,
+                                     timeout=self.busy_timeout / 1000)) as conn:
+            conn.row_factory = sqlite3.Row
+            yield conn
+
+    # 写入：由归档、恢复任务调用
+
+    def create_term(self, name):
+        with self._write() as conn:
+            return conn.execute('INSERT INTO term (name, archived_at) VALUES (?, ?)',
+                                (name, _format_time(datetime.utcnow()))).lastrowid
+
+    def add_tasks(self, term_id, tasks):
+        """写入一批作业；completion 为 [[小组, 成员, 是否完成, 完成时间], ...]"""
+        rows = []
+        for task in tasks:
+            completion = [[group, username, bool(status), _format_time(updated_at)]
+                          for group, username, status, updated_at in task['completion']]
+            rows.append((term_id, task['id'], task['title'], _format_time(task['created_at']),
+                         _format_time(task['deadline']), task['excerpt'],
+                         sum(1 for row in completion if row[2]), len(completion),
+                         pack({'content': task['content'], 'content_html': task['content_html'],
+                               'completion': completion})))
+        with self._write() as conn:
+            conn.executemany('INSERT OR REPLACE INTO task VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+
+    def save_roster(self, term_id, groups):
+        with self._write() as conn:
+            conn.execute('INSERT OR REPLACE INTO roster VALUES (?, ?)', (term_id, pack(groups)))
+
+    def delete_tasks(self, term_id, up_to_id):
+        """删除 id 不超过 up_to_id 的作业（已恢复到业务数据库）"""
+        with self._write() as conn:
+            conn.execute('DELETE FROM task WHERE term_id = ? AND id <= ?', (term_id, up_to_id))
+
+    def refresh_term(self, term_id):
+        """重新统计学期的作业数、人数和时间范围；既没有作业也没有名单时删除该学期，返回是否仍保留"""
+        with self._write() as conn:
+            task_count, first_task_at, last_task_at = conn.execute(
+                'SELECT count(*), min(created_at), max(created_at) FROM task WHERE term_id = ?',
+                (term_id,)).fetchone()
+            roster = conn.execute('SELECT body FROM roster WHERE term_id = ?', (term_id,)).fetchone()
+            if not task_count and roster is None:
+                conn.execute('DELETE FROM term WHERE id = ?', (term_id,))
+                return False
+            member_count = sum(len(group['members']) for group in unpack(roster[0])) if roster else 0
+            conn.execute('UPDATE term SET task_count = ?, member_count = ?, first_task_at = ?, last_task_at = ? '
+                         'WHERE id = ?', (task_count, member_count, first_task_at, last_task_at, term_id))
+            return True
+
+    # 读取：按需解压
+
+    def terms(self):
+        if not self.exists:
+            return []
+        with self._read() as conn:
+            return [self._term(row) for row in conn.execute('SELECT * FROM term ORDER BY id DESC')]
+
+    def term(self, term_id):
+        if not self.exists:
+            return None
+        with self._read() as conn:
+            row = conn.execute('SELECT * FROM term WHERE id = ?', (term_id,)).fetchone()
+            if row is None:
+                return None
+            term = self._term(row)
+            roster = conn.execute('SELECT body FROM roster WHERE term_id = ?', (term_id,)).fetchone()
+            term['roster'] = unpack(roster[0]) if roster else None
+            term['tasks'] = [{'id': task['id'], 'title': task['title'], 'excerpt': task['excerpt'],
+                              'created_at': _parse_time(task['created_at']),
+                              'deadline': _parse_time(task['deadline']),
+                              'completed': task['completed'], 'total': task['total']}
+                             for task in conn.execute(
+                                 'SELECT id, title, excerpt, created_at, deadline, completed, total FROM task '
+                                 'WHERE term_id = ? ORDER BY created_at DESC, id DESC', (term_id,))]
+            return term
+
+    def task(self, term_id, task_id):
+        if not self.exists:
+            return None
+        with self._read() as conn:
+            row = conn.execute('SELECT * FROM task WHERE term_id = ? AND id = ?', (term_id, task_id)).fetchone()
+        return self._task(row) if row else None
+
+    def load_tasks(self, term_id, after_id=0, limit=50):
+        """按 id 顺序读取一批完整的作业，供恢复使用"""
+        with self._read() as conn:
+            return [self._task(row) for row in conn.execute(
+                'SELECT * FROM task WHERE term_id = ? AND id > ? ORDER BY id LIMIT ?', (term_id, after_id, limit))]
+
+    def count_tasks(self, term_id, after_id=0):
+        with self._read() as conn:
+            return conn.execute('SELECT count(*) FROM task WHERE term_id = ? AND id > ?',
+                                (term_id, after_id)).fetchone()[0]
+
+    def contents(self):
+        """逐个产生所有归档作业的原始内容，清理上传文件时用于判断图片是否仍被引用"""
+        if not self.exists:
+            return
+        with self._read() as conn:
+            for (body,) in conn.execute('SELECT body FROM task'):
+                yield unpack(body)['content']
+
+    @staticmethod
+    def _term(row):
+        return {'id': row['id'], 'name': row['name'], 'archived_at': _parse_time(row['archived_at']),
+                'task_count': row['task_count'], 'member_count': row['member_count'],
+                'first_task_at': _parse_time(row['first_task_at']),
+                'last_task_at': _parse_time(row['last_task_at'])}
+
+    @staticmethod
+    def _task(row):
+        body = unpack(row['body'])
+        return {'id': row['id'], 'title': row['title'], 'excerpt': row['excerpt'],
+                'created_at': _parse_time(row['created_at']), 'deadline': _parse_time(row['deadline']),
+                'completed': row['completed'], 'total': row['total'],
+                'content': body['content'], 'content_html': body['content_html'],
+                'completion': [[group, username, status, _parse_time(updated_at)]
+                               for group, username, status, updated_at in body['completion']]}
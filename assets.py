@@ -0,0 +1,123 @@
+"""静态资源构建
+
+把 static 目录下的 CSS、JS、字体等文件复制到 static/dist，文件名中加入内容哈希
+（style.css -> style.3f2a9c1b0d4e.css），并为可压缩的文件预先生成 .gz 和 .br 压缩版本，
+最后写出 manifest.json 记录原文件名到新文件名的对应关系。
+
+应用启动时读取 manifest.json：模板中 url_for('static', filename=...) 自动指向带哈希的文件，
+这些文件内容永不改变，可以让浏览器缓存一年而不必每次刷新页面都重新验证；请求时按
+Accept-Encoding 直接返回预先压缩好的版本。没有 manifest.json 时照常使用原文件。
+
+修改 static 下的文件后需要重新执行：
+    python assets.py
+"""
+import gzip
+import hashlib
+import json
+import os
+import posixpath
+import re
+import sys
+
+try:
+    import brotli
+except ImportError:  # 未安装 brotli 时只生成 .gz
+    brotli = None
+
+DIST_DIR = 'dist'
+MANIFEST = 'manifest.json'
+# 不参与构建的目录：用户上传的文件、构建输出本身
+SKIP_DIRS = {'uploads', DIST_DIR}
+COMPRESSIBLE = {'.css', '.js', '.svg', '.json', '.txt', '.map', '.html', '.ttf', '.eot'}
+# 太小的文件压缩后节省不了几个字节
+MIN_COMPRESS_SIZE = 256
+
+_CSS_URL = re.compile(r'url\(\s*(["\']?)([^"\')?#]+)([?#][^"\')]*)?\1\s*\)')
+
+
+def fingerprint(name, data):
+    root, ext = posixpath.splitext(name)
+    return f'{root}.{hashlib.sha256(data).hexdigest()[:12]}{ext}'
+
+
+def rewrite_css_urls(name, data, manifest):
+    """把 CSS 中相对路径引用的字体、图片改为带哈希的文件名"""
+    base = posixpath.dirname(name)
+
+    def replace(match):
+        quote, target, suffix = match.group(1), match.group(2), match.group(3) or ''
+        if re.match(r'^(?:[a-z]+:|/)', target):
+            return match.group(0)
+        resolved = posixpath.normpath(posixpath.join(base, target))
+        if resolved not in manifest:
+            return match.group(0)
+        new_target = posixpath.relpath(manifest[resolved], base or '.')
+        # 原来的 ?v=... 查询参数用于缓存失效，文件名已带哈希，不再需要
+        suffix = suffix if suffix.startswith('#') else ''
+        return f'url({quote}{new_target}{suffix}{quote})'
+
+    return _CSS_URL.sub(replace, data.decode('utf-8')).encode('utf-8')
+
+
+def write_compressed(path, data):
+    with open(path + '.gz', 'wb') as f:
+        f.write(gzip.compress(data, compresslevel=9, mtime=0))
+    if brotli is not None:
+        with open(path + '.br', 'wb') as f:
+            f.write(brotli.compress(data, quality=11))
+
+
+def source_files(static_root):
+    for dirpath, dirnames, filenames in os.walk(static_root):
+        if dirpath == static_root:
+            dirnames[:] = [d for d in dirnames if d not in SKIP_DIRS]
+        for filename in filenames:
+            if filename.startswith('.'):
+                continue
+            path = os.path.join(dirpath, filename)
+            yield os.path.relpath(path, static_root).replace(os.sep, '/')
+
+
+def build(static_root):
+    """构建 static/dist，返回 manifest"""
+    # 旧的带哈希文件保留不删，正在打开的旧页面仍能加载；文件名不同，不会互相覆盖
+    dist = os.path.join(static_root, DIST_DIR)
+    os.makedirs(dist, exist_ok=True)
+
+    # CSS 最后处理，以便其中引用的文件已经有了带哈希的文件名
+    names = sorted(source_files(static_root), key=lambda n: (n.endswith('.css'), n))
+    manifest = {}
+    for name in names:
+        with open(os.path.join(static_root, name), 'rb') as f:
+            data = f.read()
+        if name.endswith('.css'):
+            data = rewrite_css_urls(name, data, manifest)
+        hashed = fingerprint(name, data)
+        target = os.path.join(dist, hashed)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, 'wb') as f:
+            f.write(data)
+        if posixpath.splitext(name)[1] in COMPRESSIBLE and len(data) >= MIN_COMPRESS_SIZE:
+            write_compressed(target, data)
+        manifest[name] = hashed
+
+    tmp_path = os.path.join(dist, MANIFEST + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, os.path.join(dist, MANIFEST))
+    return manifest
+
+
+def load_manifest(static_root):
+    """读取构建结果，没有构建过时返回空字典"""
+    try:
+        with open(os.path.join(static_root, DIST_DIR, MANIFEST), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+if __name__ == '__main__':
+    root = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+    result = build(root)
+    print(f'已生成 {len(result)} 个静态文件到 {os.path.join(root, DIST_DIR)}')
@@ -0,0 +1,233 @@
+"""数据库在线备份
+
+直接复制正在使用的 SQLite 文件可能得到写了一半的副本（WAL 中已提交的数据还没有写回主文件），
+停服复制又会中断上课。这里用 SQLite 的在线备份 API 逐页复制：
+
+- 每次只复制 pages 页，两步之间暂停一下，备份不会长时间占用磁盘和 CPU；
+- WAL 模式的数据库在复制期间保持一个读事务，所有页面来自同一个快照。WAL 模式下读事务不阻塞
+  写入，写请求照常提交；如果不固定快照，其他连接每次写入都会让备份从头开始，写入频繁时永远完成不了；
+- 副本先改为普通日志模式（单个文件），执行 PRAGMA integrity_check，通过后再 gzip 压缩。
+
+一次备份把所有数据库（默认数据库、班级数据库及各自的归档数据库）放在 <备份目录>/<时间>/ 下，
+manifest.json 记录每个文件的大小、SHA-256 和检查结果，整个目录写完后才改名为正式名称，
+中途失败不会留下不完整的备份。超过保留份数的旧备份自动删除。
+
+恢复分两步：stage_restore() 校验并解压备份，放到各数据库旁边（<文件名>.restore），记下待恢复的文件；
+应用下次启动、打开数据库之前调用 apply_pending_restore()，只需要几次改名就能换上备份，
+原来的文件改名为 <文件名>.pre-restore 保留。
+"""
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import time
+from contextlib import closing
+from datetime import datetime
+
+MANIFEST = 'manifest.json'
+PENDING_RESTORE = 'restore-pending.json'
+# 备份目录名的时间格式，按名称排序即按时间排序
+NAME_FORMAT = '%Y%m%d-%H%M%S'
+
+
+class BackupError(Exception):
+    """备份或恢复失败：数据库损坏、备份文件校验不通过等"""
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def check_integrity(path):
+    """对数据库执行 PRAGMA integrity_check，不通过时抛出 BackupError"""
+    with closing(sqlite3.connect(path)) as conn:
+        rows = [row[0] for row in conn.execute('PRAGMA integrity_check')]
+    if rows != ['ok']:
+        raise BackupError(f'{os.path.basename(path)} 完整性检查失败: {"; ".join(rows[:5])}')
+
+
+def copy_database(source_path, target_path, pages=256, pause=0.01, busy_timeout=5000, progress=None):
+    """用在线备份 API 把 source_path 复制到 target_path（单文件、非 WAL），返回复制的页数
+
+    progress(remaining, total) 在每一步之后调用。
+    """
+    with closing(sqlite3.connect(source_path, timeout=busy_timeout / 1000, isolation_level=None)) as source, \
+            closing(sqlite3.connect(target_path)) as target:
+        wal = source.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+        if wal:
+            # 固定读快照：复制期间其他连接的写入不会让备份重新开始
+            source.execute('BEGIN')
+            source.execute('SELECT count(*) FROM sqlite_master').fetchone()
+        copied = [0]
+
+        def step(status, remaining, total):
+            copied[0] = total
+            if progress is not None:
+                progress(remaining, total)
+            if remaining and pause:
+                time.sleep(pause)
+
+        try:
+            source.backup(target, pages=pages, progress=step)
+        finally:
+            if wal:
+                source.execute('COMMIT')
+        target.execute('PRAGMA journal_mode=DELETE')
+    return copied[0]
+
+
+def _compress(source_path, target_path, level=6):
+    with open(source_path, 'rb') as src, gzip.open(target_path, 'wb', compresslevel=level) as dst:
+        shutil.copyfileobj(src, dst, 1024 * 1024)
+
+
+def _decompress(source_path, target_path):
+    with gzip.open(source_path, 'rb') as src, open(target_path, 'wb') as dst:
+        shutil.copyfileobj(src, dst, 1024 * 1024)
+
+
+class BackupStore:
+    """备份目录：每次备份一个子目录，保留最近 keep 份"""
+
+    def __init__(self, directory, keep=7, pages=256, pause=0.01, busy_timeout=5000):
+        self.directory = directory
+        self.keep = keep
+        self.pages = pages
+        self.pause = pause
+        self.busy_timeout = busy_timeout
+        os.makedirs(directory, exist_ok=True)
+
+    def _new_name(self):
+        base = datetime.utcnow().strftime(NAME_FORMAT)
+        name, n = base, 1
+        while os.path.exists(os.path.join(self.directory, name)):
+            n += 1
+            name = f'{base}-{n}'
+        return name
+
+    def create(self, sources, progress=None):
+        """备份 sources（[(名称, 数据库路径)]，名称可以带子目录，如 classes/a.db），返回 manifest
+
+        progress(done, total, name) 在每个数据库备份完成后调用；不存在的数据库跳过。
+        """
+        sources = [(name, path) for name, path in sources if os.path.isfile(path)]
+        name = self._new_name()
+        staging = os.path.join(self.directory, f'.{name}.tmp')
+        os.makedirs(staging)
+        started = time.monotonic()
+        files = []
+        try:
+            for i, (file_name, path) in enumerate(sources):
+                file_started = time.monotonic()
+                copy = os.path.join(staging, file_name)
+                os.makedirs(os.path.dirname(copy), exist_ok=True)
+                page_count = copy_database(path, copy, pages=self.pages, pause=self.pause,
+                                           busy_timeout=self.busy_timeout)
+                check_integrity(copy)
+                size = os.path.getsize(copy)
+                _compress(copy, copy + '.gz')
+                os.remove(copy)
+                files.append({'name': file_name, 'pages': page_count, 'size': size,
+                              'compressed_size': os.path.getsize(copy + '.gz'),
+                              'sha256': _file_sha256(copy + '.gz'),
+                              'seconds': round(time.monotonic() - file_started, 3)})
+                if progress is not None:
+                    progress(i + 1, len(sources), file_name)
+            manifest = {'name': name, 'created_at': datetime.utcnow().isoformat(timespec='seconds'),
+                        'seconds': round(time.monotonic() - started, 3), 'files': files}
+            with open(os.path.join(staging, MANIFEST), 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, ensure_ascii=False, indent=1)
+            os.replace(staging, os.path.join(self.directory, name))
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        self.rotate()
+        return manifest
+
+    def list(self):
+        """所有完整的备份，最新的在前"""
+        backups = []
+        for name in sorted(os.listdir(self.directory), reverse=True):
+            manifest = self.manifest(name)
+            if manifest is not None:
+                backups.append(manifest)
+        return backups
+
+    def manifest(self, name):
+        if name.startswith('.') or os.sep in name or (os.altsep and os.altsep in name):
+            return None
+        try:
+            with open(os.path.join(self.directory, name, MANIFEST), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def latest_time(self):
+        """最近一次备份的时间（UTC），没有备份时返回 None"""
+        for name in sorted(os.listdir(self.directory), reverse=True):
+            if self.manifest(name) is not None:
+                return datetime.strptime(name[:15], NAME_FORMAT)
+        return None
+
+    def rotate(self):
+        """只保留最近 keep 份备份，同时清理一天前中断留下的临时目录"""
+        for manifest in self.list()[self.keep:]:
+            shutil.rmtree(os.path.join(self.directory, manifest['name']), ignore_errors=True)
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith('.tmp') and time.time() - os.path.getmtime(path) > 24 * 3600:
+                shutil.rmtree(path, ignore_errors=True)
+
+    def stage_restore(self, name, resolve):
+        """校验并解压备份 name，放到 resolve(文件名) 返回的数据库路径旁边，下次启动时换上
+
+        返回待恢复的数据库路径列表。
+        """
+        manifest = self.manifest(name)
+        if manifest is None:
+            raise BackupError(f'备份 {name} 不存在')
+        targets = []
+        for entry in manifest['files']:
+            archive = os.path.join(self.directory, name, entry['name'] + '.gz')
+            if _file_sha256(archive) != entry['sha256']:
+                raise BackupError(f'{entry["name"]} 的备份文件已损坏（SHA-256 不一致）')
+            target = resolve(entry['name'])
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            _decompress(archive, target + '.restore')
+            check_integrity(target + '.restore')
+            targets.append(target)
+        with open(os.path.join(self.directory, PENDING_RESTORE), 'w', encoding='utf-8') as f:
+            json.dump({'name': name, 'targets': targets}, f, ensure_ascii=False)
+        return targets
+
+    def apply_pending_restore(self):
+        """换上已准备好的备份，返回 (备份名称, 恢复的数据库路径列表)；没有待恢复的备份时返回 None
+
+        必须在打开这些数据库之前调用。原来的数据库连同 WAL 文件改名为 <文件名>.pre-restore 保留。
+        """
+        marker = os.path.join(self.directory, PENDING_RESTORE)
+        try:
+            with open(marker, encoding='utf-8') as f:
+                pending = json.load(f)
+        except FileNotFoundError:
+            return None
+        restored = []
+        for target in pending['targets']:
+            if not os.path.isfile(target + '.restore'):
+                continue
+            for path in (f'{target}.pre-restore-wal', f'{target}.pre-restore-shm', target + '-shm'):
+                if os.path.exists(path):
+                    os.remove(path)
+            for suffix in ('', '-wal'):
+                if os.path.exists(target + suffix):
+                    os.replace(target + suffix, f'{target}.pre-restore{suffix}')
+            os.replace(target + '.restore', target)
+            restored.append(target)
+        os.remove(marker)
+        return pending['name'], restored
@@ -0,0 +1,185 @@
+"""备份期间的写入延迟
+
+生成一个较大的测试数据库（作业正文 + 每个作业每个成员一条完成记录），后台线程持续执行和
+/api/members/status 相同的 upsert 并逐条提交，分阶段测量写入延迟：
+
+1. 没有备份时（基准）；
+2. BackupStore.create() 进行中：分步复制（固定读快照）、完整性检查、gzip 压缩；
+3. 对比：不固定快照的分步复制。其他连接每次写入都会让备份从头开始，写入频繁时在限定时间内完成不了。
+
+输出每个阶段的写入次数、p50/p95/p99/最大延迟，以及备份耗时和重新开始的次数。
+
+用法（在项目根目录执行）：
+    python benchmarks/backup_latency.py
+    python benchmarks/backup_latency.py --tasks 4000 --members 800 --writers 8
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from backup import BackupStore  # noqa: E402
+
+UPSERT = ('INSERT INTO submission (task_id, member_id, status, updated_at) VALUES (?, ?, ?, ?) '
+          'ON CONFLICT (task_id, member_id) DO UPDATE SET status = excluded.status, updated_at = excluded.updated_at')
+
+
+def seed(db_path, args):
+    """用应用的表结构建库，再直接批量插入数据"""
+    from app import create_app, db
+
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{db_path}', 'BACKUP_INTERVAL': 0})
+    with app.app_context():
+        db.engine.dispose()
+
+    rng = random.Random(1)
+    conn = sqlite3.connect(db_path)
+    now = datetime.utcnow()
+    group_ids = [row[0] for row in conn.execute('SELECT id FROM "group" WHERE is_ungrouped = 0')]
+    conn.executemany('INSERT INTO user (username, password_hash, is_admin) VALUES (?, ?, 0)',
+                     ((f'bench{i}', '!pending') for i in range(args.members)))
+    conn.execute('INSERT INTO group_member (group_id, user_id, status) '
+                 "SELECT ?, id, 0 FROM user WHERE username LIKE 'bench%'", (group_ids[0],))
+    filler = ''.join(rng.choice('作业内容说明要求提交格式截止时间abcdefg ') for _ in range(args.content_kb * 1024 // 3))
+    conn.executemany('INSERT INTO task (title, content, content_html, created_at) VALUES (?, ?, ?, ?)',
+                     ((f'作业 {i}', filler, f'<p>{filler}</p>', now) for i in range(args.tasks)))
+    conn.execute('INSERT INTO submission (task_id, member_id, status, updated_at) '
+                 'SELECT task.id, group_member.id, abs(random()) % 2, ? FROM task, group_member', (now,))
+    conn.commit()
+    task_ids = [row[0] for row in conn.execute('SELECT id FROM task')]
+    member_ids = [row[0] for row in conn.execute('SELECT id FROM group_member')]
+    conn.close()
+    return task_ids, member_ids
+
+
+class Writers:
+    """多个线程持续执行 upsert 并提交，记录 (完成时间, 耗时毫秒)"""
+
+    def __init__(self, db_path, task_ids, member_ids, count, think):
+        self.samples = []
+        self.stop = threading.Event()
+        self.threads = [threading.Thread(target=self._run, args=(db_path, task_ids, member_ids, think, i))
+                        for i in range(count)]
+
+    def _run(self, db_path, task_ids, member_ids, think, seed):
+        rng = random.Random(seed)
+        conn = sqlite3.connect(db_path, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        while not self.stop.is_set():
+            started = time.perf_counter()
+            conn.execute(UPSERT, (rng.choice(task_ids), rng.choice(member_ids), rng.random() < 0.5,
+                                  datetime.utcnow()))
+            conn.commit()
+            finished = time.perf_counter()
+            self.samples.append((finished, (finished - started) * 1000))
+            time.sleep(think)
+        conn.close()
+
+    def __enter__(self):
+        for thread in self.threads:
+            thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop.set()
+        for thread in self.threads:
+            thread.join()
+
+    def between(self, start, end):
+        return [ms for at, ms in self.samples if start <= at < end]
+
+
+def percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(round((len(values) - 1) * p / 100)))]
+
+
+def report(name, latencies, seconds, note=''):
+    print(f'{name:<22}{len(latencies):>8}{len(latencies) / seconds:>9.0f}{percentile(latencies, 50):>9.2f}'
+          f'{percentile(latencies, 95):>9.2f}{percentile(latencies, 99):>9.2f}'
+          f'{max(latencies, default=0):>9.1f}  {note}')
+
+
+def unpinned_copy(source_path, target_path, pages, timeout):
+    """不固定快照的分步复制，返回 (是否完成, 重新开始的次数)"""
+    restarts = [0, None]
+
+    def step(status, remaining, total):
+        if restarts[1] is not None and remaining >= restarts[1]:
+            restarts[0] += 1
+        restarts[1] = remaining
+        if time.perf_counter() > deadline:
+            raise TimeoutError()
+        time.sleep(0.01)
+
+    deadline = time.perf_counter() + timeout
+    source = sqlite3.connect(source_path)
+    target = sqlite3.connect(target_path)
+    try:
+        source.backup(target, pages=pages, progress=step)
+        return True, restarts[0]
+    except TimeoutError:
+        return False, restarts[0]
+    finally:
+        source.close()
+        target.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tasks', type=int, default=2000, help='作业数')
+    parser.add_argument('--members', type=int, default=500, help='成员数（完成记录数 = 作业数 × 成员数）')
+    parser.add_argument('--content-kb', type=int, default=16, help='每个作业正文的大小（KB）')
+    parser.add_argument('--writers', type=int, default=4, help='并发写入的线程数')
+    parser.add_argument('--think', type=float, default=0.005, help='每个线程两次写入之间的间隔（秒）')
+    parser.add_argument('--idle', type=float, default=5, help='基准阶段的秒数')
+    parser.add_argument('--pages', type=int, default=256, help='备份每一步复制的页数')
+    parser.add_argument('--unpinned-timeout', type=float, default=30, help='不固定快照的备份最多等待的秒数')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        started = time.perf_counter()
+        task_ids, member_ids = seed(db_path, args)
+        size = os.path.getsize(db_path) / 1024 / 1024
+        print(f'测试数据库 {size:.0f} MB（{len(task_ids)} 个作业 × {len(member_ids)} 名成员），'
+              f'生成耗时 {time.perf_counter() - started:.1f}s；{args.writers} 个线程持续写入\n')
+        store = BackupStore(os.path.join(tmp, 'backups'), pages=args.pages)
+
+        print(f"{'阶段':<20}{'写入数':>8}{'写入/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'最大 ms':>9}")
+        with Writers(db_path, task_ids, member_ids, args.writers, args.think) as writers:
+            time.sleep(1)  # 预热
+            start = time.perf_counter()
+            time.sleep(args.idle)
+            end = time.perf_counter()
+            report('无备份', writers.between(start, end), end - start)
+
+            start = time.perf_counter()
+            manifest = store.create([('bench.db', db_path)])
+            end = time.perf_counter()
+            entry = manifest['files'][0]
+            report('在线备份（固定快照）', writers.between(start, end), end - start,
+                   f'备份耗时 {end - start:.1f}s，{entry["pages"]} 页，'
+                   f'压缩后 {entry["compressed_size"] / 1024 / 1024:.0f} MB')
+
+            start = time.perf_counter()
+            finished, restarts = unpinned_copy(db_path, os.path.join(tmp, 'unpinned.db'), args.pages,
+                                               args.unpinned_timeout)
+            end = time.perf_counter()
+            report('分步复制（不固定快照）', writers.between(start, end), end - start,
+                   f"{'完成' if finished else '未完成'}，耗时 {end - start:.1f}s，重新开始 {restarts} 次")
+
+
+if __name__ == '__main__':
+    main()
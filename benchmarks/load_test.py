@@ -0,0 +1,373 @@
+"""课堂高峰场景压力测试
+
+模拟早上 8 点全年级同时打开首页、切换完成状态，同时老师在管理面板移动成员、导入名单、自动分组：
+
+1. 按参数在临时目录生成 SQLite 数据库（小组、学生、作业）；
+2. 在子进程中启动应用（多线程 WSGI 服务器），子进程统计每个接口执行的 SQL 条数；
+3. 多个线程模拟学生和老师，在指定时间内循环请求真实的路由；
+4. 输出每个接口的 p50/p95/p99 延迟、吞吐量、错误数和平均 SQL 条数。
+
+结果可以保存为基线，之后用 --compare 对比，延迟、SQL 条数或错误率变差时以非零状态退出，
+便于在合并前发现性能回退。
+
+用法（在项目根目录执行）：
+    python benchmarks/load_test.py --students 200 --duration 30 --save benchmarks/baseline.json
+    python benchmarks/load_test.py --students 200 --duration 30 --compare benchmarks/baseline.json
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import CookieJar
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# 学生的密码哈希只在生成数据时计算一次；迭代次数很低，登录不会成为测试的瓶颈
+STUDENT_PASSWORD = 'bench'
+STUDENT_HASH_METHOD = 'pbkdf2:sha256:1000'
+
+# 老师的操作及权重
+ADMIN_ACTIONS = [('admin_dashboard', 5), ('move_member', 4), ('import_members', 1), ('auto_group_members', 1)]
+
+# 统计的接口，按输出顺序
+ENDPOINTS = ['index', 'toggle_member_status', 'admin_dashboard', 'move_member',
+             'import_members', 'auto_group_members']
+
+
+def seed(db_path, args):
+    """生成测试数据库，返回 {'members': [(成员ID, 学生用户名)], 'groups': [小组ID]}"""
+    from sqlalchemy import insert
+    from werkzeug.security import generate_password_hash
+
+    from app import Group, GroupMember, Task, User, create_app, db, recount_members
+
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{db_path}'})
+    with app.app_context():
+        existing = Group.query.filter_by(is_ungrouped=False).count()
+        if args.groups > existing:
+            db.session.execute(insert(Group), [{'name': f'第{i}组', 'is_ungrouped': False}
+                                               for i in range(existing + 1, args.groups + 1)])
+        groups = [group_id for (group_id,) in db.session.query(Group.id)
+                  .filter(Group.is_ungrouped == False).order_by(Group.id).limit(args.groups)]
+        ungrouped_id = Group.query.filter_by(is_ungrouped=True).one().id
+        capacity = {group_id: cap for group_id, cap in db.session.query(Group.id, Group.capacity)}
+
+        password_hash = generate_password_hash(STUDENT_PASSWORD, method=STUDENT_HASH_METHOD)
+        names = [f'student{i:05d}' for i in range(args.students)]
+        db.session.execute(insert(User), [{'username': name, 'password_hash': password_hash, 'is_admin': False}
+                                          for name in names])
+        user_ids = dict(db.session.query(User.username, User.id).filter(User.username.in_(names)))
+
+        # 依次填满各小组，放不下的学生进入未分组
+        rows = []
+        slots = [group_id for group_id in groups for _ in range(capacity[group_id] or 0)]
+        for i, name in enumerate(names):
+            rows.append({'user_id': user_ids[name], 'group_id': slots[i] if i < len(slots) else ungrouped_id,
+                         'status': False})
+        db.session.execute(insert(GroupMember), rows)
+
+        db.session.execute(insert(Task), [{'title': f'作业{i}', 'content': '<p>' + '作业内容。' * 50 + '</p>'}
+                                          for i in range(args.tasks)])
+        recount_members()
+        db.session.commit()
+        members = db.session.query(GroupMember.id, User.username).join(User) \
+            .filter(User.username.in_(names)).all()
+        db.engine.dispose()
+    return {'members': [tuple(row) for row in members], 'groups': groups}
+
+
+def serve(db_path):
+    """子进程入口：启动应用并统计每个接口的 SQL 条数"""
+    import logging
+
+    from flask import g, has_request_context, jsonify, request
+    from sqlalchemy import event
+    from werkzeug.serving import make_server
+
+    from app import create_app, db
+
+    # 所有模拟的学生都来自 127.0.0.1，不按 IP 限流；按用户限流、状态合并和写入名额保持默认
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{db_path}', 'RATE_LIMIT_IP_RATE': 0})
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    stats = {}
+    lock = threading.Lock()
+
+    with app.app_context():
+        @event.listens_for(db.engine, 'before_cursor_execute')
+        def count_query(*args):
+            if has_request_context():
+                g.bench_queries = g.get('bench_queries', 0) + 1
+
+    @app.after_request
+    def record_queries(response):
+        endpoint = (request.endpoint or '').rpartition('.')[2]
+        with lock:
+            entry = stats.setdefault(endpoint, [0, 0])
+            entry[0] += 1
+            entry[1] += g.get('bench_queries', 0)
+        return response
+
+    def bench_stats():
+        with lock:
+            result = {endpoint: {'requests': n, 'queries': q} for endpoint, (n, q) in stats.items()}
+            if request.method == 'POST':
+                stats.clear()
+        return jsonify(result)
+
+    app.add_url_rule('/_bench/stats', 'bench_stats', bench_stats, methods=['GET', 'POST'])
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    print(f'PORT {server.server_port}', flush=True)
+    server.serve_forever()
+
+
+def start_server(db_path):
+    proc = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--serve', db_path],
+                            cwd=ROOT, stdout=subprocess.PIPE, text=True)
+    for line in proc.stdout:
+        if line.startswith('PORT '):
+            return proc, f'http://127.0.0.1:{int(line.split()[1])}'
+    raise RuntimeError('服务器启动失败')
+
+
+class Client:
+    """带 Cookie 的 HTTP 客户端，记录每个请求的 (接口, 状态码, 毫秒)"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()))
+        self.samples = []
+        self.recording = False
+
+    def request(self, endpoint, method, path, json_body=None, form=None):
+        data, headers = None, {}
+        if json_body is not None:
+            data = json.dumps(json_body).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        elif form is not None:
+            data = urllib.parse.urlencode(form).encode('utf-8')
+        req = urllib.request.Request(self.base_url + path, data=data, headers=headers, method=method)
+        started = time.perf_counter()
+        try:
+            with self.opener.open(req, timeout=60) as response:
+                response.read()
+                status = response.status
+        except urllib.error.HTTPError as e:
+            e.read()
+            status = e.code
+        except OSError:
+            status = 0  # 连接失败、超时
+        elapsed = (time.perf_counter() - started) * 1000
+        if self.recording and endpoint:
+            self.samples.append((endpoint, status, elapsed))
+        return status
+
+    def login(self, username, password):
+        status = self.request(None, 'POST', '/login', form={'username': username, 'password': password})
+        if status != 200:  # 登录成功后跟随重定向，最终是 200
+            raise RuntimeError(f'{username} 登录失败: {status}')
+
+
+def student_loop(client, member_id, stop, think):
+    status = False
+    while not stop.is_set():
+        client.request('index', 'GET', '/')
+        for _ in range(2):
+            status = not status
+            client.request('toggle_member_status', 'POST', '/api/members/status',
+                           json_body={'member_id': member_id, 'status': status})
+        time.sleep(random.uniform(0, think * 2))
+
+
+def admin_loop(client, index, data, stop, think, import_size):
+    rng = random.Random(index)
+    actions, weights = zip(*ADMIN_ACTIONS)
+    batch_no = 0
+    while not stop.is_set():
+        action = rng.choices(actions, weights)[0]
+        if action == 'admin_dashboard':
+            client.request(action, 'GET', '/admin')
+        elif action == 'move_member':
+            member_id, _ = rng.choice(data['members'])
+            client.request(action, 'POST', '/api/members/move',
+                           json_body={'member_id': member_id, 'target_group_id': rng.choice(data['groups'])})
+        elif action == 'import_members':
+            batch_no += 1
+            names = [f'import{index}-{batch_no}-{i}' for i in range(import_size)]
+            client.request(action, 'POST', '/api/members/import', json_body={'members': names})
+        else:
+            client.request(action, 'POST', '/api/members/auto-group',
+                           json_body={'members_per_group': 5, 'fill_existing': True})
+        time.sleep(rng.uniform(0, think * 2))
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = (len(values) - 1) * p / 100
+    lower = int(k)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (k - lower)
+
+
+def summarize(samples, server_stats, duration):
+    report = {}
+    for endpoint in ENDPOINTS:
+        rows = [(status, ms) for name, status, ms in samples if name == endpoint]
+        if not rows:
+            continue
+        latencies = [ms for _, ms in rows]
+        server = server_stats.get(endpoint, {})
+        report[endpoint] = {
+            'requests': len(rows),
+            # 409（小组已满）等 4xx 是正常的业务结果，只把 5xx 和连接失败算作错误
+            'errors': sum(1 for status, _ in rows if status == 0 or status >= 500),
+            'rps': round(len(rows) / duration, 2),
+            'p50': round(percentile(latencies, 50), 2),
+            'p95': round(percentile(latencies, 95), 2),
+            'p99': round(percentile(latencies, 99), 2),
+            'queries': round(server['queries'] / server['requests'], 2) if server.get('requests') else None,
+        }
+    return report
+
+
+def print_report(result):
+    print(f"\n{'接口':<24}{'请求数':>8}{'错误':>6}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'SQL/次':>8}")
+    for endpoint, row in result['endpoints'].items():
+        queries = '-' if row['queries'] is None else f"{row['queries']:.1f}"
+        print(f"{endpoint:<24}{row['requests']:>8}{row['errors']:>6}{row['rps']:>9.1f}"
+              f"{row['p50']:>9.1f}{row['p95']:>9.1f}{row['p99']:>9.1f}{queries:>8}")
+    print(f"\n总吞吐量 {result['total_rps']:.1f} req/s，持续 {result['duration']:.1f}s")
+
+
+def compare(result, baseline, tolerance, noise_ms):
+    """返回回退项列表：延迟变慢超过 tolerance（且超过 noise_ms 毫秒）、SQL 条数增加、出现新的错误"""
+    problems = []
+    if baseline.get('scale') != result['scale']:
+        problems.append(f"数据规模与基线不同: {baseline.get('scale')} -> {result['scale']}")
+    for endpoint, old in baseline['endpoints'].items():
+        new = result['endpoints'].get(endpoint)
+        if new is None:
+            problems.append(f'{endpoint}: 本次没有请求')
+            continue
+        for key in ('p50', 'p95', 'p99'):
+            if new[key] > old[key] * (1 + tolerance) and new[key] - old[key] > noise_ms:
+                problems.append(f'{endpoint}: {key} {old[key]:.1f}ms -> {new[key]:.1f}ms')
+        if old['queries'] is not None and new['queries'] is not None and new['queries'] > old['queries'] + 0.5:
+            problems.append(f"{endpoint}: 每次请求 SQL {old['queries']:.1f} -> {new['queries']:.1f} 条")
+        old_rate = old['errors'] / max(old['requests'], 1)
+        new_rate = new['errors'] / max(new['requests'], 1)
+        if new_rate > old_rate + 0.01:
+            problems.append(f'{endpoint}: 错误率 {old_rate:.1%} -> {new_rate:.1%}')
+    if result['total_rps'] < baseline['total_rps'] * (1 - tolerance):
+        problems.append(f"总吞吐量 {baseline['total_rps']:.1f} -> {result['total_rps']:.1f} req/s")
+    return problems
+
+
+def run(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'load.db')
+        print(f'生成数据：{args.groups} 个小组，{args.students} 名学生，{args.tasks} 份作业')
+        data = seed(db_path, args)
+        proc, base_url = start_server(db_path)
+        try:
+            members = data['members'][:args.clients]
+            students = [Client(base_url) for _ in members]
+            admins = [Client(base_url) for _ in range(args.admins)]
+            # 登录不计入结果；并发数与服务器的密码哈希并发数一致，避免 503
+            with ThreadPoolExecutor(max_workers=2) as pool:
+                list(pool.map(lambda pair: pair[0].login(pair[1][1], STUDENT_PASSWORD), zip(students, members)))
+            for admin in admins:
+                admin.login('admin', 'admin')
+
+            stop = threading.Event()
+            threads = [threading.Thread(target=student_loop, args=(client, member_id, stop, args.think))
+                       for client, (member_id, _) in zip(students, members)]
+            threads += [threading.Thread(target=admin_loop,
+                                         args=(client, i, data, stop, args.think, args.import_size))
+                        for i, client in enumerate(admins)]
+            for thread in threads:
+                thread.start()
+
+            print(f'预热 {args.warmup}s，压测 {args.duration}s：{len(students)} 个学生、{len(admins)} 个老师并发')
+            time.sleep(args.warmup)
+            urllib.request.urlopen(urllib.request.Request(base_url + '/_bench/stats', data=b'', method='POST'))
+            for client in students + admins:
+                client.recording = True
+            started = time.perf_counter()
+            time.sleep(args.duration)
+            for client in students + admins:
+                client.recording = False
+            duration = time.perf_counter() - started
+            with urllib.request.urlopen(base_url + '/_bench/stats') as response:
+                server_stats = json.loads(response.read())
+            stop.set()
+            for thread in threads:
+                thread.join()
+        finally:
+            proc.terminate()
+            proc.wait()
+
+    samples = [sample for client in students + admins for sample in client.samples]
+    return {
+        'scale': {'groups': args.groups, 'students': args.students, 'tasks': args.tasks,
+                  'clients': len(students), 'admins': len(admins)},
+        'duration': round(duration, 2),
+        'total_rps': round(len(samples) / duration, 2),
+        'endpoints': summarize(samples, server_stats, duration),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--serve', metavar='DB', help=argparse.SUPPRESS)
+    parser.add_argument('--groups', type=int, default=12, help='小组数')
+    parser.add_argument('--students', type=int, default=200, help='学生人数')
+    parser.add_argument('--tasks', type=int, default=50, help='作业数')
+    parser.add_argument('--clients', type=int, default=50, help='同时在线的学生数')
+    parser.add_argument('--admins', type=int, default=2, help='同时操作的老师数')
+    parser.add_argument('--think', type=float, default=0.1, help='两次操作之间的平均间隔（秒）')
+    parser.add_argument('--import-size', type=int, default=20, help='每次导入的人数')
+    parser.add_argument('--warmup', type=float, default=3)
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--save', metavar='JSON', help='把结果保存为基线')
+    parser.add_argument('--compare', metavar='JSON', help='与基线对比，有回退时以非零状态退出')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='允许的延迟和吞吐量变化比例')
+    parser.add_argument('--noise-ms', type=float, default=5, help='小于该毫秒数的延迟变化不算回退')
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve)
+        return
+
+    result = run(args)
+    print_report(result)
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f'已保存基线到 {args.save}')
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        problems = compare(result, baseline, args.tolerance, args.noise_ms)
+        if problems:
+            print('\n与基线相比出现回退:')
+            for problem in problems:
+                print(f'  {problem}')
+            sys.exit(1)
+        print('\n与基线相比没有回退')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""对比迁移前后热点查询的执行计划和耗时
+
+先按模型建表，再删除迁移添加的索引来模拟旧版本数据库，写入测试数据后分别在
+迁移前、迁移后执行同一组查询，输出 EXPLAIN QUERY PLAN 和平均耗时。
+
+用法（在项目根目录执行）：
+    python benchmarks/query_plans.py --users 5000 --repeat 200
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+from sqlalchemy import create_engine, text
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import migrations  # noqa: E402
+from app import db  # noqa: E402
+
+# 迁移添加的索引，删除后即为旧版本数据库的结构
+MIGRATION_INDEXES = [
+    'ix_group_member_group_id',
+    'ix_group_member_user_id',
+    'ix_group_is_ungrouped',
+    'uq_group_single_ungrouped',
+    'ix_task_created_at',
+]
+
+QUERIES = [
+    ('小组人数（recount-groups）',
+     'SELECT count(*) FROM group_member WHERE group_id = :group_id', {'group_id': 7}),
+    ('用户所在小组（add_member / import_members）',
+     'SELECT id, group_id FROM group_member WHERE user_id = :user_id LIMIT 1', {'user_id': 4321}),
+    ('删除小组的成员（delete_group）',
+     'SELECT id FROM group_member WHERE group_id = :group_id', {'group_id': 7}),
+    ('查找未分组（每次打开管理面板）',
+     'SELECT id FROM "group" WHERE is_ungrouped = 1 LIMIT 1', {}),
+    ('最新作业（每次打开首页）',
+     'SELECT id FROM task ORDER BY created_at DESC LIMIT 1', {}),
+]
+
+
+def seed(engine, users, groups, tasks):
+    with engine.begin() as conn:
+        conn.execute(text('INSERT INTO "group" (id, name, is_ungrouped) VALUES (1, :n, 1)'), {'n': '未分组'})
+        conn.execute(text('INSERT INTO "group" (name, is_ungrouped) VALUES (:n, 0)'),
+                     [{'n': f'第{i}组'} for i in range(1, groups + 1)])
+        conn.execute(text('INSERT INTO user (username, password_hash, is_admin) VALUES (:u, :p, 0)'),
+                     [{'u': f'student{i}', 'p': '!pending'} for i in range(users)])
+        conn.execute(text('INSERT INTO group_member (group_id, user_id, status) VALUES (:g, :u, 0)'),
+                     [{'g': i % (groups + 1) + 1, 'u': i + 1} for i in range(users)])
+        conn.execute(text('INSERT INTO task (title, content, created_at) VALUES (:t, :c, :d)'),
+                     [{'t': f'作业{i}', 'c': '内容', 'd': f'2024-01-01 00:{i // 60 % 60:02d}:{i % 60:02d}'}
+                      for i in range(tasks)])
+
+
+def measure(engine, repeat):
+    results = []
+    with engine.connect() as conn:
+        for name, sql, params in QUERIES:
+            plan = [row[-1] for row in conn.execute(text('EXPLAIN QUERY PLAN ' + sql), params)]
+            started = time.perf_counter()
+            for _ in range(repeat):
+                conn.execute(text(sql), params).fetchall()
+            elapsed = (time.perf_counter() - started) / repeat * 1e6
+            results.append((name, plan, elapsed))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=5000)
+    parser.add_argument('--groups', type=int, default=12)
+    parser.add_argument('--tasks', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f'sqlite:///{os.path.join(tmp, "bench.db")}')
+        db.metadata.create_all(engine)
+        with engine.begin() as conn:
+            for index in MIGRATION_INDEXES:
+                conn.execute(text(f'DROP INDEX IF EXISTS {index}'))
+        seed(engine, args.users, args.groups, args.tasks)
+        with engine.begin() as conn:
+            conn.execute(text('ANALYZE'))
+
+        before = measure(engine, args.repeat)
+        migrations.upgrade(engine, log=lambda message: None)
+        with engine.begin() as conn:
+            conn.execute(text('ANALYZE'))
+        after = measure(engine, args.repeat)
+        engine.dispose()
+
+    print(f'用户 {args.users}，小组 {args.groups}，作业 {args.tasks}，每条查询执行 {args.repeat} 次\n')
+    for (name, plan_before, us_before), (_, plan_after, us_after) in zip(before, after):
+        print(name)
+        print(f'  迁移前 {us_before:8.1f} µs  {"; ".join(plan_before)}')
+        print(f'  迁移后 {us_after:8.1f} µs  {"; ".join(plan_after)}')
+        print()
+
+
+if __name__ == '__main__':
+    main()
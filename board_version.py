@@ -0,0 +1,71 @@
+"""看板版本号
+
+所有工作进程共享 instance 目录下的一个 16 字节文件：前 8 字节是文件创建时随机生成的纪元值，
+后 8 字节是单调递增的版本号。文件通过 mmap 映射到内存，读取版本号不需要查询数据库，
+也不需要系统调用；写入时用文件锁和线程锁保证多个进程、多个线程同时递增不会丢失。
+
+纪元值保证删除文件重建后，新的版本号不会与浏览器缓存中的旧 ETag 冲突。
+"""
+import mmap
+import os
+import struct
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows 下没有 fcntl，递增时不加进程锁
+    fcntl = None
+
+_FORMAT = '<QQ'
+_SIZE = struct.calcsize(_FORMAT)
+
+
+class BoardVersion:
+    def __init__(self, path):
+        self.path = path
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        self._thread_lock = threading.Lock()
+        with self._locked():
+            if os.fstat(self._fd).st_size < _SIZE:
+                epoch = struct.unpack('<Q', os.urandom(8))[0]
+                os.pwrite(self._fd, struct.pack(_FORMAT, epoch, 0), 0)
+        self._map = mmap.mmap(self._fd, _SIZE)
+
+    @contextmanager
+    def _locked(self):
+        # 同一进程的线程共用一个文件描述符，flock 对它们不互斥，还需要线程锁
+        with self._thread_lock:
+            if fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def get(self):
+        """返回 (纪元, 版本号)"""
+        return struct.unpack(_FORMAT, self._map[:_SIZE])
+
+    def bump(self):
+        """版本号加一并返回新的版本号"""
+        with self._locked():
+            epoch, version = struct.unpack(_FORMAT, self._map[:_SIZE])
+            version += 1
+            self._map[:_SIZE] = struct.pack(_FORMAT, epoch, version)
+            return version
+
+    def close(self):
+        self._map.close()
+        os.close(self._fd)
+
+    @staticmethod
+    def format_etag(value):
+        """把 get() 的返回值格式化为 ETag"""
+        epoch, version = value
+        return f'{epoch:x}-{version}'
+
+    @property
+    def etag(self):
+        return self.format_etag(self.get())
@@ -0,0 +1,89 @@
+"""进程内看板缓存
+
+缓存条目按名称存放，并记录生成时的看板版本号。看板版本号保存在所有工作进程共享的文件中
+（见 board_version.py），任何写操作提交后版本号加一，各进程下次读取时发现版本不一致即重新生成，
+因此多个进程之间不需要互相通知也能保持一致。
+
+条目另有过期时间作为兜底，总条目数超过上限时淘汰最久未使用的条目。同一个条目失效后，
+并发请求中只有一个会重新生成，其余等待它的结果，避免高峰期大量请求同时查询数据库。
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class _Entry:
+    __slots__ = ('version', 'value', 'expires')
+
+    def __init__(self, version, value, expires):
+        self.version = version
+        self.value = value
+        self.expires = expires
+
+
+class BoardCache:
+    def __init__(self, max_entries=128, ttl=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    def _lookup(self, key, version):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if entry.version != version or entry.expires <= time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return entry
+
+    def get_or_create(self, key, version, factory):
+        """返回 key 在 version 下的缓存值，不存在或已过期时调用 factory() 生成"""
+        with self._lock:
+            entry = self._lookup(key, version)
+            if entry is not None:
+                self.hits += 1
+                return entry.value
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            # 等锁期间其他线程可能已经生成好了
+            with self._lock:
+                entry = self._lookup(key, version)
+                if entry is not None:
+                    self.hits += 1
+                    return entry.value
+                self.misses += 1
+
+            value = factory()
+
+            with self._lock:
+                self._data[key] = _Entry(version, value, time.monotonic() + self.ttl)
+                self._data.move_to_end(key)
+                while len(self._data) > self.max_entries:
+                    evicted, _ = self._data.popitem(last=False)
+                    self._key_locks.pop(evicted, None)
+                    self.evictions += 1
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': round(self.hits / total, 4) if total else 0.0,
+            }
@@ -0,0 +1,119 @@
+"""看板事件广播
+
+事件先和业务修改在同一个事务中写入数据库的 board_event 表，再由每个工作进程内的
+一个轮询线程读出新事件，分发给本进程内所有 SSE 连接。这样多个 gunicorn 工作进程之间
+不需要额外的消息服务也能看到彼此的修改。
+
+每个连接的队列有长度上限，客户端读得太慢导致队列写满时，该连接会收到 resync 事件并断开，
+由浏览器重新连接后整页刷新，不会让服务端内存无限增长。
+"""
+import json
+import queue
+import threading
+import time
+
+
+class TooManyClients(Exception):
+    """当前进程的 SSE 连接数已达上限"""
+
+
+class Subscriber:
+    def __init__(self, queue_size):
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.overflowed = False
+
+    def put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            self.overflowed = True
+
+
+class EventBroadcaster:
+    """在一个后台线程中轮询事件表，并把新事件分发给本进程的订阅者
+
+    fetch_events(after_id, limit) 返回 [(id, type, payload_json), ...]，按 id 升序；
+    fetch_last_id() 返回事件表当前最大 id；prune() 删除过期事件。三者都由调用方提供，
+    本模块不依赖具体的数据库模型。
+    """
+
+    def __init__(self, fetch_events, fetch_last_id, prune=None, poll_interval=0.5,
+                 queue_size=100, max_clients=100, prune_interval=60):
+        self.fetch_events = fetch_events
+        self.fetch_last_id = fetch_last_id
+        self.prune = prune
+        self.poll_interval = poll_interval
+        self.queue_size = queue_size
+        self.max_clients = max_clients
+        self.prune_interval = prune_interval
+        self.last_id = None
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._closed = False
+
+    def subscribe(self):
+        with self._lock:
+            if len(self._subscribers) >= self.max_clients:
+                raise TooManyClients()
+            subscriber = Subscriber(self.queue_size)
+            self._subscribers.add(subscriber)
+            if self._thread is None or not self._thread.is_alive():
+                self.last_id = self.fetch_last_id()
+                self._thread = threading.Thread(target=self._run, name='board-events', daemon=True)
+                self._thread.start()
+            self._wakeup.set()
+            return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    @property
+    def client_count(self):
+        return len(self._subscribers)
+
+    def close(self):
+        """停止轮询线程（所属的班级数据库被关闭时调用）"""
+        self._closed = True
+        self._wakeup.set()
+
+    def _run(self):
+        last_prune = time.monotonic()
+        while not self._closed:
+            if not self._subscribers:
+                # 没有连接时不轮询数据库
+                self._wakeup.clear()
+                self._wakeup.wait()
+                if self._closed:
+                    break
+                self.last_id = self.fetch_last_id()
+                continue
+
+            try:
+                events = self.fetch_events(self.last_id, 500)
+            except Exception:
+                events = []
+            if events:
+                self.last_id = events[-1][0]
+                with self._lock:
+                    subscribers = list(self._subscribers)
+                for event in events:
+                    for subscriber in subscribers:
+                        subscriber.put(event)
+
+            if self.prune and time.monotonic() - last_prune > self.prune_interval:
+                last_prune = time.monotonic()
+                try:
+                    self.prune()
+                except Exception:
+                    pass
+            time.sleep(self.poll_interval)
+
+
+def format_sse(event_id, event_type, data):
+    """按 text/event-stream 格式输出一条事件"""
+    if not isinstance(data, str):
+        data = json.dumps(data, ensure_ascii=False)
+    return f'id: {event_id}\nevent: {event_type}\ndata: {data}\n\n'
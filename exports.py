@@ -0,0 +1,169 @@
+"""流式导出
+
+把逐行产生的数据编码成 CSV 或 XLSX，边生成边输出字节块，不在内存中拼出整个文件，
+导出的行数再多，工作进程的内存占用也基本不变。
+
+XLSX 本质上是一个 zip 包：zipfile 写入不可 seek 的输出流时会在每个文件后附带数据描述符，
+工作表 XML 可以逐行写入并压缩，写满一块就交给调用方发送。单元格使用内联字符串，
+不需要先收集全部文本生成共享字符串表。
+"""
+import codecs
+import csv
+import io
+import zipfile
+import zlib
+from datetime import datetime
+from xml.sax.saxutils import escape
+
+# 累积到这么多字节后输出一块
+CHUNK_SIZE = 64 * 1024
+
+# XML 1.0 不允许出现的控制字符
+_ILLEGAL_XML_CHARS = dict.fromkeys(c for c in range(32) if c not in (9, 10, 13))
+
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M')
+    return value
+
+
+def csv_stream(header, rows):
+    """逐块生成 CSV；带 UTF-8 BOM，Excel 直接打开时中文不会乱码"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('\ufeff')
+    writer.writerow(header)
+    for row in rows:
+        writer.writerow([_csv_value(value) for value in row])
+        if buffer.tell() >= CHUNK_SIZE:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+
+def gzip_stream(chunks, level=6):
+    """对字节块流做 gzip 压缩，每个输入块压缩后立即输出（可能为空的块会被跳过）"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits=31：带 gzip 头
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+class _ChunkWriter(io.RawIOBase):
+    """zipfile 的输出目标：只追加、不可 seek，写入的数据由 take() 取走"""
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._buffer += data
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    @property
+    def pending(self):
+        return len(self._buffer)
+
+    def take(self):
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+
+_CONTENT_TYPES = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="xml" ContentType="application/xml"/>
+<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>
+<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>
+<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>
+</Types>'''
+
+_ROOT_RELS = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>
+</Relationships>'''
+
+_WORKBOOK = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">
+<sheets><sheet name="{name}" sheetId="1" r:id="rId1"/></sheets>
+</workbook>'''
+
+_WORKBOOK_RELS = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>
+<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>
+</Relationships>'''
+
+# 样式 0 为默认，样式 1 为日期时间（内置格式 22：yyyy/m/d h:mm）
+_STYLES = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">
+<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>
+<fills count="2"><fill><patternFill patternType="none"/></fill><fill><patternFill patternType="gray125"/></fill></fills>
+<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>
+<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>
+<cellXfs count="2"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/><xf numFmtId="22" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/></cellXfs>
+<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>
+</styleSheet>'''
+
+_SHEET_HEAD = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+               '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>')
+_SHEET_TAIL = '</sheetData></worksheet>'
+
+_EXCEL_EPOCH = datetime(1899, 12, 30)
+
+
+def _cell(value):
+    if value is None:
+        return '<c/>'
+    if isinstance(value, bool):
+        return f'<c t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float)):
+        return f'<c><v>{value}</v></c>'
+    if isinstance(value, datetime):
+        serial = (value - _EXCEL_EPOCH).total_seconds() / 86400
+        return f'<c s="1"><v>{serial:.6f}</v></c>'
+    text = escape(str(value).translate(_ILLEGAL_XML_CHARS))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _row(values):
+    return '<row>' + ''.join(_cell(value) for value in values) + '</row>'
+
+
+def xlsx_stream(header, rows, sheet_name='Sheet1'):
+    """逐块生成只有一个工作表的 XLSX 文件"""
+    output = _ChunkWriter()
+    with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('[Content_Types].xml', _CONTENT_TYPES)
+        archive.writestr('_rels/.rels', _ROOT_RELS)
+        archive.writestr('xl/workbook.xml', _WORKBOOK.format(name=escape(sheet_name[:31], {'"': '&quot;'})))
+        archive.writestr('xl/_rels/workbook.xml.rels', _WORKBOOK_RELS)
+        archive.writestr('xl/styles.xml', _STYLES)
+        yield output.take()
+
+        # force_zip64：事先不知道工作表有多大，超过 4GB 也能写入
+        with archive.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as raw:
+            sheet = codecs.getwriter('utf-8')(raw)
+            sheet.write(_SHEET_HEAD)
+            sheet.write(_row(header))
+            for row in rows:
+                sheet.write(_row(row))
+                if output.pending >= CHUNK_SIZE:
+                    yield output.take()
+            sheet.write(_SHEET_TAIL)
+    yield output.take()
+
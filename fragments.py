@@ -0,0 +1,56 @@
+"""模板片段缓存
+
+首页和管理面板每次请求都要把所有小组卡片重新渲染一遍，而两次请求之间通常只有个别小组发生变化。
+{% cache %} 标签把一段模板的渲染结果缓存在进程内，下次渲染时版本相同就直接输出缓存的 HTML：
+
+    {% cache 'index-group', group.id, version=(group.version, task_id) %}
+        ...小组卡片...
+    {% endcache %}
+
+逗号分隔的表达式组成缓存键，version 不同时重新渲染并替换原条目，同一张卡片只占一个条目。
+小组的版本号保存在 group.version 中，与成员、完成状态的修改在同一事务中递增，所以版本号相同的
+卡片内容一定相同，多个进程之间不需要互相通知。
+
+缓存的片段只能依赖键和版本中包含的数据，不要在其中使用当前用户、CSRF 令牌等随请求变化的内容。
+"""
+from jinja2 import nodes
+from jinja2.ext import Extension
+
+
+class FragmentCacheExtension(Extension):
+    """{% cache 键, ..., version=版本 %}...{% endcache %}
+
+    缓存对象由应用设置为 environment.fragment_cache（需要提供 get_or_create(key, version, factory)，
+    例如 cache.BoardCache），为 None 时不缓存；environment.fragment_cache_scope() 返回的值加在键的
+    最前面，用于区分不同班级。
+    """
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=None, fragment_cache_scope=lambda: None)
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        keys = []
+        version = nodes.Const(None)
+        while parser.stream.current.type != 'block_end':
+            if keys:
+                parser.stream.expect('comma')
+            if parser.stream.current.test('name:version') and parser.stream.look().test('assign'):
+                next(parser.stream)
+                next(parser.stream)
+                version = parser.parse_expression()
+                break
+            keys.append(parser.parse_expression())
+        if not keys:
+            parser.fail('cache 标签至少需要一个键', lineno)
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+        return nodes.CallBlock(self.call_method('_render', [nodes.Tuple(keys, 'load'), version]),
+                               [], [], body).set_lineno(lineno)
+
+    def _render(self, keys, version, caller):
+        cache = self.environment.fragment_cache
+        if cache is None:
+            return caller()
+        return cache.get_or_create((self.environment.fragment_cache_scope(),) + keys, version, caller)
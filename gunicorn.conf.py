@@ -0,0 +1,41 @@
+# gunicorn 配置，所有参数均可通过环境变量覆盖
+import multiprocessing
+import os
+import sys
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5678')
+
+# SQLite 只有一个写入者，进程数不宜过多，用线程处理并发请求
+# 每个 /api/events 实时推送连接会占用一个线程，线程数需大于同时在线的看板页面数 / 进程数
+workers = int(os.environ.get('GUNICORN_WORKERS', min(multiprocessing.cpu_count() * 2 + 1, 8)))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 16))
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+graceful_timeout = 30
+keepalive = 5
+
+# 定期重启工作进程，防止内存缓慢增长
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = 200
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
+
+# 请求指标：各工作进程把快照写入同一目录，/metrics 汇总所有进程（见 metrics.py）
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import metrics  # noqa: E402
+
+metrics_dir = os.environ.get('METRICS_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                           'instance', 'metrics')
+
+
+def on_starting(server):
+    # 服务整体重启时计数从零开始
+    metrics.clear(metrics_dir)
+
+
+def child_exit(server, worker):
+    # 工作进程退出（包括 max_requests 定期重启）后，把它的计数并入 archive.json
+    metrics.reap(metrics_dir)
@@ -0,0 +1,104 @@
+"""后台任务
+
+批量导入、自动分组、重置分组等耗时操作不在请求中直接执行：请求把任务写入数据库的 job 表后
+立即返回任务 ID，由各工作进程内的后台线程领取执行，页面轮询 /api/jobs/<id> 显示进度。
+任务表本身就是队列，不需要额外的消息服务；多个进程同时领取同一个任务时，由带条件的 UPDATE
+保证只有一个进程领到。
+
+执行中的任务定期刷新心跳时间。工作进程崩溃或被重启后，心跳超时的任务由任意一个进程
+放回队列重试（超过最大尝试次数时标记为失败）。
+"""
+import os
+import socket
+import threading
+import time
+
+
+class JobCancelled(Exception):
+    """管理员取消了正在执行的任务"""
+
+
+class JobLost(Exception):
+    """任务的心跳超时，已被放回队列由其他进程重新执行，本进程应放弃当前结果"""
+
+
+class JobRunner:
+    """在后台线程中领取并执行任务
+
+    claim(worker_id) 领取一个到期的任务，返回任务标识或 None；execute(job_id, worker_id) 执行任务
+    并更新状态；heartbeat(job_ids, worker_id) 刷新执行中任务的心跳；recover() 处理心跳超时的任务。
+    四者都由调用方提供，本模块不依赖具体的数据库模型。periodic() 可选，和 recover() 一起定期调用，
+    用于按计划创建任务（例如定时备份）。
+    """
+
+    def __init__(self, claim, execute, heartbeat, recover, workers=1, poll_interval=1.0,
+                 heartbeat_interval=10, periodic=None):
+        self.claim = claim
+        self.execute = execute
+        self.heartbeat = heartbeat
+        self.recover = recover
+        self.periodic = periodic
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.worker_id = None
+        self._active = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._pid = None
+
+    def start(self):
+        """启动后台线程；已经启动时直接返回。fork 出的子进程需要重新启动自己的线程"""
+        if self._pid == os.getpid() or self.workers <= 0:
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self.worker_id = f'{socket.gethostname()}:{self._pid}'
+            self._active = set()
+            for i in range(self.workers):
+                threading.Thread(target=self._work, name=f'jobs-{i}', daemon=True).start()
+            threading.Thread(target=self._monitor, name='jobs-monitor', daemon=True).start()
+
+    def wakeup(self):
+        """有新任务入队，让空闲的线程立即领取"""
+        self._wakeup.set()
+
+    @property
+    def active(self):
+        with self._lock:
+            return set(self._active)
+
+    def _work(self):
+        while True:
+            try:
+                job_id = self.claim(self.worker_id)
+            except Exception:
+                job_id = None
+            if job_id is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            with self._lock:
+                self._active.add(job_id)
+            try:
+                self.execute(job_id, self.worker_id)
+            except Exception:
+                pass  # execute 自己记录失败，这里只保证线程不退出
+            finally:
+                with self._lock:
+                    self._active.discard(job_id)
+
+    def _monitor(self):
+        while True:
+            active = self.active
+            try:
+                if active:
+                    self.heartbeat(active, self.worker_id)
+                self.recover()
+                if self.periodic is not None:
+                    self.periodic()
+            except Exception:
+                pass  # 数据库正忙时下一轮再试
+            time.sleep(self.heartbeat_interval)
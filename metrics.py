@@ -0,0 +1,247 @@
+"""请求指标
+
+每个请求结束时按接口记录：请求数、耗时直方图、SQL 条数和耗时、模板渲染耗时、密码哈希耗时，
+以 Prometheus 文本格式在 /metrics 输出。记录只是在进程内的字典上做加法，开销很小，可以在生产环境常开。
+
+多个工作进程各自在 instance/metrics 目录下写一个快照文件（metrics-<pid>-<随机串>.json，
+最多每秒写一次），/metrics 读取所有文件相加，因此无论请求落在哪个进程，看到的都是全部进程的合计。
+已退出进程的文件由 reap() 合并进 archive.json 后删除，计数不会因为工作进程重启而丢失或倒退。
+"""
+import glob
+import json
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows 下没有 fcntl，合并文件时不加进程锁
+    fcntl = None
+
+# 请求耗时直方图的分桶（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# 指标名 -> (类型, 说明)
+METRICS = {
+    'http_requests_total': ('counter', '请求数'),
+    'http_request_duration_seconds': ('histogram', '请求处理耗时'),
+    'db_queries_total': ('counter', '执行的 SQL 条数'),
+    'db_query_duration_seconds_total': ('counter', '执行 SQL 的总耗时'),
+    'template_render_duration_seconds_total': ('counter', '渲染模板的总耗时'),
+    'password_hash_duration_seconds_total': ('counter', '计算密码哈希的总耗时'),
+    'password_hash_wait_seconds_total': ('counter', '等待密码哈希名额的总耗时'),
+}
+
+ARCHIVE = 'archive.json'
+_FILE_PATTERN = 'metrics-*.json'
+
+
+def _empty():
+    return {'counters': {}, 'histograms': {}}
+
+
+def _key(name, labels):
+    return json.dumps([name, sorted(labels.items())], ensure_ascii=False)
+
+
+def _merge(target, source):
+    for key, value in source['counters'].items():
+        target['counters'][key] = target['counters'].get(key, 0) + value
+    for key, values in source['histograms'].items():
+        current = target['histograms'].get(key)
+        if current is None:
+            target['histograms'][key] = list(values)
+        else:
+            target['histograms'][key] = [a + b for a, b in zip(current, values)]
+
+
+def _load(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return _empty()
+
+
+def _write(path, data):
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def reap(directory):
+    """把已退出进程的快照合并进 archive.json 并删除，返回合并的文件数
+
+    每个进程启动时调用一次；gunicorn 的主进程在工作进程退出后也会调用（见 gunicorn.conf.py）。
+    """
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, '.lock'), 'w') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            dead = []
+            for path in glob.glob(os.path.join(directory, _FILE_PATTERN)):
+                pid = os.path.basename(path).split('-')[1]
+                if pid.isdigit() and int(pid) != os.getpid() and not _pid_alive(int(pid)):
+                    dead.append(path)
+            if not dead:
+                return 0
+            archive_path = os.path.join(directory, ARCHIVE)
+            archive = _load(archive_path)
+            for path in dead:
+                _merge(archive, _load(path))
+            _write(archive_path, archive)
+            for path in dead:
+                os.unlink(path)
+            return len(dead)
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def clear(directory):
+    """删除所有快照，服务整体重启时调用，计数从零开始"""
+    for path in glob.glob(os.path.join(directory, _FILE_PATTERN)) + [os.path.join(directory, ARCHIVE)]:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    return repr(round(value, 6)) if isinstance(value, float) else str(value)
+
+
+class Metrics:
+    def __init__(self, directory=None, buckets=DEFAULT_BUCKETS, flush_interval=1.0):
+        self.directory = directory
+        self.buckets = tuple(buckets)
+        self.flush_interval = flush_interval
+        self._data = _empty()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._last_flush = 0.0
+        self._pid = None
+        self._path = None
+        if directory:
+            reap(directory)
+
+    def inc(self, name, labels, value=1):
+        key = _key(name, labels)
+        with self._lock:
+            counters = self._data['counters']
+            counters[key] = counters.get(key, 0) + value
+
+    def observe(self, name, labels, value):
+        """记录直方图的一个样本：各分桶计数（非累计）+ 总和 + 样本数"""
+        key = _key(name, labels)
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        with self._lock:
+            values = self._data['histograms'].get(key)
+            if values is None:
+                values = self._data['histograms'][key] = [0] * (len(self.buckets) + 3)
+            values[index] += 1
+            values[-2] += value
+            values[-1] += 1
+
+    def record_request(self, endpoint, method, status, duration, timings):
+        """记录一个请求；timings 为 {'db': 秒, 'queries': 条数, 'template': 秒, 'hash': 秒, 'hash_wait': 秒}"""
+        labels = {'endpoint': endpoint}
+        self.inc('http_requests_total', {'endpoint': endpoint, 'method': method, 'status': str(status)})
+        self.observe('http_request_duration_seconds', labels, duration)
+        if timings.get('queries'):
+            self.inc('db_queries_total', labels, timings['queries'])
+            self.inc('db_query_duration_seconds_total', labels, timings['db'])
+        if timings.get('template'):
+            self.inc('template_render_duration_seconds_total', labels, timings['template'])
+        if timings.get('hash'):
+            self.inc('password_hash_duration_seconds_total', labels, timings['hash'])
+        if timings.get('hash_wait'):
+            self.inc('password_hash_wait_seconds_total', labels, timings['hash_wait'])
+        self.flush()
+
+    def snapshot(self):
+        with self._lock:
+            return {'counters': dict(self._data['counters']),
+                    'histograms': {key: list(values) for key, values in self._data['histograms'].items()}}
+
+    def flush(self, force=False):
+        """把本进程的数据写入快照文件；距上次写入不到 flush_interval 秒时跳过"""
+        if not self.directory:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_flush < self.flush_interval:
+            return
+        if not self._flush_lock.acquire(blocking=force):
+            return  # 其他线程正在写
+        try:
+            self._last_flush = now
+            if self._pid != os.getpid():
+                # 第一次写入，或者 fork 出的子进程：使用自己的文件
+                self._pid = os.getpid()
+                self._path = os.path.join(self.directory, f'metrics-{self._pid}-{os.urandom(4).hex()}.json')
+            _write(self._path, self.snapshot())
+        finally:
+            self._flush_lock.release()
+
+    def collect(self):
+        """返回所有进程合计的数据"""
+        if not self.directory:
+            return self.snapshot()
+        self.flush(force=True)
+        total = _load(os.path.join(self.directory, ARCHIVE))
+        for path in glob.glob(os.path.join(self.directory, _FILE_PATTERN)):
+            _merge(total, _load(path))
+        return total
+
+    def render(self):
+        """Prometheus 文本格式"""
+        data = self.collect()
+        series = {}
+        for kind in ('counters', 'histograms'):
+            for key, value in data[kind].items():
+                name, pairs = json.loads(key)
+                series.setdefault(name, []).append((pairs, value))
+
+        bounds = [repr(b) for b in self.buckets] + ['+Inf']
+        lines = []
+        for name in sorted(series):
+            kind, help_text = METRICS.get(name, ('untyped', ''))
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for pairs, value in sorted(series[name]):
+                if kind != 'histogram':
+                    lines.append(f'{name}{_format_labels(pairs)} {_format_value(value)}')
+                    continue
+                cumulative = 0
+                for bound, count in zip(bounds, value[:-2]):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{_format_labels(pairs + [["le", bound]])} {cumulative}')
+                lines.append(f'{name}_sum{_format_labels(pairs)} {_format_value(value[-2])}')
+                lines.append(f'{name}_count{_format_labels(pairs)} {value[-1]}')
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,136 @@
+"""数据库结构迁移
+
+db.create_all() 只会创建缺少的表，不会修改已有的表，所以已经部署的数据库拿不到模型上新增的
+索引和约束。这里按版本号顺序列出需要对已有数据库执行的 SQL，已执行的版本记录在
+schema_migration 表中，启动时只执行尚未执行的版本，每个版本在一个事务中完成。
+
+新建的数据库由 create_all() 按模型建好索引后，同样会依次执行这些迁移；所有语句都写成
+可以重复执行的形式（IF NOT EXISTS、先清理后建约束），因此结果一致。
+
+新增迁移时在 MIGRATIONS 末尾追加，不要修改已经发布的版本。语句按 SQLite 语法编写；
+SQLite 的 ADD COLUMN 不支持 IF NOT EXISTS，需要先检查的语句写成接收连接的函数。
+会删除已有数据的步骤必须以警告写入日志（logger），说明删除了什么。
+"""
+import logging
+from datetime import datetime
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+# 保留每个用户 id 最大（最近加入）的那条组员记录
+_DUPLICATE_MEMBERS = (
+    'SELECT id FROM group_member WHERE id NOT IN '
+    '(SELECT MAX(id) FROM group_member GROUP BY user_id)'
+)
+# 保留 id 最小的未分组，其余未分组的成员并入该组
+_FIRST_UNGROUPED = '(SELECT MIN(id) FROM "group" WHERE is_ungrouped = 1)'
+
+
+def _remove_duplicate_members(connection):
+    """每个用户只保留最近加入的一条组员记录，删除其余记录
+
+    被删除记录的完成情况并入保留的记录（同一作业两边都有时以保留记录的为准），
+    删除了哪些用户的记录以警告写入日志，便于事后核对。
+    """
+    rows = connection.execute(text(
+        f'SELECT id, user_id, group_id FROM group_member WHERE id IN ({_DUPLICATE_MEMBERS}) ORDER BY user_id, id'
+    )).all()
+    if not rows:
+        return
+    merged = connection.execute(text(
+        'UPDATE OR IGNORE submission SET member_id = (SELECT MAX(keep.id) FROM group_member AS keep '
+        'WHERE keep.user_id = (SELECT user_id FROM group_member WHERE id = submission.member_id)) '
+        f'WHERE member_id IN ({_DUPLICATE_MEMBERS})'
+    )).rowcount
+    dropped = connection.execute(text(f'DELETE FROM submission WHERE member_id IN ({_DUPLICATE_MEMBERS})')).rowcount
+    connection.execute(text(f'DELETE FROM group_member WHERE id IN ({_DUPLICATE_MEMBERS})'))
+    details = ', '.join(f'用户{user_id}(记录{member_id}, 小组{group_id})' for member_id, user_id, group_id in rows)
+    logger.warning(f'迁移 2: 删除了 {len(rows)} 条重复的组员记录，每个用户保留最近加入的一条: {details}；'
+                   f'{merged} 条完成记录已并入保留的记录，{dropped} 条与保留记录重复的已删除')
+
+
+def _add_column(table, name, ddl):
+    """返回一个迁移步骤：表中还没有该列时添加"""
+    def step(connection):
+        columns = {row[1] for row in connection.execute(text(f'PRAGMA table_info("{table}")'))}
+        if name not in columns:
+            connection.execute(text(f'ALTER TABLE "{table}" ADD COLUMN {name} {ddl}'))
+    return step
+
+
+MIGRATIONS = [
+    (1, '为常用查询字段添加索引', [
+        'CREATE INDEX IF NOT EXISTS ix_group_member_group_id ON group_member (group_id)',
+        'CREATE INDEX IF NOT EXISTS ix_group_is_ungrouped ON "group" (is_ungrouped)',
+        'CREATE INDEX IF NOT EXISTS ix_task_created_at ON task (created_at)',
+    ]),
+    (2, '每个用户只能属于一个小组', [
+        _remove_duplicate_members,
+        'CREATE UNIQUE INDEX IF NOT EXISTS ix_group_member_user_id ON group_member (user_id)',
+    ]),
+    (3, '只允许存在一个未分组', [
+        f'UPDATE group_member SET group_id = {_FIRST_UNGROUPED} WHERE group_id IN '
+        f'(SELECT id FROM "group" WHERE is_ungrouped = 1 AND id > {_FIRST_UNGROUPED})',
+        f'DELETE FROM "group" WHERE is_ungrouped = 1 AND id > {_FIRST_UNGROUPED}',
+        'CREATE UNIQUE INDEX IF NOT EXISTS uq_group_single_ungrouped ON "group" (is_ungrouped) '
+        'WHERE is_ungrouped = 1',
+    ]),
+    (4, '小组人数上限和人数计数', [
+        _add_column('group', 'capacity', 'INTEGER'),
+        _add_column('group', 'member_count', "INTEGER NOT NULL DEFAULT '0'"),
+        'UPDATE "group" SET capacity = CASE WHEN is_ungrouped = 1 THEN NULL ELSE 5 END '
+        'WHERE capacity IS NULL',
+        'UPDATE "group" SET member_count = '
+        '(SELECT count(*) FROM group_member WHERE group_member.group_id = "group".id)',
+    ]),
+    (5, '作业内容预处理结果', [
+        # 内容由应用启动时的 render_tasks() 生成
+        _add_column('task', 'content_html', 'TEXT'),
+        _add_column('task', 'excerpt', 'VARCHAR(200)'),
+        _add_column('task', 'content_hash', 'VARCHAR(64)'),
+    ]),
+    (6, '小组卡片版本号', [
+        _add_column('group', 'version', "INTEGER NOT NULL DEFAULT '0'"),
+    ]),
+    (7, '旧的完成状态迁移为最新作业的完成记录', [
+        # 完成状态原来只有 group_member.status 一个标记，对应当时的最新作业。submission 表中已有记录时
+        # 说明已经按作业记录过完成情况，此时的旧标记已经过时，不再迁移
+        'INSERT OR IGNORE INTO submission (task_id, member_id, status, updated_at) '
+        'SELECT (SELECT id FROM task ORDER BY created_at DESC, id DESC LIMIT 1), id, 1, CURRENT_TIMESTAMP '
+        'FROM group_member WHERE status = 1 AND EXISTS (SELECT 1 FROM task) '
+        'AND NOT EXISTS (SELECT 1 FROM submission)',
+    ]),
+]
+
+
+def applied_versions(connection):
+    connection.execute(text(
+        'CREATE TABLE IF NOT EXISTS schema_migration ('
+        'version INTEGER PRIMARY KEY, name VARCHAR(200) NOT NULL, applied_at DATETIME NOT NULL)'
+    ))
+    return {row[0] for row in connection.execute(text('SELECT version FROM schema_migration'))}
+
+
+def upgrade(engine, log=print):
+    """执行所有尚未执行的迁移，返回本次执行的版本号列表"""
+    with engine.begin() as connection:
+        done = applied_versions(connection)
+
+    applied = []
+    for version, name, statements in MIGRATIONS:
+        if version in done:
+            continue
+        with engine.begin() as connection:
+            for statement in statements:
+                if callable(statement):
+                    statement(connection)
+                else:
+                    connection.execute(text(statement))
+            connection.execute(
+                text('INSERT INTO schema_migration (version, name, applied_at) VALUES (:v, :n, :t)'),
+                {'v': version, 'n': name, 't': datetime.utcnow()}
+            )
+        log(f'数据库迁移 {version}: {name}')
+        applied.append(version)
+    return applied
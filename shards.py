@@ -0,0 +1,209 @@
+"""班级分片
+
+每个班级（租户）的小组、成员、作业等数据保存在 SHARD_DIR 下单独的 SQLite 文件 <班级标识>.db 中，
+访问路径为 /c/<班级标识>/...；不带前缀的路径仍使用原来的数据库（默认分片）。一个进程可以同时
+服务很多班级，不同班级的写入互不阻塞；把一个班级迁移到其他服务器只需要复制它的数据库文件。
+
+ShardMiddleware 把路径中的班级前缀移到 SCRIPT_NAME，应用内的路由不需要改动，url_for 生成的
+链接也自动带上前缀。ShardRouter 按需打开班级数据库，打开的数据库数有上限，超过上限或长时间
+没有访问时关闭最久未使用的空闲分片。
+"""
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from werkzeug.exceptions import NotFound
+
+# 班级标识：小写字母、数字和连字符，同时用作文件名和 URL 路径
+SLUG_PATTERN = re.compile(r'^[a-z0-9][a-z0-9-]{0,62}$')
+
+# 请求所属班级在 WSGI environ 中的键
+ENVIRON_KEY = 'homework.class'
+
+
+def valid_slug(slug):
+    return bool(slug) and SLUG_PATTERN.match(slug) is not None
+
+
+class ShardClosed(Exception):
+    """分片已被关闭（后台线程持有的分片对象过期）"""
+
+
+class ShardMiddleware:
+    """把 /c/<班级标识>/... 的请求交给应用：前缀移到 SCRIPT_NAME，班级标识记录在 environ 中"""
+
+    def __init__(self, wsgi_app, router, prefix='/c/'):
+        self.wsgi_app = wsgi_app
+        self.router = router
+        self.prefix = prefix
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        if path.startswith(self.prefix):
+            slug, _, rest = path[len(self.prefix):].partition('/')
+            if not self.router.exists(slug):
+                return NotFound()(environ, start_response)
+            environ['SCRIPT_NAME'] = environ.get('SCRIPT_NAME', '') + self.prefix + slug
+            environ['PATH_INFO'] = '/' + rest
+            environ[ENVIRON_KEY] = slug
+        return self.wsgi_app(environ, start_response)
+
+
+class Shard:
+    """一个已打开的分片：数据库 engine 以及和它一起创建、关闭的状态（版本号、事件广播器等）"""
+
+    def __init__(self, slug, engine, **state):
+        self.slug = slug
+        self.engine = engine
+        self.__dict__.update(state)
+        self.in_use = 0
+        self.last_used = time.monotonic()
+
+
+class ShardRouter:
+    """按班级标识返回已打开的分片，需要时调用 open_shard(slug) 打开
+
+    acquire() 和 release() 成对使用，使用中的分片不会被关闭。打开的分片超过 max_open 个时，
+    关闭最久未使用的空闲分片；空闲超过 idle_timeout 秒的分片也会被关闭。is_busy(shard) 为真的分片
+    （例如还有实时推送连接或正在执行的任务）即使空闲也不关闭。关闭时调用 close_shard(shard)。
+    """
+
+    def __init__(self, directory, open_shard, close_shard, default=None, max_open=64,
+                 idle_timeout=600, is_busy=None):
+        self.directory = directory
+        self.open_shard = open_shard
+        self.close_shard = close_shard
+        self.default = default
+        self.max_open = max_open
+        self.idle_timeout = idle_timeout
+        self.is_busy = is_busy or (lambda shard: False)
+        self.opened = 0
+        self.closed = 0
+        self._shards = OrderedDict()
+        self._opening = {}
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, slug):
+        return os.path.join(self.directory, f'{slug}.db')
+
+    def exists(self, slug):
+        return valid_slug(slug) and os.path.isfile(self.path(slug))
+
+    def slugs(self):
+        """数据目录下所有班级的标识"""
+        return sorted(name[:-3] for name in os.listdir(self.directory)
+                      if name.endswith('.db') and valid_slug(name[:-3]))
+
+    @property
+    def shards(self):
+        """默认分片和所有已打开的分片"""
+        with self._lock:
+            opened = list(self._shards.values())
+        return ([self.default] if self.default is not None else []) + opened
+
+    def _take(self, shard, touch):
+        shard.in_use += 1
+        if touch:
+            shard.last_used = time.monotonic()
+            self._shards.move_to_end(shard.slug)
+        return shard
+
+    def acquire(self, slug, touch=True):
+        """返回班级的分片并标记为使用中，没有打开时先打开；slug 为 None 时返回默认分片
+
+        touch=False 用于后台任务、命令行等访问，不算作班级被访问，不影响空闲关闭的顺序。
+        """
+        if slug is None:
+            return self.default
+        with self._lock:
+            shard = self._shards.get(slug)
+            if shard is not None:
+                return self._take(shard, touch)
+            opening = self._opening.setdefault(slug, threading.Lock())
+
+        # 同一个班级只由一个线程打开，其他线程等待它的结果
+        with opening:
+            with self._lock:
+                shard = self._shards.get(slug)
+                if shard is not None:
+                    return self._take(shard, touch)
+            try:
+                shard = self.open_shard(slug)
+            finally:
+                with self._lock:
+                    self._opening.pop(slug, None)
+            with self._lock:
+                self._shards[slug] = shard
+                self.opened += 1
+                self._take(shard, True)
+                evicted = self._collect(time.monotonic())
+        self._close(evicted)
+        return shard
+
+    def hold(self, shard):
+        """把已打开的分片标记为使用中，不算作班级被访问；分片已被关闭时抛出 ShardClosed
+
+        后台线程遍历 shards 时使用，不会把刚关闭的分片重新打开。
+        """
+        if shard is self.default:
+            return shard
+        with self._lock:
+            if self._shards.get(shard.slug) is not shard:
+                raise ShardClosed(shard.slug)
+            shard.in_use += 1
+            return shard
+
+    def release(self, shard):
+        if shard is None or shard is self.default:
+            return
+        now = time.monotonic()
+        with self._lock:
+            shard.in_use -= 1
+            evicted = []
+            if now - self._last_sweep > min(self.idle_timeout, 60):
+                self._last_sweep = now
+                evicted = self._collect(now)
+        self._close(evicted)
+
+    def _collect(self, now):
+        """从表中取出需要关闭的分片（调用时持有锁），按最久未使用的顺序检查"""
+        evicted = []
+        excess = len(self._shards) - self.max_open
+        for slug, shard in list(self._shards.items()):
+            idle = now - shard.last_used > self.idle_timeout
+            if excess <= 0 and not idle:
+                continue
+            if shard.in_use > 0 or self.is_busy(shard):
+                continue
+            del self._shards[slug]
+            evicted.append(shard)
+            excess -= 1
+        return evicted
+
+    def _close(self, shards):
+        for shard in shards:
+            self.closed += 1
+            try:
+                self.close_shard(shard)
+            except Exception:
+                pass
+
+    def close(self, slug):
+        """立即关闭班级的分片（删除或替换数据库文件前调用），返回是否关闭"""
+        with self._lock:
+            shard = self._shards.get(slug)
+            if shard is None or shard.in_use > 0:
+                return False
+            del self._shards[slug]
+        self._close([shard])
+        return True
+
+    def stats(self):
+        with self._lock:
+            return {'open': len(self._shards), 'max_open': self.max_open,
+                    'in_use': sum(1 for shard in self._shards.values() if shard.in_use > 0),
+                    'opened': self.opened, 'closed': self.closed}
@@ -10,7 +10,7 @@ document.addEventListener('DOMContentLoaded', function() {
             deadline: document.getElementById('deadline').value || null
         };
 
-        fetch('/api/tasks', {
+        fetch(`${APP_ROOT}/api/tasks`, {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify(taskData)
@@ -18,7 +18,8 @@ document.addEventListener('DOMContentLoaded', function() {
         .then(response => response.json())
         .then(data => {
             if (data.message) {
-                location.reload();
+                // 重新读取小组和作业列表，不整页刷新
+                boardLive.reload();
             }
         });
     });
@@ -26,16 +27,16 @@ document.addEventListener('DOMContentLoaded', function() {
     // Reset groups button
     document.getElementById('resetGroups').addEventListener('click', function() {
         if (confirm('确定要重置所有分组吗？这将清除所有现有的分组信息。')) {
-            fetch('/api/groups/reset', {
+            fetch(`${APP_ROOT}/api/groups/reset`, {
                 method: 'POST'
             })
-            .then(() => location.reload());
+            .then(() => boardLive.reload());
         }
     });
 
     // Export data button
     document.getElementById('exportData').addEventListener('click', function() {
-        window.location.href = '/api/export';
+        window.location.href = `${APP_ROOT}/api/export`;
     });
 
     // Edit group button
@@ -51,10 +52,10 @@ document.addEventListener('DOMContentLoaded', function() {
         btn.addEventListener('click', function() {
             const groupId = this.dataset.groupId;
             if (confirm('确定要删除这个小组吗？')) {
-                fetch(`/api/groups/${groupId}`, {
+                fetch(`${APP_ROOT}/api/groups/${groupId}`, {
                     method: 'DELETE'
                 })
-                .then(() => location.reload());
+                .then(() => boardLive.removeGroup(groupId));
             }
         });
     });
@@ -143,7 +144,7 @@ document.addEventListener('DOMContentLoaded', function() {
         }
 
         // 发送请求到服务器
-        fetch('/api/members/move', {
+        fetch(`${APP_ROOT}/api/members/move`, {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json'
@@ -194,7 +195,7 @@ document.addEventListener('DOMContentLoaded', function() {
             const memberId = e.target.dataset.memberId;
             const currentStatus = e.target.classList.contains('bg-success');
             
-            fetch('/api/members/status', {
+            fetch(`${APP_ROOT}/api/members/status`, {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json'
@@ -251,7 +252,7 @@ document.addEventListener('DOMContentLoaded', function() {
             const memberId = memberItem.dataset.memberId;
             const groupId = memberItem.closest('.member-container').dataset.groupId;
             
-            fetch('/api/members/delete', {
+            fetch(`${APP_ROOT}/api/members/delete`, {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json'
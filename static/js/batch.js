@@ -0,0 +1,70 @@
+// 成员操作批量提交：短时间内的多次拖拽、状态切换合并成一次 /api/members/batch 请求，
+// 服务端在一个事务中执行，其他人看到的看板不会出现只改了一半的状态
+(function() {
+    const FLUSH_DELAY = 250;   // 最后一次操作后等待的毫秒数
+    const MAX_BATCH = 100;     // 攒够这么多条立即提交
+
+    let queue = [];
+    let timer = null;
+
+    function flush() {
+        clearTimeout(timer);
+        timer = null;
+        if (queue.length === 0) {
+            return;
+        }
+        const batch = queue;
+        queue = [];
+
+        const board = document.getElementById('groupGrid') || document.getElementById('groupContainer');
+        fetch(`${APP_ROOT}/api/members/batch`, {
+            method: 'POST',
+            keepalive: true,
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({
+                operations: batch.map(item => item.operation),
+                task_id: (board && board.dataset.taskId) || null
+            })
+        })
+        .then(response => response.json().catch(() => ({ success: false })))
+        .then(data => {
+            if (!data.success) {
+                // 整批没有执行，所有操作都按失败处理
+                const error = new Error(data.error || '操作失败，请重试');
+                batch.forEach(item => item.reject(error));
+                return;
+            }
+            batch.forEach((item, i) => item.resolve(data.results[i]));
+        })
+        .catch(() => {
+            const error = new Error('网络错误，请重试');
+            batch.forEach(item => item.reject(error));
+        });
+    }
+
+    function enqueue(operation) {
+        return new Promise((resolve, reject) => {
+            queue.push({ operation: operation, resolve: resolve, reject: reject });
+            clearTimeout(timer);
+            if (queue.length >= MAX_BATCH) {
+                flush();
+            } else {
+                timer = setTimeout(flush, FLUSH_DELAY);
+            }
+        });
+    }
+
+    window.memberBatch = {
+        move: (memberId, targetGroupId) => enqueue({
+            op: 'move', member_id: memberId, target_group_id: targetGroupId
+        }),
+        status: (memberId, status, taskId) => enqueue({
+            op: 'status', member_id: memberId, status: status, task_id: taskId || null
+        }),
+        remove: memberId => enqueue({ op: 'delete', member_id: memberId }),
+        flush: flush
+    };
+
+    // 离开页面前把没提交的操作发出去
+    window.addEventListener('pagehide', flush);
+})();
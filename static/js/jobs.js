@@ -0,0 +1,105 @@
+// 后台任务：导入、自动分组等接口返回任务 ID 后立即结束，这里轮询 /api/jobs/<id> 直到任务结束，
+// 期间在进度框中显示进度，可以取消
+(function() {
+    const POLL_DELAY = 500;      // 首次查询前等待的毫秒数
+    const MAX_POLL_DELAY = 3000; // 任务长时间运行时逐渐放慢轮询
+
+    const FINISHED = ['succeeded', 'failed', 'cancelled'];
+
+    function dialog() {
+        const element = document.getElementById('jobModal');
+        return element && {
+            element: element,
+            modal: bootstrap.Modal.getOrCreateInstance(element),
+            title: element.querySelector('.modal-title'),
+            bar: element.querySelector('.progress-bar'),
+            message: element.querySelector('.job-message'),
+            cancel: element.querySelector('.job-cancel')
+        };
+    }
+
+    function render(view, job) {
+        // 不知道总量的任务显示滚动的条纹
+        const indeterminate = !job.total && job.status !== 'succeeded';
+        const percent = job.total ? Math.round(job.done / job.total * 100) : 100;
+        view.bar.style.width = `${percent}%`;
+        view.bar.classList.toggle('progress-bar-striped', indeterminate);
+        view.bar.classList.toggle('progress-bar-animated', indeterminate);
+        view.bar.textContent = job.total ? `${percent}%` : '';
+        let message = job.message || (job.status === 'queued' ? '排队中…' : '执行中…');
+        if (job.status === 'queued' && job.attempts > 0 && job.error) {
+            message = `${job.error}，稍后重试…`;
+        }
+        if (job.cancel_requested) {
+            message = '正在取消…';
+        }
+        view.message.textContent = message;
+    }
+
+    // 轮询任务直到结束：成功时返回任务（含 result），失败或取消时抛出错误
+    function wait(jobId, title) {
+        const view = dialog();
+        if (view) {
+            view.title.textContent = title || '正在处理';
+            view.message.textContent = '排队中…';
+            view.bar.style.width = '0%';
+            view.cancel.disabled = false;
+            view.cancel.onclick = () => {
+                view.cancel.disabled = true;
+                fetch(`${APP_ROOT}/api/jobs/${jobId}/cancel`, { method: 'POST' });
+            };
+            view.modal.show();
+        }
+
+        return new Promise((resolve, reject) => {
+            let delay = POLL_DELAY;
+            function poll() {
+                fetch(`${APP_ROOT}/api/jobs/${jobId}`)
+                .then(response => response.json())
+                .then(job => {
+                    if (!job.status) {
+                        // 任务不存在或没有权限
+                        if (view) {
+                            view.modal.hide();
+                        }
+                        reject(new Error(job.error || '任务不存在'));
+                        return;
+                    }
+                    if (view) {
+                        render(view, job);
+                    }
+                    if (FINISHED.indexOf(job.status) < 0) {
+                        delay = Math.min(delay * 1.5, MAX_POLL_DELAY);
+                        setTimeout(poll, delay);
+                        return;
+                    }
+                    if (view) {
+                        view.modal.hide();
+                    }
+                    if (job.status === 'succeeded') {
+                        resolve(job);
+                    } else {
+                        reject(new Error(job.error || '任务失败'));
+                    }
+                })
+                .catch(() => {
+                    // 网络中断时继续等待，任务在服务端照常执行
+                    setTimeout(poll, MAX_POLL_DELAY);
+                });
+            }
+            setTimeout(poll, delay);
+        });
+    }
+
+    // 处理返回任务 ID 的接口响应：202 时等待任务结束，其他情况按原样返回响应数据
+    function track(response, title) {
+        return response.json().then(data => {
+            if (response.status === 202 && data.job_id) {
+                return wait(data.job_id, title).then(job => Object.assign({ success: true }, job.result));
+            }
+            return data;
+        });
+    }
+
+    window.backgroundJobs = { wait: wait, track: track };
+})();
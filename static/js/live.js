@@ -0,0 +1,467 @@
+// 看板实时更新：订阅 /api/events，收到其他人的修改后直接更新页面，不再整页刷新
+(function() {
+    const board = document.getElementById('groupGrid') || document.getElementById('groupContainer');
+    if (!board) {
+        return;
+    }
+    const isAdmin = board.id === 'groupGrid';
+
+    function escapeHtml(text) {
+        const div = document.createElement('div');
+        div.textContent = text;
+        return div.innerHTML;
+    }
+
+    function groupCard(groupId) {
+        return document.querySelector(`.group-card[data-group-id="${groupId}"]`);
+    }
+
+    function memberList(groupId) {
+        return document.querySelector(`.member-list[data-group-id="${groupId}"]`);
+    }
+
+    function memberNode(memberId) {
+        return document.querySelector(`.member-container[data-member-id="${memberId}"]`);
+    }
+
+    // 管理面板上的小组卡片默认折叠，成员在展开时才加载；没有 data-loaded 属性的卡片（首页）始终视为已加载
+    function isLoaded(card) {
+        return card.dataset.loaded !== '0';
+    }
+
+    // 折叠的小组没有成员节点可数，人数变化后合并成一次 /api/groups?ids= 请求读取最新人数
+    const SUMMARY_DELAY = 300;
+    const pendingSummaries = new Set();
+    let summaryTimer = null;
+
+    function scheduleSummary(groupId) {
+        pendingSummaries.add(String(groupId));
+        clearTimeout(summaryTimer);
+        summaryTimer = setTimeout(() => {
+            const ids = Array.from(pendingSummaries);
+            pendingSummaries.clear();
+            fetch(`${APP_ROOT}/api/groups?ids=${ids.join(',')}`)
+            .then(response => response.json())
+            .then(data => {
+                (data.groups || []).forEach(group => {
+                    const card = groupCard(group.id);
+                    if (card && !isLoaded(card)) {
+                        card.dataset.count = group.member_count;
+                        card.dataset.completed = group.completed_count;
+                        renderCounts(card, group.member_count, group.completed_count);
+                    }
+                });
+            })
+            .catch(error => console.error('Error:', error));
+        }, SUMMARY_DELAY);
+    }
+
+    // 根据成员列表重新计算小组人数和完成人数
+    function refreshGroup(groupId) {
+        const card = groupCard(groupId);
+        if (!card) {
+            return;
+        }
+        if (!isLoaded(card)) {
+            scheduleSummary(groupId);
+            return;
+        }
+        const list = card.querySelector('.member-list');
+        renderCounts(card, list.querySelectorAll('.member-container').length,
+                     list.querySelectorAll('.toggle-status[data-status="1"]').length);
+    }
+
+    function renderCounts(card, total, completed) {
+        const badge = card.querySelector('.card-header .badge');
+
+        if (isAdmin && card.closest('#groupGrid')) {
+            badge.textContent = `${total}/${card.dataset.capacity}人` + (completed > 0 ? ` (${completed}已完成)` : '');
+        } else {
+            badge.textContent = `${total} 人`;
+        }
+
+        const bar = card.querySelector('.progress-bar');
+        if (bar) {
+            const percent = total > 0 ? completed / total * 100 : 0;
+            bar.style.width = `${percent}%`;
+            bar.setAttribute('aria-valuenow', percent);
+            bar.textContent = `${completed}/${total}`;
+        }
+        if (typeof window.updateTotalProgress === 'function') {
+            window.updateTotalProgress();
+        }
+    }
+
+    function setStatus(toggle, status) {
+        toggle.dataset.status = status ? '1' : '0';
+        if (isAdmin) {
+            const icon = toggle.querySelector('i');
+            if (icon) {
+                icon.className = status ? 'bi bi-check-circle-fill' : 'bi bi-check-circle';
+            }
+        } else {
+            toggle.classList.toggle('bg-success', status);
+            toggle.classList.toggle('bg-secondary', !status);
+            toggle.textContent = status ? '已完成' : '未完成';
+        }
+    }
+
+    function buildMember(memberId, username, completed) {
+        const node = document.createElement('div');
+        node.className = 'member-container';
+        node.dataset.memberId = memberId;
+        const name = escapeHtml(username);
+        if (isAdmin) {
+            node.innerHTML = `
+                <div class="member-item d-flex justify-content-between align-items-center mb-2 p-2 border rounded draggable" draggable="true">
+                    <span class="member-name">${name}</span>
+                    <div class="member-actions">
+                        <button class="btn btn-sm btn-outline-success toggle-status" data-member-id="${memberId}" data-status="${completed ? 1 : 0}">
+                            <i class="bi ${completed ? 'bi-check-circle-fill' : 'bi-check-circle'}"></i>
+                        </button>
+                        <button class="btn btn-sm btn-outline-danger delete-member" data-member-id="${memberId}">
+                            <i class="bi bi-trash"></i>
+                        </button>
+                    </div>
+                </div>`;
+        } else {
+            node.innerHTML = `
+                <div class="member-item d-flex justify-content-between align-items-center mb-2 p-2 border rounded draggable" draggable="true">
+                    <span class="member-name">${name}</span>
+                    <div class="member-actions">
+                        <span class="badge ${completed ? 'bg-success' : 'bg-secondary'} toggle-status"
+                              data-member-id="${memberId}"
+                              data-status="${completed ? 1 : 0}"
+                              style="cursor: pointer;">${completed ? '已完成' : '未完成'}</span>
+                    </div>
+                </div>`;
+        }
+        return node;
+    }
+
+    function placeholder() {
+        const node = document.createElement('div');
+        node.className = 'member-placeholder text-muted small text-center py-2';
+        node.textContent = '点击右上角展开查看成员';
+        return node;
+    }
+
+    // summary 为 /api/groups 返回的小组摘要：卡片折叠显示，成员在展开时加载；
+    // 没有摘要时是刚创建的空组，直接显示为已加载
+    function buildGroup(groupId, name, capacity, summary) {
+        const col = document.createElement('div');
+        col.className = 'col-md-4 mb-4';
+        const title = escapeHtml(name);
+        if (isAdmin) {
+            const count = summary ? summary.member_count : 0;
+            const completed = summary ? summary.completed_count : 0;
+            col.innerHTML = `
+                <div class="card h-100 group-card" data-group-id="${groupId}" data-capacity="${capacity}"
+                     data-loaded="${summary ? 0 : 1}" data-count="${count}" data-completed="${completed}">
+                    <div class="card-header d-flex justify-content-between align-items-center">
+                        <h5 class="card-title mb-0">${title}</h5>
+                        <div class="d-flex gap-2">
+                            <span class="badge bg-primary">${count}/${capacity}人${completed > 0 ? ` (${completed}已完成)` : ''}</span>
+                            <button class="btn btn-sm btn-outline-secondary toggle-members" data-group-id="${groupId}">
+                                <i class="bi ${summary ? 'bi-chevron-down' : 'bi-chevron-up'}"></i>
+                            </button>
+                            <button class="btn btn-sm btn-outline-primary edit-group" data-group-id="${groupId}">
+                                <i class="bi bi-pencil"></i>
+                            </button>
+                            <button class="btn btn-sm btn-outline-danger delete-group" data-group-id="${groupId}">
+                                <i class="bi bi-trash"></i>
+                            </button>
+                        </div>
+                    </div>
+                    <div class="card-body">
+                        <div class="member-list droppable" data-group-id="${groupId}"></div>
+                    </div>
+                </div>`;
+            if (summary) {
+                col.querySelector('.member-list').appendChild(placeholder());
+            }
+        } else {
+            col.innerHTML = `
+                <div class="card h-100 group-card" data-group-id="${groupId}">
+                    <div class="card-header d-flex justify-content-between align-items-center">
+                        <h5 class="card-title mb-0">${title}</h5>
+                        <div class="d-flex gap-2 align-items-center">
+                            <span class="badge bg-primary">0 人</span>
+                            <button class="btn btn-sm btn-outline-primary add-member-btn" data-group-id="${groupId}">
+                                <i class="bi bi-plus"></i>
+                            </button>
+                        </div>
+                    </div>
+                    <div class="card-body">
+                        <div class="progress" style="height: 15px">
+                            <div class="progress-bar bg-success" role="progressbar" style="width: 0%"
+                                aria-valuenow="0" aria-valuemin="0" aria-valuemax="100">0/0</div>
+                        </div>
+                        <div class="member-list droppable" data-group-id="${groupId}"></div>
+                    </div>
+                </div>`;
+        }
+        return col;
+    }
+
+    // 以下操作都是幂等的：本页自己发起的修改已经在本地应用过，收到同一事件时不会重复处理
+    function addMember(memberId, groupId, username, completed) {
+        const list = memberList(groupId);
+        if (!list) {
+            return;
+        }
+        let node = memberNode(memberId);
+        if (!isLoaded(list.closest('.group-card'))) {
+            // 折叠的小组不显示成员，只更新人数
+            if (node) {
+                node.remove();
+            }
+            refreshGroup(groupId);
+            return;
+        }
+        if (!node) {
+            node = buildMember(memberId, username, completed);
+            document.dispatchEvent(new CustomEvent('board:member-added', { detail: { node: node } }));
+        }
+        if (node.parentElement !== list) {
+            list.appendChild(node);
+        }
+        refreshGroup(groupId);
+    }
+
+    function moveMember(memberId, oldGroupId, newGroupId, username, completed) {
+        const node = memberNode(memberId);
+        if (!memberList(newGroupId)) {
+            // 目标组不在本页显示（例如首页上的未分组）
+            if (node) {
+                node.remove();
+            }
+        } else {
+            addMember(memberId, newGroupId, username, completed);
+        }
+        refreshGroup(oldGroupId);
+    }
+
+    function removeMember(memberId, groupId) {
+        const node = memberNode(memberId);
+        if (node) {
+            node.remove();
+        }
+        refreshGroup(groupId);
+    }
+
+    function addGroup(groupId, name, capacity, summary) {
+        if (groupCard(groupId)) {
+            return;
+        }
+        const col = buildGroup(groupId, name, capacity, summary);
+        board.appendChild(col);
+        document.dispatchEvent(new CustomEvent('board:group-added', { detail: { node: col } }));
+    }
+
+    function removeGroup(groupId) {
+        const card = groupCard(groupId);
+        if (card) {
+            (card.closest('.col-md-4') || card).remove();
+        }
+        if (typeof window.updateTotalProgress === 'function') {
+            window.updateTotalProgress();
+        }
+    }
+
+    function renameGroup(groupId, name, capacity) {
+        const card = groupCard(groupId);
+        if (card) {
+            card.querySelector('.card-title').textContent = name;
+            if (capacity) {
+                card.dataset.capacity = capacity;
+                refreshGroup(groupId);
+            }
+        }
+    }
+
+    function setExpanded(card, expanded) {
+        const icon = card.querySelector('.toggle-members i');
+        if (icon) {
+            icon.className = expanded ? 'bi bi-chevron-up' : 'bi bi-chevron-down';
+        }
+    }
+
+    // 展开小组：读取成员列表并插入页面，之后按实时事件逐条更新
+    function loadMembers(groupId) {
+        const card = groupCard(groupId);
+        if (!card || isLoaded(card) || card.dataset.loading) {
+            return Promise.resolve();
+        }
+        card.dataset.loading = '1';
+        return fetch(`${APP_ROOT}/api/groups/${groupId}/members`)
+        .then(response => response.json())
+        .then(data => {
+            if (data.error) {
+                throw new Error(data.error);
+            }
+            const list = card.querySelector('.member-list');
+            list.querySelectorAll('.member-placeholder').forEach(node => node.remove());
+            card.dataset.loaded = '1';
+            setExpanded(card, true);
+            data.members.forEach(member => addMember(member.id, groupId, member.username, member.completed));
+            refreshGroup(groupId);
+        })
+        .finally(() => { delete card.dataset.loading; });
+    }
+
+    // 折叠小组：移除成员节点，释放页面上的元素
+    function unloadMembers(groupId) {
+        const card = groupCard(groupId);
+        if (!card || !isLoaded(card)) {
+            return;
+        }
+        const list = card.querySelector('.member-list');
+        card.dataset.count = list.querySelectorAll('.member-container').length;
+        card.dataset.completed = list.querySelectorAll('.toggle-status[data-status="1"]').length;
+        list.innerHTML = '';
+        list.appendChild(placeholder());
+        card.dataset.loaded = '0';
+        setExpanded(card, false);
+    }
+
+    function toggleMembers(groupId) {
+        const card = groupCard(groupId);
+        if (!card) {
+            return Promise.resolve();
+        }
+        if (isLoaded(card)) {
+            unloadMembers(groupId);
+            return Promise.resolve();
+        }
+        return loadMembers(groupId);
+    }
+
+    // 重新读取小组：已展开的重新加载成员，折叠的只更新人数
+    function reloadGroup(groupId) {
+        const card = groupCard(groupId);
+        if (!card) {
+            return Promise.resolve();
+        }
+        if (!isLoaded(card)) {
+            scheduleSummary(groupId);
+            return Promise.resolve();
+        }
+        unloadMembers(groupId);
+        return loadMembers(groupId);
+    }
+
+    // 批量修改（重置、导入、自动分组、发布或删除作业）之后重新读取第一页小组，替换网格中的小组卡片，
+    // 并刷新网格外的未分组卡片；首页没有小组摘要接口，仍然整页刷新
+    let reloading = null;
+    let reloadPending = false;
+
+    function reloadBoard() {
+        if (!isAdmin) {
+            location.reload();
+            return Promise.resolve();
+        }
+        if (reloading) {
+            // 读取期间又有修改：这次读取结束后再读取一次
+            reloadPending = true;
+            return reloading;
+        }
+        reloading = fetch(`${APP_ROOT}/api/groups`)
+        .then(response => response.json())
+        .then(data => {
+            if (data.error) {
+                throw new Error(data.error);
+            }
+            board.dataset.taskId = data.task_id || '';
+            board.querySelectorAll('.group-card').forEach(card => removeGroup(card.dataset.groupId));
+            data.groups.forEach(group => addGroup(group.id, group.name, group.capacity, group));
+            document.querySelectorAll('.group-card').forEach(card => {
+                if (!board.contains(card)) {
+                    reloadGroup(card.dataset.groupId);
+                }
+            });
+            document.dispatchEvent(new CustomEvent('board:reloaded', { detail: { next: data.next } }));
+        })
+        .finally(() => {
+            reloading = null;
+            if (reloadPending) {
+                reloadPending = false;
+                return reloadBoard();
+            }
+        });
+        return reloading;
+    }
+
+    function showNotice(message) {
+        let notice = document.getElementById('boardNotice');
+        if (!notice) {
+            notice = document.createElement('div');
+            notice.id = 'boardNotice';
+            notice.className = 'alert alert-info d-flex justify-content-between align-items-center';
+            const container = document.querySelector('.container.py-4');
+            container.insertBefore(notice, container.firstChild);
+        }
+        notice.innerHTML = `<span>${escapeHtml(message)}</span>
+            <button type="button" class="btn btn-sm btn-primary">刷新</button>`;
+        notice.querySelector('button').addEventListener('click', () => location.reload());
+    }
+
+    const live = {
+        connected: false,
+        addMember: addMember,
+        moveMember: moveMember,
+        removeMember: removeMember,
+        addGroup: addGroup,
+        removeGroup: removeGroup,
+        renameGroup: renameGroup,
+        refreshGroup: refreshGroup,
+        loadMembers: loadMembers,
+        unloadMembers: unloadMembers,
+        toggleMembers: toggleMembers,
+        reloadGroup: reloadGroup,
+        reload: reloadBoard,
+        setStatus: setStatus
+    };
+    window.boardLive = live;
+
+    if (!window.EventSource) {
+        return;
+    }
+
+    const source = new EventSource(`${APP_ROOT}/api/events`);
+    const resync = () => reloadBoard().catch(error => console.error('Error:', error));
+    const handlers = {
+        member_added: d => addMember(d.member_id, d.group_id, d.username, false),
+        member_moved: d => moveMember(d.member_id, d.old_group_id, d.new_group_id, d.username, d.completed),
+        member_deleted: d => removeMember(d.member_id, d.group_id),
+        status_changed: d => {
+            if (String(d.task_id) !== String(board.dataset.taskId)) {
+                return;
+            }
+            const node = memberNode(d.member_id);
+            const toggle = node && node.querySelector('.toggle-status');
+            if (toggle) {
+                setStatus(toggle, d.status);
+                refreshGroup(node.closest('.member-list').dataset.groupId);
+            } else if (d.group_id) {
+                // 成员所在的小组是折叠的，只更新完成人数
+                refreshGroup(d.group_id);
+            }
+        },
+        group_created: d => addGroup(d.group_id, d.name, d.capacity),
+        group_updated: d => renameGroup(d.group_id, d.name, d.capacity),
+        group_deleted: d => removeGroup(d.group_id),
+        // 管理面板直接重新读取作业和小组，首页提示学生刷新
+        task_published: d => isAdmin ? resync() : showNotice(`有新作业发布：${d.title}`),
+        task_updated: d => isAdmin ? resync() : showNotice(`作业已更新：${d.title}`),
+        task_deleted: () => isAdmin ? resync() : showNotice('作业已被删除'),
+        board_changed: resync,
+        resync: resync
+    };
+
+    Object.keys(handlers).forEach(type => {
+        source.addEventListener(type, e => handlers[type](JSON.parse(e.data)));
+    });
+    source.addEventListener('open', () => { live.connected = true; });
+    source.addEventListener('error', () => { live.connected = false; });
+})();
@@ -38,10 +38,10 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     });
 
-    // Initialize Sortable for each member list
+    // 为每个成员列表启用 Sortable（Sortable.js 已放在 static/vendor，加载失败时跳过，仍可使用页面自带的拖拽）
     groups.forEach(group => {
         const memberList = group.querySelector('.member-list');
-        if (memberList) {
+        if (memberList && typeof Sortable !== 'undefined') {
             new Sortable(memberList, {
                 group: 'members',
                 animation: 150,
@@ -63,7 +63,7 @@ document.addEventListener('DOMContentLoaded', function() {
                             alert('该小组已达到最大人数限制（5人）');
                             return;
                         }
-                        updateMemberGroup(memberId, newGroupId);
+                        updateMemberGroup(memberId, newGroupId, oldGroupId);
                     }
                 }
             });
@@ -120,7 +120,7 @@ document.addEventListener('DOMContentLoaded', function() {
     // API functions
     function updateGroupName(groupId, newName) {
         if (!groupId) return;  // 如果组ID为空，不执行更新
-        fetch('/api/groups', {
+        fetch(`${APP_ROOT}/api/groups`, {
             method: 'PUT',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({ id: groupId, name: newName })
@@ -143,7 +143,7 @@ document.addEventListener('DOMContentLoaded', function() {
             alert('请先创建小组');
             return;
         }
-        fetch('/api/members', {
+        fetch(`${APP_ROOT}/api/members`, {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({ group_id: groupId, username: memberName })
@@ -158,7 +158,7 @@ document.addEventListener('DOMContentLoaded', function() {
         })
         .then(data => {
             if (data.success) {
-                location.reload();
+                boardLive.addMember(data.member.id, groupId, data.member.username, false);
             } else {
                 throw new Error(data.error || '添加失败');
             }
@@ -168,29 +168,12 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
 
-    function updateMemberGroup(memberId, newGroupId) {
-        fetch('/api/members/move', {  
-            method: 'POST',  
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ 
-                member_id: memberId,  
-                target_group_id: newGroupId  
-            })
-        })
-        .then(response => {
-            if (!response.ok) {
-                return response.json().then(data => {
-                    throw new Error(data.error || '移动失败');
-                });
-            }
-            return response.json();
-        })
-        .then(data => {
-            if (data.success) {
-                location.reload();
-            } else {
-                throw new Error(data.error || '移动失败');
-            }
+    function updateMemberGroup(memberId, newGroupId, oldGroupId) {
+        memberBatch.move(memberId, newGroupId)
+        .then(() => {
+            // 成员节点已由 Sortable 移动，只需更新两个组的统计
+            boardLive.refreshGroup(oldGroupId);
+            boardLive.refreshGroup(newGroupId);
         })
         .catch(error => {
             alert('移动组员失败: ' + error.message);
@@ -199,27 +182,13 @@ document.addEventListener('DOMContentLoaded', function() {
     }
 
     function toggleMemberStatus(memberId, newStatus) {
-        fetch('/api/members/status', {  
-            method: 'POST',  
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ 
-                member_id: memberId,  
-                status: newStatus 
-            })
-        })
-        .then(response => {
-            if (!response.ok) {
-                return response.json().then(data => {
-                    throw new Error(data.error || '更新状态失败');
-                });
-            }
-            return response.json();
-        })
-        .then(data => {
-            if (data.success) {
-                location.reload();
-            } else {
-                throw new Error(data.error || '更新状态失败');
+        memberBatch.status(memberId, newStatus)
+        .then(() => {
+            const node = document.querySelector(`.member-container[data-member-id="${memberId}"]`);
+            const toggle = node && node.querySelector('.toggle-status');
+            if (toggle) {
+                boardLive.setStatus(toggle, newStatus);
+                boardLive.refreshGroup(node.closest('.member-list').dataset.groupId);
             }
         })
         .catch(error => {
@@ -0,0 +1,82 @@
+"""作业内容的预处理
+
+富文本编辑器提交的 HTML 在保存时处理一次：按白名单清理标签和属性（去掉 <script>、事件属性、
+javascript: 链接等），上传图片改用缩略图并加上 srcset，再提取一段纯文本摘要。结果保存在
+Task.content_html / Task.excerpt 中，首页直接输出，不必在每次请求时重新清理。
+
+content_hash 由原始内容和 RENDER_VERSION 计算，原始内容未变时不重复处理；修改了下面的
+白名单或处理逻辑后把 RENDER_VERSION 加一，再执行 flask render-tasks 即可全部重新生成。
+
+清理依赖 nh3；未安装时不保留任何标签，内容按纯文本转义后显示。
+"""
+import hashlib
+import html
+import re
+
+try:
+    import nh3
+except ImportError:  # 未安装 nh3 时把内容整体转义，宁可丢失格式也不输出未经清理的 HTML
+    nh3 = None
+
+RENDER_VERSION = 1
+EXCERPT_LENGTH = 120
+
+ALLOWED_TAGS = {
+    'p', 'br', 'hr', 'div', 'span', 'strong', 'b', 'em', 'i', 'u', 's', 'sub', 'sup', 'small', 'mark',
+    'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'blockquote', 'pre', 'code',
+    'ul', 'ol', 'li', 'a', 'img', 'figure', 'figcaption',
+    'table', 'caption', 'colgroup', 'col', 'thead', 'tbody', 'tfoot', 'tr', 'th', 'td',
+}
+ALLOWED_ATTRIBUTES = {
+    '*': {'style', 'class', 'title'},
+    'a': {'href', 'target'},
+    'img': {'src', 'alt', 'width', 'height'},
+    'ol': {'start', 'type'},
+    'td': {'colspan', 'rowspan'},
+    'th': {'colspan', 'rowspan', 'scope'},
+    'col': {'span'},
+    'colgroup': {'span'},
+}
+# style 属性中只保留编辑器排版会用到的属性，不允许定位、背景图等
+ALLOWED_STYLES = {
+    'color', 'background-color', 'text-align', 'text-decoration', 'text-indent', 'font-size', 'font-weight',
+    'font-style', 'font-family', 'line-height', 'vertical-align', 'float', 'width', 'height', 'max-width',
+    'margin', 'margin-left', 'margin-right', 'padding', 'padding-left', 'padding-right', 'list-style-type',
+    'border', 'border-collapse', 'border-width', 'border-style', 'border-color',
+}
+URL_SCHEMES = {'http', 'https', 'mailto'}
+
+_WHITESPACE = re.compile(r'\s+')
+_TAG = re.compile(r'<[^>]*>')
+# 块级元素结束处补一个空格，避免相邻段落的文字在摘要中连在一起
+_BLOCK_END = re.compile(r'(</(?:p|div|li|h[1-6]|td|th|blockquote|pre|figcaption)>|<br\s*/?>)', re.IGNORECASE)
+
+
+def content_hash(raw):
+    return hashlib.sha256(f'{RENDER_VERSION}\n{raw}'.encode('utf-8')).hexdigest()
+
+
+def sanitize(raw):
+    if nh3 is None:
+        return html.escape(raw or '')
+    return nh3.clean(raw or '', tags=ALLOWED_TAGS, attributes=ALLOWED_ATTRIBUTES,
+                     url_schemes=URL_SCHEMES, filter_style_properties=ALLOWED_STYLES,
+                     link_rel='noopener noreferrer')
+
+
+def excerpt(cleaned, length=EXCERPT_LENGTH):
+    """从清理后的 HTML 中提取纯文本摘要"""
+    cleaned = _BLOCK_END.sub(r'\1 ', cleaned)
+    if nh3 is not None:
+        text = nh3.clean(cleaned, tags=set())
+    else:
+        text = _TAG.sub(' ', cleaned)
+    text = _WHITESPACE.sub(' ', html.unescape(text)).strip()
+    return text if len(text) <= length else text[:length - 1] + '…'
+
+
+def render(raw, image_store=None):
+    """返回 (content_html, excerpt, content_hash)"""
+    cleaned = sanitize(raw)
+    rendered = image_store.responsive(cleaned) if image_store is not None else cleaned
+    return rendered, excerpt(cleaned), content_hash(raw)
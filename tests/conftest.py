@@ -0,0 +1,85 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import Group, GroupMember, User, create_app, db, recount_members  # noqa: E402
+
+
+@pytest.fixture
+def make_app(tmp_path):
+    """在临时 instance 目录中创建应用；关闭限流、后台任务、自动备份和指标，测试之间互不影响"""
+    apps = []
+
+    def factory(**config):
+        instance = tmp_path / f'instance{len(apps)}'
+        options = {
+            'TESTING': True,
+            'INSTANCE_PATH': str(instance),
+            'SQLALCHEMY_DATABASE_URI': f'sqlite:///{instance / "homework.db"}',
+            'JOB_WORKERS': 0,
+            'BACKUP_INTERVAL': 0,
+            'METRICS_ENABLED': False,
+            'TEMPLATE_BYTECODE_CACHE': False,
+            'ASSETS_FINGERPRINT': False,
+            'RATE_LIMIT_USER_RATE': 0,
+            'RATE_LIMIT_IP_RATE': 0,
+            'STATUS_COALESCE_WINDOW': 0,
+        }
+        options.update(config)
+        app = create_app(options)
+        apps.append(app)
+        return app
+
+    yield factory
+    for app in apps:
+        with app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app()
+
+
+def seed_members(app, count, groups=12):
+    """按顺序把 count 名成员平均分到前 groups 个普通小组，返回 [(成员ID, 用户名)]"""
+    with app.app_context():
+        group_ids = [group_id for (group_id,) in db.session.query(Group.id)
+                     .filter(Group.is_ungrouped == False).order_by(Group.id).limit(groups)]
+        members = []
+        for i in range(count):
+            user = User(username=f'学生{i}', password_hash='x')
+            db.session.add(user)
+            db.session.flush()
+            member = GroupMember(user_id=user.id, group_id=group_ids[i % len(group_ids)])
+            db.session.add(member)
+            db.session.flush()
+            members.append((member.id, user.username))
+        recount_members()
+        db.session.commit()
+        return members
+
+
+def login(client, username='admin', password='admin'):
+    return client.post('/login', data={'username': username, 'password': password})
+
+
+@pytest.fixture
+def admin_client(app):
+    client = app.test_client()
+    assert login(client).status_code == 302
+    return client
+
+
+def run_jobs(app, worker_id='test'):
+    """在当前线程中依次执行所有排队的后台任务（测试时 JOB_WORKERS 为 0，不启动任务线程）"""
+    runner = app.extensions['jobs']
+    while True:
+        key = runner.claim(worker_id)
+        if key is None:
+            return
+        runner.execute(key, worker_id)
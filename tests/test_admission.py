@@ -0,0 +1,68 @@
+"""写请求的准入控制：未登录的请求不参与合并，也不占用写入名额"""
+import threading
+import time
+
+from app import PENDING_PASSWORD_HASH, Submission, Task, User, current_shard, db, shard_context
+from conftest import login, seed_members
+
+
+def status_request(client, member_id, task_id, status):
+    return client.post('/api/members/status', json={'member_id': member_id, 'task_id': task_id, 'status': status})
+
+
+def setup_board(app):
+    members = seed_members(app, 1)
+    with app.app_context():
+        task = Task(title='作业', content='<p>内容</p>')
+        db.session.add(task)
+        db.session.commit()
+        return members[0][0], task.id
+
+
+def test_anonymous_request_does_not_supersede_toggle(make_app):
+    app = make_app(STATUS_COALESCE_WINDOW=0.5)
+    member_id, task_id = setup_board(app)
+    admin = app.test_client()
+    login(admin)
+    assert status_request(admin, member_id, task_id, True).get_json()['success']
+
+    # 窗口内的第二次点击要等到窗口结束；期间匿名请求同一个成员
+    results = {}
+    second = app.test_client()
+    login(second)
+    thread = threading.Thread(target=lambda: results.update(
+        response=status_request(second, member_id, task_id, False).get_json()))
+    thread.start()
+    time.sleep(0.1)
+    anonymous = status_request(app.test_client(), member_id, task_id, True)
+    thread.join()
+
+    assert anonymous.status_code == 302
+    assert 'coalesced' not in results['response']
+    with app.app_context():
+        assert Submission.query.filter_by(member_id=member_id, task_id=task_id).one().status is False
+
+
+def test_rejected_requests_do_not_wait_for_writer_slots(make_app):
+    app = make_app(WRITE_CONCURRENCY=1, WRITE_QUEUE_WAIT=0.1)
+    member_id, task_id = setup_board(app)
+    with app.app_context():
+        db.session.add(User(username='张三', password_hash=PENDING_PASSWORD_HASH))
+        db.session.commit()
+    student = app.test_client()
+    login(student, '张三', '张三')
+    admin = app.test_client()
+    login(admin)
+
+    with shard_context(app, None):
+        writers = current_shard().writers
+    # 占用唯一的写入名额
+    slot = writers.acquire(0)
+    try:
+        assert status_request(app.test_client(), member_id, task_id, True).status_code == 302
+        # 没有管理员权限的请求直接被拒绝，不排队等待名额
+        assert student.post('/api/groups/reset').status_code == 403
+        assert status_request(admin, member_id, task_id, True).status_code == 503
+    finally:
+        writers.release(slot)
+    assert status_request(admin, member_id, task_id, True).get_json()['success']
@@ -0,0 +1,43 @@
+"""重置分组前保存完成情况，恢复归档时按用户名对应回新的成员"""
+from app import Group, GroupMember, Submission, Task, User, archive_store, db, shard_context
+from conftest import run_jobs, seed_members
+
+
+def test_reset_keeps_completion_in_archive(app, admin_client):
+    members = seed_members(app, 4)
+    with app.app_context():
+        task = Task(title='第一次作业', content='<p>内容</p>')
+        db.session.add(task)
+        db.session.flush()
+        db.session.add_all(Submission(task_id=task.id, member_id=member_id, status=True)
+                           for member_id, _ in members[:3])
+        db.session.commit()
+        task_id = task.id
+
+    assert admin_client.post('/api/groups/reset').status_code == 202
+    run_jobs(app)
+    with shard_context(app, None):
+        assert db.session.get(Task, task_id) is not None
+        assert Submission.query.count() == 0
+        store = archive_store()
+        term_id = store.terms()[0]['id']
+        archived = store.task(term_id, task_id)
+        assert archived['completed'] == 3 and archived['total'] == 4
+
+        # 重新分组后，同样的用户成为新的成员
+        group = Group(name='新的一组', is_ungrouped=False)
+        db.session.add(group)
+        db.session.flush()
+        for user in User.query.filter(User.username.in_([name for _, name in members])):
+            db.session.add(GroupMember(user_id=user.id, group_id=group.id))
+        db.session.commit()
+
+    assert admin_client.post(f'/api/archive/{term_id}/restore').status_code == 202
+    run_jobs(app)
+    with shard_context(app, None):
+        assert Task.query.count() == 1
+        completed = {username for (username,) in db.session.query(User.username)
+                     .join(GroupMember, GroupMember.user_id == User.id)
+                     .join(Submission, Submission.member_id == GroupMember.id)
+                     .filter(Submission.task_id == task_id, Submission.status == True)}
+        assert completed == {name for _, name in members[:3]}
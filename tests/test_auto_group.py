@@ -0,0 +1,68 @@
+"""自动分组"""
+import pytest
+from sqlalchemy import event
+
+from app import Group, GroupMember, db
+from conftest import run_jobs, seed_members
+
+
+@pytest.fixture
+def ungrouped_members(app):
+    members = seed_members(app, 8)
+    with app.app_context():
+        ungrouped_id = db.session.query(Group.id).filter_by(is_ungrouped=True).scalar()
+        GroupMember.query.update({'group_id': ungrouped_id})
+        db.session.commit()
+    return members
+
+
+@pytest.mark.parametrize('seed', [[1, 2], {'a': 1}, 1.5])
+@pytest.mark.parametrize('dry_run', [True, False])
+def test_invalid_seed_is_rejected(admin_client, ungrouped_members, seed, dry_run):
+    response = admin_client.post('/api/members/auto-group',
+                                 json={'members_per_group': 4, 'dry_run': dry_run, 'seed': seed})
+    assert response.status_code == 400
+    assert '随机种子' in response.get_json()['error']
+
+
+def test_same_seed_gives_same_plan(admin_client, ungrouped_members):
+    plans = [admin_client.post('/api/members/auto-group',
+                               json={'members_per_group': 4, 'dry_run': True, 'seed': seed}).get_json()['groups']
+             for seed in (7, 7, '班级')]
+    assert plans[0] == plans[1]
+    assert sum(group['member_count'] for group in plans[2]) == len(ungrouped_members)
+
+
+def test_new_groups_are_identified_by_insert_not_by_name(app, admin_client, ungrouped_members):
+    """分组过程中有同名的小组被创建时，成员仍然分到本次新建的小组"""
+    impostors = []
+
+    # 插入第一个新组之后立即创建一个同名小组，模拟其他请求同时创建或改名
+    def create_same_name(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith('INSERT INTO "group"') and not impostors:
+            values = parameters[0] if isinstance(parameters[0], (list, tuple, dict)) else parameters
+            values = values.values() if isinstance(values, dict) else values
+            name = next(value for value in values if isinstance(value, str) and value.startswith('Group '))
+            other = cursor.connection.cursor()
+            other.execute('INSERT INTO "group" (name, is_ungrouped, capacity, member_count, version) '
+                          'VALUES (?, 0, 5, 0, 0)', (name,))
+            impostors.append(other.lastrowid)
+
+    with app.app_context():
+        event.listen(db.engine, 'after_cursor_execute', create_same_name)
+    try:
+        response = admin_client.post('/api/members/auto-group', json={'members_per_group': 4, 'seed': 1})
+        assert response.status_code == 202
+        run_jobs(app)
+    finally:
+        with app.app_context():
+            event.remove(db.engine, 'after_cursor_execute', create_same_name)
+
+    assert impostors
+    with app.app_context():
+        impostor = db.session.get(Group, impostors[0])
+        assert impostor.member_count == 0
+        assert GroupMember.query.filter_by(group_id=impostor.id).count() == 0
+        assigned = db.session.query(GroupMember.group_id).filter(GroupMember.id.in_(
+            [member_id for member_id, _ in ungrouped_members])).distinct().count()
+        assert assigned == 2
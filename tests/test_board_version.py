@@ -0,0 +1,32 @@
+"""看板版本号在同一进程的多个线程同时递增时不会丢失"""
+import sys
+import threading
+
+from board_version import BoardVersion
+
+
+def test_concurrent_bumps_from_threads(tmp_path):
+    version = BoardVersion(str(tmp_path / 'board_version'))
+    threads, bumps = 8, 2000
+    start = threading.Barrier(threads)
+
+    def worker():
+        start.wait()
+        for _ in range(bumps):
+            version.bump()
+
+    interval = sys.getswitchinterval()
+    # 频繁切换线程，让读取和写回之间更容易被其他线程打断
+    sys.setswitchinterval(1e-6)
+    try:
+        workers = [threading.Thread(target=worker) for _ in range(threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+    finally:
+        sys.setswitchinterval(interval)
+    try:
+        assert version.get()[1] == threads * bumps
+    finally:
+        version.close()
@@ -0,0 +1,133 @@
+"""小组人数上限的并发测试
+
+多个线程同时向同一个小组添加、移动成员（单条接口和批量接口混合），成功的请求数必须恰好等于
+人数上限，其余请求都收到 409，各小组的人数计数与组员表一致。
+"""
+import threading
+from collections import Counter
+
+import pytest
+from sqlalchemy import func
+
+from app import Group, GroupMember, db
+from conftest import login
+
+THREADS = 24
+CAPACITY = 5
+
+
+@pytest.fixture
+def app(make_app):
+    # 所有线程使用同一个管理员账号并发请求；写入名额排队时间放宽，验证的只是人数上限
+    return make_app(EVENTS_POLL_INTERVAL=3600, WRITE_QUEUE_WAIT=60)
+
+
+@pytest.fixture
+def clients(app):
+    clients = [app.test_client() for _ in range(THREADS)]
+    for client in clients:
+        assert login(client).status_code == 302
+    return clients
+
+
+def hammer(clients, requests):
+    """每个线程发一个请求，所有线程在同一时刻开始，返回状态码列表"""
+    barrier = threading.Barrier(len(requests))
+    statuses = [None] * len(requests)
+
+    def worker(i):
+        method, url, body = requests[i]
+        barrier.wait()
+        statuses[i] = getattr(clients[i], method)(url, json=body).status_code
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(len(requests))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return statuses
+
+
+def create_group(client, name, capacity=CAPACITY):
+    response = client.post('/api/groups', json={'name': name, 'capacity': capacity})
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()['id']
+
+
+def ungrouped_members(app, client, prefix, count):
+    """在未分组中添加 count 名成员，返回成员ID列表"""
+    with app.app_context():
+        ungrouped_id = db.session.query(Group.id).filter_by(is_ungrouped=True).scalar()
+    member_ids = []
+    for i in range(count):
+        response = client.post('/api/members', json={'group_id': ungrouped_id, 'username': f'{prefix}{i}'})
+        assert response.status_code == 200, response.get_json()
+        member_ids.append(response.get_json()['member']['id'])
+    return member_ids
+
+
+def move(member_id, target):
+    return 'post', '/api/members/move', {'member_id': member_id, 'target_group_id': target}
+
+
+def batch_move(member_id, target):
+    return 'post', '/api/members/batch', {'operations': [
+        {'op': 'move', 'member_id': member_id, 'target_group_id': target}]}
+
+
+def assert_capacity_held(app, statuses, target):
+    counts = Counter(statuses)
+    assert counts[200] == CAPACITY, counts
+    assert counts[409] == len(statuses) - CAPACITY, counts
+    assert_counters(app)
+    with app.app_context():
+        assert db.session.query(func.count(GroupMember.id)).filter_by(group_id=target).scalar() == CAPACITY
+
+
+def assert_counters(app):
+    """每个小组的 member_count 等于组员表中的实际人数"""
+    with app.app_context():
+        actual = dict(db.session.query(GroupMember.group_id, func.count(GroupMember.id))
+                      .group_by(GroupMember.group_id).all())
+        assert {group.id: group.member_count for group in Group.query} == \
+               {group.id: actual.get(group.id, 0) for group in Group.query}
+
+
+def test_concurrent_adds(app, clients):
+    target = create_group(clients[0], '添加')
+    statuses = hammer(clients, [('post', '/api/members', {'group_id': target, 'username': f'add{i}'})
+                                for i in range(THREADS)])
+    assert_capacity_held(app, statuses, target)
+
+
+def test_concurrent_moves_and_batches(app, clients):
+    member_ids = ungrouped_members(app, clients[0], 'move', THREADS)
+    target = create_group(clients[0], '移动')
+    statuses = hammer(clients, [move(member_id, target) if i % 2 == 0 else batch_move(member_id, target)
+                                for i, member_id in enumerate(member_ids)])
+    assert_capacity_held(app, statuses, target)
+
+
+def test_concurrent_adds_moves_and_batches(app, clients):
+    member_ids = ungrouped_members(app, clients[0], 'mixed', THREADS)
+    target = create_group(clients[0], '混合')
+    requests = []
+    for i, member_id in enumerate(member_ids):
+        if i % 3 == 0:
+            requests.append(('post', '/api/members', {'group_id': target, 'username': f'new{i}'}))
+        elif i % 3 == 1:
+            requests.append(move(member_id, target))
+        else:
+            requests.append(batch_move(member_id, target))
+    statuses = hammer(clients, requests)
+    assert_capacity_held(app, statuses, target)
+
+
+def test_same_member_moved_to_several_groups(app, clients):
+    """同一成员同时被移动到不同的小组：读到旧所属组的请求收到 409，计数不能被重复增减"""
+    member_id, = ungrouped_members(app, clients[0], 'contested', 1)
+    targets = [create_group(clients[0], f'争抢{i}') for i in range(4)]
+    statuses = hammer(clients, [move(member_id, target) for target in targets])
+    assert statuses.count(200) >= 1
+    assert set(statuses) <= {200, 409}
+    assert_counters(app)
@@ -0,0 +1,78 @@
+"""批量导入成员"""
+import io
+import json
+import os
+
+import app as application
+from app import Group, GroupMember, Job, User, db, shard_context
+from conftest import run_jobs
+
+
+def job_of(app, job_id):
+    with shard_context(app, None):
+        job = db.session.get(Job, job_id)
+        return json.loads(job.params), job.status, json.loads(job.result) if job.result else None
+
+
+def test_import_spools_upload_and_reports_errors_in_result(app, admin_client):
+    names = ['姓名', '张三', '李四', '', '张三', 'x' * 81, '王五']
+    upload = io.BytesIO('\n'.join(names).encode('utf-8'))
+    response = admin_client.post('/api/members/import', data={'file': (upload, 'roster.csv')})
+    assert response.status_code == 202
+    job_id = response.get_json()['job_id']
+
+    params, status, _ = job_of(app, job_id)
+    # 任务参数只有暂存文件的位置和行数，名单本身不在数据库中
+    assert set(params) == {'path', 'row_count', 'member_count'}
+    assert params['member_count'] == 5
+    assert os.path.isfile(params['path'])
+
+    run_jobs(app)
+    _, status, result = job_of(app, job_id)
+    assert status == 'succeeded'
+    assert result['success_count'] == 3
+    assert result['error_count'] == 2
+    assert result['errors'] == ['第5行: 用户 张三 重复', '第6行: 用户名过长']
+    assert result['elapsed_ms'] > 0
+    assert not os.path.exists(params['path'])
+    with app.app_context():
+        ungrouped_id = db.session.query(Group.id).filter_by(is_ungrouped=True).scalar()
+        imported = {name for (name,) in db.session.query(User.username).join(GroupMember)
+                    .filter(GroupMember.group_id == ungrouped_id)}
+        assert imported == {'张三', '李四', '王五'}
+
+
+def test_import_resumes_from_checkpoint(app, admin_client, monkeypatch):
+    monkeypatch.setattr(application, 'IMPORT_BATCH_SIZE', 2)
+    body = '\n'.join(f'学生{i}' for i in range(5)) + '\n学生0\n'
+    response = admin_client.post('/api/members/import', data=body.encode('utf-8'),
+                                 content_type='text/plain; charset=utf-8')
+    job_id = response.get_json()['job_id']
+
+    # 模拟上次执行已提交第一批后中断
+    with shard_context(app, None):
+        ungrouped_id = db.session.query(Group.id).filter_by(is_ungrouped=True).scalar()
+        for name in ('学生0', '学生1'):
+            user = User(username=name, password_hash=application.PENDING_PASSWORD_HASH)
+            db.session.add(user)
+            db.session.flush()
+            db.session.add(GroupMember(user_id=user.id, group_id=ungrouped_id))
+        job = db.session.get(Job, job_id)
+        job.done = 2
+        job.result = json.dumps({'success_count': 2, 'error_count': 0, 'errors': [], 'elapsed_ms': 1500.0})
+        db.session.commit()
+
+    run_jobs(app)
+    _, status, result = job_of(app, job_id)
+    assert status == 'succeeded'
+    assert result['success_count'] == 5
+    # 断点之前导入的姓名仍被识别为重复
+    assert result['errors'] == ['第6行: 用户 学生0 重复']
+    # 耗时累加上次执行的部分
+    assert result['elapsed_ms'] > 1500
+
+
+def test_empty_import_is_rejected_without_leaving_files(app, admin_client):
+    response = admin_client.post('/api/members/import', data=b'', content_type='text/plain')
+    assert response.status_code == 400
+    assert os.listdir(application.import_spool_dir(app)) == []
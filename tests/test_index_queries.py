@@ -0,0 +1,46 @@
+"""首页的查询次数不随成员人数增长（防止 N+1 查询回归）"""
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from app import Submission, Task, db
+from conftest import seed_members
+
+
+@contextmanager
+def count_statements(engine):
+    counter = [0]
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        counter[0] += 1
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield counter
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def index_statements(app, member_count):
+    """生成 member_count 名成员（分在 12 个小组中，一半完成了最新作业），返回首次请求首页执行的语句数"""
+    members = seed_members(app, member_count)
+    with app.app_context():
+        task = Task(title='第一次作业', content='<p>内容</p>')
+        db.session.add(task)
+        db.session.flush()
+        db.session.add_all(Submission(task_id=task.id, member_id=member_id, status=True)
+                           for member_id, _ in members[::2])
+        db.session.commit()
+        engine = db.engine
+
+    client = app.test_client()
+    with count_statements(engine) as counter:
+        response = client.get('/')
+    assert response.status_code == 200
+    assert members[-1][1] in response.get_data(as_text=True)
+    return counter[0]
+
+
+def test_index_query_count_is_constant(make_app):
+    counts = [index_statements(make_app(), member_count) for member_count in (12, 60, 240)]
+    assert counts[0] == counts[1] == counts[2], counts
@@ -0,0 +1,31 @@
+"""登录"""
+from app import PENDING_PASSWORD_HASH, User, db
+from conftest import login
+
+
+def add_pending_user(app, username):
+    """与导入名单相同：初始密码为用户名，首次登录时才生成哈希"""
+    with app.app_context():
+        db.session.add(User(username=username, password_hash=PENDING_PASSWORD_HASH))
+        db.session.commit()
+
+
+def test_first_login_with_chinese_username(app):
+    add_pending_user(app, '张三')
+    client = app.test_client()
+    response = login(client, '张三', '张三')
+    assert response.status_code == 302
+    with app.app_context():
+        assert User.query.filter_by(username='张三').one().password_hash != PENDING_PASSWORD_HASH
+
+    # 之后按正常的密码哈希校验
+    assert login(app.test_client(), '张三', '张三').status_code == 302
+
+
+def test_wrong_non_ascii_password_is_rejected(app):
+    add_pending_user(app, '李四')
+    response = login(app.test_client(), '李四', '王五')
+    assert response.status_code == 200
+    assert '用户名或密码错误' in response.get_data(as_text=True)
+    with app.app_context():
+        assert User.query.filter_by(username='李四').one().password_hash == PENDING_PASSWORD_HASH
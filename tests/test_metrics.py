@@ -0,0 +1,23 @@
+"""/metrics 的访问控制"""
+import pytest
+
+
+@pytest.fixture
+def app(make_app, tmp_path):
+    return make_app(METRICS_ENABLED=True, METRICS_DIR=str(tmp_path / 'metrics'), METRICS_TOKEN='s3cret')
+
+
+def test_bearer_token(app):
+    client = app.test_client()
+    assert client.get('/metrics', headers={'Authorization': 'Bearer s3cret'}).status_code == 200
+    assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    assert client.get('/metrics').status_code == 403
+
+
+@pytest.mark.parametrize('value', ['Bearer 令牌', 'Bearer s3crét'])
+def test_non_ascii_authorization_header_is_rejected(app, value):
+    assert app.test_client().get('/metrics', headers={'Authorization': value}).status_code == 401
+
+
+def test_admin_session(app, admin_client):
+    assert admin_client.get('/metrics').status_code == 200
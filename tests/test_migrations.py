@@ -0,0 +1,83 @@
+"""启动时的数据库迁移"""
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+import migrations
+from app import Submission, Task, db
+from conftest import seed_members
+
+
+def rerun(app, version):
+    """撤销迁移记录后重新执行该版本，模拟从旧版本升级"""
+    with app.app_context():
+        with db.engine.begin() as connection:
+            connection.execute(text('DELETE FROM schema_migration WHERE version = :v'), {'v': version})
+        return migrations.upgrade(db.engine, log=lambda message: None)
+
+
+def test_status_flags_become_submissions_of_latest_task(app):
+    members = seed_members(app, 6)
+    with app.app_context():
+        older = Task(title='上次作业', content='<p>旧</p>', created_at=datetime.utcnow() - timedelta(days=7))
+        latest = Task(title='本次作业', content='<p>新</p>', created_at=datetime.utcnow())
+        db.session.add_all([older, latest])
+        db.session.commit()
+        done = [member_id for member_id, _ in members[:4]]
+        db.session.execute(text('UPDATE group_member SET status = 1 WHERE id IN (%s)' % ','.join(map(str, done))))
+        db.session.commit()
+        latest_id = latest.id
+
+    assert rerun(app, 7) == [7]
+    with app.app_context():
+        rows = db.session.query(Submission.task_id, Submission.member_id, Submission.status).all()
+        assert sorted(rows) == [(latest_id, member_id, True) for member_id in done]
+        assert all(row.updated_at is not None for row in Submission.query)
+
+
+def test_status_flags_ignored_once_submissions_exist(app):
+    members = seed_members(app, 3)
+    with app.app_context():
+        task = Task(title='作业', content='<p>内容</p>')
+        db.session.add(task)
+        db.session.flush()
+        db.session.add(Submission(task_id=task.id, member_id=members[0][0], status=False))
+        db.session.execute(text('UPDATE group_member SET status = 1'))
+        db.session.commit()
+
+    rerun(app, 7)
+    with app.app_context():
+        assert [(s.member_id, s.status) for s in Submission.query] == [(members[0][0], False)]
+
+
+def test_duplicate_members_are_logged_and_history_merged(app, caplog):
+    members = seed_members(app, 2)
+    with app.app_context():
+        task = Task(title='作业', content='<p>内容</p>')
+        other = Task(title='另一次作业', content='<p>内容</p>')
+        db.session.add_all([task, other])
+        db.session.commit()
+        db.session.execute(text('DROP INDEX ix_group_member_user_id'))
+        user_id = db.session.execute(text('SELECT user_id FROM group_member WHERE id = :id'),
+                                     {'id': members[0][0]}).scalar()
+        # 同一用户后来又被加入另一个小组
+        duplicate_id = db.session.execute(text('INSERT INTO group_member (group_id, user_id, status) '
+                                               'VALUES (5, :u, 0)'), {'u': user_id}).lastrowid
+        db.session.add_all([Submission(task_id=task.id, member_id=members[0][0], status=True),
+                            Submission(task_id=other.id, member_id=members[0][0], status=True),
+                            Submission(task_id=other.id, member_id=duplicate_id, status=False)])
+        db.session.commit()
+        task_id, other_id = task.id, other.id
+
+    with caplog.at_level('WARNING', logger='migrations'):
+        rerun(app, 2)
+    assert '删除了 1 条重复的组员记录' in caplog.text
+    assert f'用户{user_id}(记录{members[0][0]}, 小组' in caplog.text
+
+    with app.app_context():
+        assert [row[0] for row in db.session.execute(
+            text('SELECT id FROM group_member WHERE user_id = :u'), {'u': user_id})] == [duplicate_id]
+        history = {(s.task_id, s.status) for s in Submission.query.filter_by(member_id=duplicate_id)}
+        # 保留记录原有的完成情况优先，其余并入
+        assert history == {(task_id, True), (other_id, False)}
+        assert Submission.query.count() == 2
@@ -0,0 +1,18 @@
+"""发布和编辑作业的接口返回作业列表行，管理面板据此直接更新页面"""
+from conftest import seed_members
+
+
+def test_created_and_updated_task_rows(app, admin_client):
+    seed_members(app, 5)
+    response = admin_client.post('/api/tasks', json={'title': '第一次作业', 'content': '<p>内容</p>',
+                                                      'deadline': '2026-10-20T18:00'})
+    task = response.get_json()['task']
+    assert task['title'] == '第一次作业'
+    assert task['deadline'] == '2026-10-20T18:00'
+    assert (task['completed_count'], task['total_count']) == (0, 5)
+    assert admin_client.get('/api/groups').get_json()['task_id'] == task['id']
+
+    response = admin_client.put(f"/api/tasks/{task['id']}", json={'title': '改过的作业', 'content': '<p>新内容</p>'})
+    row = response.get_json()['task']
+    assert (row['id'], row['title'], row['deadline']) == (task['id'], '改过的作业', None)
+    assert admin_client.get('/api/tasks').get_json()['tasks'] == [row]
@@ -0,0 +1,49 @@
+"""图片上传"""
+import hashlib
+import io
+import time
+
+import pytest
+
+from app import Task, db
+
+Image = pytest.importorskip('PIL.Image')
+
+
+@pytest.fixture
+def app(make_app, tmp_path):
+    return make_app(UPLOAD_FOLDER=str(tmp_path / 'uploads'))
+
+
+def png_bytes(width=1200, height=800):
+    buffer = io.BytesIO()
+    Image.new('RGB', (width, height), (200, 80, 40)).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def test_upload_returns_original_and_rerenders_tasks_when_variants_are_ready(app, admin_client):
+    data = png_bytes()
+    name = f'{hashlib.sha256(data).hexdigest()}.png'
+    # 作业先于缩略图保存：保存时只能引用原图
+    response = admin_client.post('/api/tasks', json={
+        'title': '看图', 'content': f'<p><img src="/static/uploads/{name}"></p>'})
+    assert response.status_code == 200
+
+    response = admin_client.post('/upload/image', data={'file': (io.BytesIO(data), 'photo.png')})
+    assert response.status_code == 200
+    assert response.get_json()['location'].endswith(f'/static/uploads/{name}')
+
+    deadline = time.monotonic() + 10
+    while True:
+        with app.app_context():
+            content_html = db.session.query(Task.content_html).scalar()
+        if 'srcset' in content_html or time.monotonic() > deadline:
+            break
+        time.sleep(0.05)
+    assert f'{name[:-4]}-960.webp 960w' in content_html
+
+
+def test_invalid_image_is_rejected(app, admin_client, tmp_path):
+    response = admin_client.post('/upload/image', data={'file': (io.BytesIO(b'not an image'), 'photo.png')})
+    assert response.status_code == 400
+    assert list((tmp_path / 'uploads').iterdir()) == []
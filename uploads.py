@@ -0,0 +1,189 @@
+"""作业图片上传
+
+上传的文件边读边写入临时文件并计算 SHA-256，以内容哈希命名（<哈希>.<扩展名>），
+同一张图片重复上传只保存一份。保存后在后台线程池中生成若干宽度的 WebP 缩略图
+（<哈希>-<宽度>.webp），页面展示时用 srcset 让浏览器按屏幕宽度选择合适的版本，
+学生不必下载手机拍摄的原图。
+
+生成缩略图依赖 Pillow；未安装时只保存原图，页面直接显示原图。
+"""
+import hashlib
+import os
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # 未安装 Pillow 时不生成缩略图
+    Image = None
+
+CHUNK_SIZE = 64 * 1024
+
+# 内容哈希命名的文件：原图 <哈希>.<扩展名>，缩略图 <哈希>-<宽度>.webp
+_HASHED_NAME = re.compile(r'^([0-9a-f]{64})(?:-(\d+))?\.([a-z0-9]+)$')
+# 作业内容中引用的上传文件名
+_UPLOAD_REFERENCE = re.compile(r'/uploads/([A-Za-z0-9_.\-]+)')
+# 作业内容中指向上传图片的 <img> 标签
+_IMG_TAG = re.compile(r'<img\b[^>]*>', re.IGNORECASE)
+_IMG_SRC = re.compile(r'\ssrc=(["\'])([^"\']*/uploads/)([0-9a-f]{64})(?:-\d+)?\.[a-z0-9]+\1', re.IGNORECASE)
+
+
+class ImageStore:
+    def __init__(self, root, widths=(480, 960, 1600), quality=80, workers=2):
+        self.root = root
+        self.widths = tuple(sorted(widths))
+        self.quality = quality
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='image-variants')
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def path(self, name):
+        return os.path.join(self.root, name)
+
+    def save(self, stream, ext):
+        """把上传内容分块写入磁盘，返回 (文件名, 是否已存在)"""
+        os.makedirs(self.root, exist_ok=True)
+        digest = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, prefix='.upload-')
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+                    digest.update(chunk)
+                    tmp.write(chunk)
+            name = f'{digest.hexdigest()}.{ext}'
+            if os.path.exists(self.path(name)):
+                os.unlink(tmp_path)
+                # 更新修改时间，避免刚被重新引用的旧文件被当作孤儿清理
+                os.utime(self.path(name))
+                return name, True
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, self.path(name))
+            return name, False
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def verify(self, name):
+        """只读取文件结构检查是否为有效图片，不解码像素；无效时抛出 ValueError"""
+        if Image is None:
+            return
+        try:
+            with Image.open(self.path(name)) as image:
+                image.verify()
+        except (OSError, SyntaxError, Image.DecompressionBombError) as e:
+            raise ValueError(f'不是有效的图片: {e}')
+
+    def generate_variants(self, name):
+        """在线程池中生成缩略图，返回 Future，结果为已生成的宽度列表
+
+        同一文件正在生成时返回同一个 Future，不重复计算。文件不是有效图片时 Future 抛出 ValueError。
+        """
+        with self._lock:
+            future = self._pending.get(name)
+            if future is None:
+                future = self._executor.submit(self._make_variants, name)
+                self._pending[name] = future
+                future.add_done_callback(lambda _: self._forget(name))
+            return future
+
+    def _forget(self, name):
+        with self._lock:
+            self._pending.pop(name, None)
+
+    def _make_variants(self, name):
+        if Image is None:
+            return []
+        digest = name.split('.', 1)[0]
+        try:
+            image = Image.open(self.path(name))
+            image.load()
+        except (OSError, Image.DecompressionBombError) as e:
+            raise ValueError(f'不是有效的图片: {e}')
+        with image:
+            image = ImageOps.exif_transpose(image)
+            if image.mode not in ('RGB', 'RGBA'):
+                image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+            # 比原图小的宽度各生成一份；原图比最小宽度还小时按原尺寸生成一份
+            widths = [w for w in self.widths if w < image.width] or [image.width]
+            for width in widths:
+                target = self.path(f'{digest}-{width}.webp')
+                if os.path.exists(target):
+                    continue
+                height = max(1, round(image.height * width / image.width))
+                variant = image.resize((width, height), Image.LANCZOS) if width != image.width else image
+                fd, tmp_path = tempfile.mkstemp(dir=self.root, prefix='.variant-')
+                with os.fdopen(fd, 'wb') as tmp:
+                    variant.save(tmp, 'WEBP', quality=self.quality, method=4)
+                os.chmod(tmp_path, 0o644)
+                os.replace(tmp_path, target)
+        return widths
+
+    def variants(self, digest):
+        """已生成的缩略图宽度，从小到大"""
+        prefix = f'{digest}-'
+        try:
+            names = os.listdir(self.root)
+        except FileNotFoundError:
+            return []
+        widths = []
+        for name in names:
+            if name.startswith(prefix) and name.endswith('.webp'):
+                width = name[len(prefix):-len('.webp')]
+                if width.isdigit():
+                    widths.append(int(width))
+        return sorted(widths)
+
+    def responsive(self, html):
+        """为作业内容中的上传图片加上 srcset，src 指向最大的缩略图"""
+        def rewrite(match):
+            tag = match.group(0)
+            src = _IMG_SRC.search(tag)
+            if src is None or 'srcset=' in tag.lower():
+                return tag
+            quote, prefix, digest = src.group(1), src.group(2), src.group(3)
+            widths = self.variants(digest)
+            if not widths:
+                return tag
+            srcset = ', '.join(f'{prefix}{digest}-{w}.webp {w}w' for w in widths)
+            attrs = (f' src={quote}{prefix}{digest}-{widths[-1]}.webp{quote}'
+                     f' srcset="{srcset}" sizes="(max-width: {widths[-1]}px) 100vw, {widths[-1]}px"')
+            if 'loading=' not in tag.lower():
+                attrs += ' loading="lazy" decoding="async"'
+            return tag[:src.start()] + attrs + tag[src.end():]
+        return _IMG_TAG.sub(rewrite, html)
+
+    def collect_orphans(self, contents, min_age=86400, dry_run=False):
+        """删除没有被任何作业内容引用的上传文件，返回删除的文件名列表
+
+        contents 为所有作业内容的可迭代对象。缩略图随原图一起保留或删除；
+        min_age 秒内上传的文件不删除，以免误删正在编辑、尚未发布的作业中的图片。
+        """
+        referenced = set()
+        for content in contents:
+            for name in _UPLOAD_REFERENCE.findall(content or ''):
+                match = _HASHED_NAME.match(name)
+                referenced.add(match.group(1) if match else name)
+
+        removed = []
+        cutoff = time.time() - min_age
+        try:
+            names = os.listdir(self.root)
+        except FileNotFoundError:
+            return removed
+        for name in names:
+            # 跳过 .gitkeep 等隐藏文件，但清理中断上传残留的临时文件
+            if name.startswith('.') and not name.startswith(('.upload-', '.variant-')):
+                continue
+            path = self.path(name)
+            match = _HASHED_NAME.match(name)
+            key = match.group(1) if match else name
+            if key in referenced or os.path.getmtime(path) > cutoff:
+                continue
+            if not dry_run:
+                os.unlink(path)
+            removed.append(name)
+        return removed
@@ -0,0 +1,7 @@
+"""生产环境的 WSGI 入口
+
+gunicorn -c gunicorn.conf.py wsgi:app
+"""
+from app import create_app
+
+app = create_app()